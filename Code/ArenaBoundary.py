@@ -0,0 +1,240 @@
+"""
+ArenaBoundary.py
+
+Utility to find the arena boundary (tape or wall edges) automatically and
+derive the arena mask from it.
+
+A few frames are averaged so that moving robots and sensor noise fade out.
+The largest closed outline in the edges of that average is taken to be the
+arena and is simplified to a polygon. The polygon (plus a small margin) is
+saved to Settings.json as ARENA_MASK_POLYGON and Camera.py then only processes
+the bounding rectangle of the polygon, ignoring anything outside it.
+
+This should be done before ArenaManager.py runs and again whenever the
+camera is moved. Keys:
+
+    r   retry the detection with fresh frames
+    s   save the polygon to Settings.json
+    q   quit without saving
+
+ArenaProcessing.py calls checkDrift() on startup. That only samples the
+edges along the saved outline so it is cheap enough to run every time.
+"""
+
+import cv2
+import numpy as np
+from Params import *
+
+NUM_FRAMES=10           # frames averaged to remove robots/noise
+MIN_ARENA_FRACTION=0.1  # the arena must fill at least this much of the frame
+SAMPLE_STEP=5           # pixels between samples when scoring the outline
+EDGE_TOLERANCE=3        # pixels an outline may be off an edge and still score
+
+
+def averageFrames(frames):
+    '''
+    Average a list of BGR frames into a single grayscale image
+
+    :param frames: list of BGR images, all the same size
+    :return: uint8 grayscale image
+    '''
+    acc=None
+    for frame in frames:
+        gray=cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY).astype(np.float32)
+        if acc is None:
+            acc=gray
+        else:
+            acc+=gray
+    return (acc/len(frames)).astype(np.uint8)
+
+
+def findEdges(gray):
+    '''
+    Canny edges of a grayscale image using the CameraSetup.py settings
+
+    :param gray: uint8 grayscale image
+    :return: edges image
+    '''
+    blur=getParam(PARAM_BLUR_SIZE)
+    if blur>1:
+        gray=cv2.GaussianBlur(gray,(blur|1,blur|1),0)
+    return cv2.Canny(gray,getParam(PARAM_CANNY_MIN),getParam(PARAM_CANNY_MAX))
+
+
+def detectBoundary(frames):
+    '''
+    Locate the arena outline in a few camera frames
+
+    :param frames: list of BGR images
+    :return: numpy int32 array of polygon vertices [[x,y]...] or None if no arena was found
+    '''
+    gray=averageFrames(frames)
+    h,w=gray.shape[:2]
+
+    # close small gaps in the tape so the outline is one contour
+    edges=cv2.dilate(findEdges(gray),np.ones((5,5),np.uint8))
+    contours,hierarchy=cv2.findContours(edges,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours)==0: return None
+
+    arena=max(contours,key=cv2.contourArea)
+    if cv2.contourArea(arena)<MIN_ARENA_FRACTION*w*h:
+        print("ArenaBoundary: largest outline is too small to be the arena")
+        return None
+
+    hull=cv2.convexHull(arena)
+    epsilon=getParam(PARAM_EPSILON)*cv2.arcLength(hull,True)
+    polygon=cv2.approxPolyDP(hull,epsilon,True)
+    return polygon.reshape(-1,2).astype(np.int32)
+
+
+def growPolygon(polygon,margin,size):
+    '''
+    Move each vertex away from the polygon centre so robots on the
+    boundary are not clipped by the mask
+
+    :param polygon: array of vertices [[x,y]...]
+    :param margin: int pixels to grow by
+    :param size: tuple (w,h) frame size, vertices are clipped to it
+    :return: numpy int32 array of vertices
+    '''
+    pts=np.asarray(polygon,dtype=np.float32)
+    centre=pts.mean(axis=0)
+    offsets=pts-centre
+    lengths=np.linalg.norm(offsets,axis=1,keepdims=True)
+    lengths[lengths==0]=1
+    pts=pts+offsets/lengths*margin
+    w,h=size
+    pts[:,0]=np.clip(pts[:,0],0,w-1)
+    pts[:,1]=np.clip(pts[:,1],0,h-1)
+    return np.round(pts).astype(np.int32)
+
+
+def outlinePoints(polygon,step=SAMPLE_STEP):
+    '''
+    Evenly spaced points along the closed polygon outline
+
+    :param polygon: array of vertices [[x,y]...]
+    :param step: pixels between points
+    :return: numpy int32 array of points [[x,y]...]
+    '''
+    pts=np.asarray(polygon,dtype=np.float32)
+    samples=[]
+    for p0,p1 in zip(pts,np.roll(pts,-1,axis=0)):
+        n=max(int(np.linalg.norm(p1-p0)/step),1)
+        t=np.arange(n,dtype=np.float32)[:,None]/n
+        samples.append(p0+(p1-p0)*t)
+    return np.round(np.concatenate(samples)).astype(np.int32)
+
+
+def boundaryScore(frame,polygon):
+    '''
+    Fraction of the polygon outline which lies on an edge in the frame
+
+    Only the pixels along the outline are examined which makes this
+    cheap enough to run on startup.
+
+    :param frame: BGR image
+    :param polygon: arena outline as detected (before growPolygon())
+    :return: float 0.0 to 1.0
+    '''
+    gray=cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY)
+    h,w=gray.shape[:2]
+    pts=outlinePoints(polygon)
+
+    # only the neighbourhood of the outline needs edge detecting
+    x,y,bw,bh=cv2.boundingRect(pts)
+    pad=EDGE_TOLERANCE+2
+    x1,y1=max(x-pad,0),max(y-pad,0)
+    x2,y2=min(x+bw+pad,w),min(y+bh+pad,h)
+    edges=cv2.dilate(findEdges(gray[y1:y2,x1:x2]),np.ones((2*EDGE_TOLERANCE+1,2*EDGE_TOLERANCE+1),np.uint8))
+
+    hits=edges[pts[:,1]-y1,pts[:,0]-x1]
+    return float(np.count_nonzero(hits))/len(pts)
+
+
+def checkDrift(frame):
+    '''
+    Check the saved arena polygon still matches what the camera sees
+
+    :param frame: BGR image from the camera
+    :return: (score, drifted) - drifted is True if the camera appears to have moved.
+             (None, False) if no polygon has been saved
+    '''
+    polygon=getParam(PARAM_ARENA_MASK_POLYGON)
+    baseline=getParam(PARAM_ARENA_BOUNDARY_SCORE)
+    if polygon is None or not baseline: return None,False
+
+    h,w=frame.shape[:2]
+    outline=growPolygon(polygon,-getParam(PARAM_ARENA_BOUNDARY_MARGIN),(w,h))
+    score=boundaryScore(frame,outline)
+    return score,score<baseline*getParam(PARAM_ARENA_DRIFT_TOLERANCE)
+
+
+def saveBoundary(polygon,score,fname=DataFile):
+    '''
+    Store the grown polygon and its bounding size in the Params and save them
+
+    :param polygon: detected arena outline
+    :param score: boundaryScore() of the outline at calibration time
+    :param fname: settings file to write
+    :return: Nothing
+    '''
+    size=(Params[PARAM_FRAME_WIDTH],Params[PARAM_FRAME_HEIGHT])
+    grown=growPolygon(polygon,getParam(PARAM_ARENA_BOUNDARY_MARGIN),size)
+    x,y,w,h=cv2.boundingRect(grown)
+
+    Params[PARAM_ARENA_MASK_POLYGON]=grown.tolist()
+    Params[PARAM_ARENA_MASK_SIZE]=(w,h)
+    Params[PARAM_ARENA_BOUNDARY_SCORE]=round(score,3)
+    saveParams(fname)
+
+
+if __name__ == "__main__":
+
+    readParams()
+
+    cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH,Params[PARAM_FRAME_WIDTH])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT,Params[PARAM_FRAME_HEIGHT])
+
+    def grabFrames(n):
+        frames=[]
+        while len(frames)<n:
+            ret,frame=cap.read()
+            if ret: frames.append(frame)
+        return frames
+
+    score,drifted=checkDrift(grabFrames(1)[0])
+    if score is not None:
+        print("Saved boundary score {0:.2f} (calibrated {1:.2f}) {2}".format(
+            score,getParam(PARAM_ARENA_BOUNDARY_SCORE),"- camera has moved" if drifted else ""))
+
+    print("Clear the arena of people then press 'r' to detect, 's' to save or 'q' to quit")
+
+    frames=grabFrames(NUM_FRAMES)
+    polygon=detectBoundary(frames)
+
+    while True:
+        ret,scene=cap.read()
+        if scene is not None:
+            if polygon is not None:
+                cv2.polylines(scene,[polygon],True,(0,255,255),2)
+            h,w=scene.shape[:2]
+            cv2.imshow("arena boundary",cv2.resize(scene,(640,int(h*640/w))))
+
+        key=cv2.waitKey(1) & 0xFF
+
+        if key==ord('q'):
+            break
+        elif key==ord('r'):
+            frames=grabFrames(NUM_FRAMES)
+            polygon=detectBoundary(frames)
+            if polygon is None: print("No arena boundary found")
+        elif key==ord('s') and polygon is not None:
+            score=boundaryScore(frames[-1],polygon)
+            print("Boundary",polygon.tolist(),"score {0:.2f}".format(score))
+            saveBoundary(polygon,score)
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
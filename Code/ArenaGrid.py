@@ -0,0 +1,67 @@
+"""
+ArenaGrid.py
+
+The one way the arena is divided into square cells, used by the path
+planner's occupancy grid (PathPlanner.py) and the zone raster (Zones.py) so
+a point, or a polygon's edge, falls in the same cell in both.
+
+Cell (col,row), cell mm across, covers col*cell<=x<(col+1)*cell and
+row*cell<=y<(row+1)*cell, its centre is at ((col+0.5)*cell,(row+0.5)*cell).
+A raster of cells is an image, one pixel per cell, whose pixel (0,0) is the
+cell origin. cv2.fillPoly() treats a pixel as the point at its centre, so a
+polygon's vertices are moved half a cell before being drawn.
+
+cellSize() makes the cells bigger when a fine grid of a large area, e.g.
+a 100m pitch in 10mm cells, would take too much memory.
+
+typical usage:
+    cell=cellSize((100000,70000),10,MAX_CELLS)
+    col,row=cellOf(x,y,cell)
+    fillPolygon(raster,[(0,0),(300,0),(300,1400),(0,1400)],cell)
+"""
+
+import math
+import cv2
+import numpy as np
+
+MAX_CELLS=4000000   # e.g. 2000x2000 cells
+
+
+def cellOf(x,y,cell):
+    '''
+    :param x: mm
+    :param y: mm
+    :param cell: cell size mm
+    :return: (col,row) of the cell containing the point
+    '''
+    return (int(x//cell),int(y//cell))
+
+
+def cellSize(extent,cell,maxCells=MAX_CELLS):
+    '''
+    The cell size to use for an area, the one asked for unless that would be too many cells
+
+    :param extent: (W,H) mm of the area
+    :param cell: int preferred cell size mm
+    :param maxCells: int most cells allowed
+    :return: int cell size mm
+    '''
+    W,H=extent
+    while math.ceil(W/cell)*math.ceil(H/cell)>maxCells:
+        cell=max(cell+1,int(math.ceil(cell*1.1)))
+    return cell
+
+
+def fillPolygon(raster,polygon,cell,origin=(0,0),value=1):
+    '''
+    Set the cells of a raster whose centres are inside a polygon
+
+    :param raster: numpy array, one element per cell
+    :param polygon: list of (x,y) mm
+    :param cell: cell size mm
+    :param origin: (col,row) of the cell at raster[0,0]
+    :param value: what to set the cells to
+    :return: Nothing
+    '''
+    points=np.array(polygon,np.float64)/cell-np.array(origin,np.float64)-0.5
+    cv2.fillPoly(raster,[np.int32(np.round(points))],value)
@@ -2,21 +2,73 @@
 #from pyimagesearch.motion_detection import SingleMotionDetector
 import MqttManager
 import json
-from imutils.video import VideoStream
 from flask import Response
 from flask import Flask
 from flask import render_template
+from flask import abort
+from flask import request
 import threading
-import cv2
-from ArenaProcessing import ArenaProcessor
-from Params import *
+import atexit
+import os
+import re
+from ArenaWorker import ArenaWorker
+from Stats import CpuMeter
+from StreamHub import StreamHub
+from H264Stream import H264Stream
+from ReplayRing import ReplayRing
+from PositionPublisher import PositionPublisher,PUBLISH_RATE,POSE_EPSILON
+from RobotSnapshot import RobotStore
+from SpatialIndex import GridIndex,Obstacles
+from PathPlanner import PathPlanner,ARENA_SIZE
+from Zones import Zones
 import time
 
+# The arenas managed by this ArenaManager.
+# Each arena has its own camera, settings profile (see Params.py), detection
+# process and MQTT topic prefix. The first arena is also streamed at /video_feed.
+#
+# name:     used for the /video_feed/<name> route and the local display window
+# camera:   camera index or video file (ignored if the profile has CAMERAS, see MultiCamera.py)
+# settings: settings profile file
+# topic:    MQTT topic prefix
+# display:  True to show the arena on the local screen
+# log:      optional file every detection is appended to, see DetectionLog.py
+# publishRate: optional robot positions published per second, see PositionPublisher.py
+# poseEpsilon: optional (mm,degrees) a robot must move or turn before its pose topic is published
+# binary:   optional True to also publish the positions on location/bin, see PosePacking.py
+# obstacles: optional fixed obstacles, a list of polygons [(x,y),...] in mm, see SpatialIndex.py and PathPlanner.py
+# arenaSize: optional (W,H) mm for path planning, default (2000,1400)
+# zones:    optional {name:[(x,y),...],...} polygons in mm, enter/exit events are published on events, see Zones.py
+# recordings: optional directory the MQTT record command writes its videos to, default RECORDINGS_DIR
+ARENAS=[
+    {"name":"arena","camera":0,"settings":"Settings.json","topic":"pixelbot/","display":True,"log":"arena.dlog"},
+    #{"name":"arena2","camera":1,"settings":"Settings2.json","topic":"pixelbot2/","display":False},
+]
+
+WORKER_TIMEOUT=5    # seconds without a frame before checking the worker is alive
+STREAM_WIDTH=640    # default stream width, see streamOptions()
+MAX_STREAM_FPS=30
+REPORT_INTERVAL=10  # seconds between printing the cpu/fps report
+NEAR_RANGE=300      # mm, default range of the near command
+MAX_NEAREST=16      # most robots the nearest command returns
+RECORDINGS_DIR="recordings"     # the record command's files are written here, never anywhere else
+VIDEO_EXTENSIONS=(".avi",".mp4",".mkv")
+MAX_RECORD_FPS=60
+
+def recordingPath(directory,fname):
+    '''
+    Where the record command may write a video, it comes from anyone on the broker
 
-frameSize=(Params[PARAM_FRAME_WIDTH],Params[PARAM_FRAME_HEIGHT])
-AP= ArenaProcessor(frameSize)
-
-Robots={} # populated during update
+    :param directory: the arena's recordings directory
+    :param fname: file name from the command, a plain name with a video extension e.g. "match1.avi"
+    :return: path in directory or None if fname isn't allowed
+    '''
+    if not isinstance(fname,str) or not re.fullmatch(r"[A-Za-z0-9_\-][A-Za-z0-9_.\-]{0,99}",fname):
+        return None     # no directories, "..", hidden files or odd characters
+    if os.path.splitext(fname)[1].lower() not in VIDEO_EXTENSIONS:
+        return None
+    os.makedirs(directory,exist_ok=True)
+    return os.path.join(os.path.abspath(directory),fname)
 
 class StringDefs:
     ' used to make changes /capitalisation easier'
@@ -24,100 +76,331 @@ class StringDefs:
     mainTopic="pixelbot/"
     arenaTopic=mainTopic+"arena"
     location="location"
+    pose="pose"
     loc="loc"
     botId="botId"
     heading="heading"
     color="color"
     setColor="setColor"
     enableCrosshairs="enableCrosshairs"
+    record="record"
+    raw="raw"
+    fps="fps"
+    file="file"
     state="state"
     on="on"
     off="off"
-    replyTo="replyTo"   # sub topic
+    replyTo="replyTo"   # topic a query asks to be answered on, see replyTopic()
     getAllRobots="getAllRobots"
     robots="robots"
+    near="near"
+    nearest="nearest"
+    range="range"
+    k="k"
+    obstacles="obstacles"
+    path="path"
+    events="events"
+    seq="seq"
+    time="time"
     x="x"
     y="y"
 
-Strings=StringDefs()
-
-def on_message_callback(mqttc,obj,msg):
-    """
-    The callback used by the MQTT manager when messages are heard
-    NOTE: The MQTT manager listens for everything
-
-    :param mqttc: mqtt client instance
-    :param obj:
-    :param msg: mqtt message
-    :return:
-    """
-    global MQTT,AP,Robots
-    # decode the msg payload
-    msgDic = json.loads(msg.payload)
-
-
-    # todo make text constants
-
-    if msg.topic!=Strings.arenaTopic: return  # not for me
-    if Strings.cmd not in msgDic:         return  # don't know what to do
-
-    # commands aimed at specific bots
-    if msgDic[Strings.cmd]==Strings.loc:
-        # request for the location of 1 bot
-        if Strings.botId not in msgDic:   return   # give me a clue!
-        botId=msgDic[Strings.botId]
-        if not botId in Robots:     return  # don't know him
-
-        reply = {
-            Strings.loc:Robots[botId]
-          }
-        payload = json.dumps(reply)
-        MQTT.publish(Strings.mainTopic + str(botId), payload)
-        return
-
-    if msgDic[Strings.cmd]==Strings.setColor:
-        if Strings.BotId not in msgDic:   return
-        botId = msgDic[Strings.botId]
-        if not botId in Robots:     return  # don't know him
-        if Strings.color not in msgDic:   return
-        AP.setBotColor(botId,mgsDic[Strings.color])
-
-
-    #-----------------------------------------
-    elif msgDic[Strings.cmd]==Strings.enableCroshairs:
-        if Strings.state in msgDic:
-            state=msgDic[Strings.state]
-            if state==Strings.on:
-                AP.enableCrosshairDisplay(True)
-            else:
-                AP.enableCrosshairDisplay(False)
+    def __init__(self,mainTopic=None):
+        '''
+        :param mainTopic: topic prefix for an arena e.g. "pixelbot/"
+        '''
+        if mainTopic is not None:
+            self.mainTopic=mainTopic
+            self.arenaTopic=mainTopic+"arena"
+
+class Arena:
+    '''
+    One arena - its detection worker process, the latest frame and robot
+    positions and the handling of its MQTT commands.
+    '''
+
+    def __init__(self,config):
+        '''
+        Starts the detection process. This is done before the MQTT connection
+        is made so the process isn't forked with the network thread running.
+
+        :param config: dict, one entry from ARENAS
+        '''
+        self.name=config["name"]
+        self.Strings=StringDefs(config["topic"])
+        self.MQTT=None
+        self.publisher=None
+        self.publishRate=config.get("publishRate",PUBLISH_RATE)
+        self.poseEpsilon=config.get("poseEpsilon",POSE_EPSILON)
+        self.binary=config.get("binary",False)
+        self.robots=RobotStore() # a new snapshot of the robots every frame
+        self.obstacles=Obstacles(config.get("obstacles"))
+        self.obstaclePolygons=config.get("obstacles")
+        self.arenaSize=config.get("arenaSize",ARENA_SIZE)
+        self.planner=None
+        self.zonePolygons=config.get("zones")
+        self.zones=None
+        self.recordings=config.get("recordings",RECORDINGS_DIR)
+
+        # the output frames are encoded once and shared by all the
+        # browsers/tabs viewing the stream
+        self.stream=StreamHub()
+        self.h264=H264Stream()  # low bandwidth alternative
+        self.replay=ReplayRing(self.stream)  # the last minute or so for the referees
+        self.workerStats={}    # detection fps and cpu use reported by the worker
+
+        self.worker=ArenaWorker(config)
+        self.worker.start()
+
+    def start(self,MQTT):
+        '''
+        start a thread that will collect the detection results
+
+        :param MQTT: MqttManager.MQTT instance used for publishing
+        :return: Nothing
+        '''
+        self.MQTT=MQTT
+        MQTT.addHandler(self.Strings.arenaTopic,self.on_message)
+        locationTopic=self.Strings.mainTopic+self.Strings.location
+        self.publisher=PositionPublisher(MQTT,locationTopic,self.publishRate,
+                                         self.Strings.mainTopic+"{0}/"+self.Strings.pose,self.poseEpsilon,
+                                         locationTopic+"/bin" if self.binary else None)
+        self.publisher.start()
+        self.planner=PathPlanner(MQTT,self.Strings.mainTopic+"{0}/"+self.Strings.path,
+                                 self.arenaSize,self.obstaclePolygons)
+        self.planner.start()
+        if self.zonePolygons:
+            self.zones=Zones(MQTT,self.Strings.mainTopic+self.Strings.events,self.zonePolygons)
+        t = threading.Thread(target=self.updateOutputFrame,name=self.name)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        if self.publisher is not None: self.publisher.stop()
+        if self.planner is not None: self.planner.stop()
+        self.worker.stop()
+
+    def on_message(self,msgDic):
+        """
+        Handle a command sent to this arena's arena topic
+
+        Called on one of MqttManager's worker threads
+
+        :param msgDic: decoded message payload
+        :return:
+        """
+        Strings=self.Strings
+
+        if Strings.cmd not in msgDic:         return  # don't know what to do
+
+        # commands aimed at specific bots
+        if msgDic[Strings.cmd]==Strings.loc:
+            # request for the location of 1 bot
+            if Strings.botId not in msgDic:   return   # give me a clue!
+            botId=msgDic[Strings.botId]
+            snapshot=self.robots.get()
+            if not botId in snapshot.robots:     return  # don't know him
+
+            payload=snapshot.reply((Strings.loc,botId),lambda s:json.dumps({
+                Strings.loc:s.robots[botId],
+                Strings.seq:s.seq,
+                Strings.time:round(s.captureTime,3)
+              }))
+            topic=self.replyTopic(msgDic,Strings.mainTopic + str(botId))
+            if topic is not None: self.MQTT.publishPayload(topic, payload)
             return
-    #-------------------------------------------
-    elif msgDic[Strings.cmd]==Strings.getAllRobots:
-        # which topic to publish to
-        if Strings.replyto not in msgDic: return
 
-        reply=  {
-            Strings.robots:Robots
-            }
+        if msgDic[Strings.cmd]==Strings.setColor:
+            if Strings.botId not in msgDic:   return
+            botId = msgDic[Strings.botId]
+            if not botId in self.robots.get().robots:     return  # don't know him
+            if Strings.color not in msgDic:   return
+            self.worker.command("setBotColor",botId,tuple(msgDic[Strings.color]))
+
+
+        #-----------------------------------------
+        elif msgDic[Strings.cmd]==Strings.enableCrosshairs:
+            if Strings.state in msgDic:
+                state=msgDic[Strings.state]
+                if state==Strings.on:
+                    self.worker.command("enableCrosshairDisplay",True)
+                else:
+                    self.worker.command("enableCrosshairDisplay",False)
+                return
+        #-------------------------------------------
+        elif msgDic[Strings.cmd]==Strings.record:
+            # e.g. {"cmd":"record","state":"on","raw":true,"fps":10,"file":"match1.avi"}
+            # written to the arena's recordings directory
+            if Strings.state not in msgDic: return
+            if msgDic[Strings.state]==Strings.on:
+                fname=recordingPath(self.recordings,msgDic.get(Strings.file,"output.avi"))
+                fps=msgDic.get(Strings.fps,10)
+                raw=msgDic.get(Strings.raw,False)
+                if fname is None or type(fps) not in (int,float) or not 1<=fps<=MAX_RECORD_FPS or type(raw) is not bool:
+                    print("Arena",self.name,"record command rejected",msgDic)
+                    return
+                self.worker.command("startRecording",fname,fps,raw)
+            else:
+                self.worker.command("stopRecording")
+            return
+        #-------------------------------------------
+        elif msgDic[Strings.cmd]==Strings.getAllRobots:
+            # e.g. {"cmd":"getAllRobots","replyTo":"pixelbot/controller1"} the topic to publish to
+            topic=self.replyTopic(msgDic)
+            if topic is None: return
+
+            payload=self.robots.get().reply((Strings.getAllRobots,),lambda s:json.dumps({
+                Strings.robots:dict(s.robots),
+                Strings.seq:s.seq,
+                Strings.time:round(s.captureTime,3)
+                }))
+            self.MQTT.publishPayload(topic, payload)
+            return
+        #-------------------------------------------
+        elif msgDic[Strings.cmd]==Strings.near:
+            # e.g. {"cmd":"near","botId":3,"range":300} the robots and obstacles
+            # within 300mm of robot 3, the reply goes to robot 3 unless there's a replyTo
+            if Strings.botId not in msgDic: return
+            botId=msgDic[Strings.botId]
+            snapshot=self.robots.get()
+            if not botId in snapshot.robots:     return  # don't know him
+            radius=float(msgDic.get(Strings.range,NEAR_RANGE))
+
+            def build(s):
+                x,y=s.robots[botId][:2]
+                return json.dumps({
+                    Strings.near:[[b,*pose,round(d)] for d,b,pose in self.spatialIndex(s).near(x,y,radius,botId)],
+                    Strings.obstacles:[[i,round(d)] for d,i in self.obstacles.near(x,y,radius)],
+                    Strings.seq:s.seq,
+                    Strings.time:round(s.captureTime,3)
+                    })
+            topic=self.replyTopic(msgDic,Strings.mainTopic + str(botId))
+            if topic is None: return
+            payload=snapshot.reply((Strings.near,botId,radius),build)
+            self.MQTT.publishPayload(topic, payload)
+            return
+        #-------------------------------------------
+        elif msgDic[Strings.cmd]==Strings.nearest:
+            # e.g. {"cmd":"nearest","botId":3,"k":2} the 2 robots nearest robot 3, the reply goes to robot 3
+            # or {"cmd":"nearest","x":500,"y":400,"k":2,"replyTo":"pixelbot/controller1"} the 2 robots nearest (500,400)
+            snapshot=self.robots.get()
+            k=min(int(msgDic.get(Strings.k,1)),MAX_NEAREST)
+            if Strings.botId in msgDic:
+                botId=msgDic[Strings.botId]
+                if not botId in snapshot.robots:     return  # don't know him
+                x,y=snapshot.robots[botId][:2]
+                topic=self.replyTopic(msgDic,Strings.mainTopic + str(botId))
+            elif Strings.x in msgDic and Strings.y in msgDic:
+                botId=None
+                x,y=float(msgDic[Strings.x]),float(msgDic[Strings.y])
+                topic=self.replyTopic(msgDic)
+            else:
+                return
+            if topic is None: return
+
+            payload=snapshot.reply((Strings.nearest,botId,x,y,k),lambda s:json.dumps({
+                Strings.nearest:[[b,*pose,round(d)] for d,b,pose in self.spatialIndex(s).nearest(x,y,k,botId)],
+                Strings.seq:s.seq,
+                Strings.time:round(s.captureTime,3)
+                }))
+            self.MQTT.publishPayload(topic, payload)
+            return
+        #-------------------------------------------
+        elif msgDic[Strings.cmd]==Strings.path:
+            # e.g. {"cmd":"path","botId":3,"x":1500,"y":700} plan a path for robot 3 to (1500,700)
+            # the waypoints are published on pixelbot/3/path, without x and y it is cancelled
+            if Strings.botId not in msgDic: return
+            if Strings.x in msgDic and Strings.y in msgDic:
+                target=(float(msgDic[Strings.x]),float(msgDic[Strings.y]))
+            else:
+                target=None
+            if not self.planner.request(msgDic[Strings.botId],target):
+                print("Arena",self.name,"path target outside the arena",msgDic)
+            return
 
-        payload = json.dumps(reply)
-        MQTT.publishPayload(Strings.mainTopic + Strings.replyTo, payload)
-        return
+    def replyTopic(self,msgDic,default=None):
+        '''
+        The topic to reply to a query on. A replyTo must be a topic of this
+        arena's but not one ArenaManager publishes or listens on itself,
+        e.g. "pixelbot/controller1" not "pixelbot/3" or "pixelbot/location",
+        so a client can't have replies published over other robots' data.
+
+        :param msgDic: decoded message payload
+        :param default: topic if there is no replyTo, None if one is needed
+        :return: str topic or None if there is no allowed one
+        '''
+        Strings=self.Strings
+        topic=msgDic.get(Strings.replyTo)
+        if topic is None or topic==default: return default
+        if not isinstance(topic,str) or "+" in topic or "#" in topic or "\0" in topic: return None
+        if not topic.startswith(Strings.mainTopic): return None
+        first=topic[len(Strings.mainTopic):].split("/")[0]
+        if not first or first.isdigit() or first in (Strings.location,Strings.events,"arena"): return None
+        return topic
+
+    def spatialIndex(self,snapshot):
+        '''
+        :param snapshot: RobotSnapshot
+        :return: its GridIndex, built by the first query of the frame
+        '''
+        return snapshot.reply("index",lambda s:GridIndex(s.robots))
+
+    # detection results from the worker process
+    def updateOutputFrame(self):
+        lastReport=time.time()
+        lastSeq=None
+        pending=None            # (seq,frame) waiting for its robot overlay
+        frontEnd=CpuMeter()    # whole process, measured over REPORT_INTERVAL
+        while True:
+            result=self.worker.read(WORKER_TIMEOUT)
+            if result is None:
+                if not self.worker.isAlive():
+                    print("Arena",self.name,"detection has stopped")
+                    break
+                continue
 
-# initialise the MQTT manager and tell it where to send message callbacks
-MQTT=MqttManager.MQTT(on_message_callback)
+            seq,captureTime,Robots,confidence,overlay,self.workerStats=result
+            snapshot=self.robots.publish(seq,captureTime,Robots)
+            self.planner.update(snapshot)
+            if self.zones is not None: self.zones.update(snapshot)
+            # published to the robots on the publisher's own thread
+            self.publisher.update(seq,captureTime,Robots,confidence)
+
+            # frames are only copied out of shared memory if someone wants them
+            # each stream's viewers do their own resizing, drawing and encoding
+            wantH264=self.h264.hasClients()
+            wantReplay=self.replay.wants()
+            if pending is not None and pending[0]<seq:
+                pending=None    # its own results were missed, never draw another frame's on it
+            if pending is None and (self.stream.wants() or wantH264 or wantReplay):
+                pending=self.worker.readFrame(lastSeq)
+
+            # the worker writes the frame before sending its snapshot so the
+            # frame can be one ahead, if so it waits for its own overlay
+            # and captureTime
+            if pending is not None and pending[0]==seq:
+                lastSeq,frame=pending
+                pending=None
+                self.stream.publish(frame,lastSeq,overlay)
+                if wantH264: self.h264.publish(frame,overlay)
+                if wantReplay: self.replay.publish(frame,lastSeq,captureTime,overlay)
+
+            if time.time()-lastReport>=REPORT_INTERVAL:
+                print("Arena",self.name,"detection",self.workerStats,"front end cpu",frontEnd.read(),"%")
+                lastReport=time.time()
+
+arenas={}   # Arena instances by name, the first is the default
+MQTT=None   # MqttManager.MQTT shared by the arenas, set at startup
+frontEndCpu=CpuMeter()  # web server, streams and MQTT share this process
 
 def publishAllLocations():
     # use
     pass
 
-# initialize the output frame and a lock used to ensure thread-safe
-# exchanges of the output frames (useful when multiple browsers/tabs
-# are viewing the stream)
-outputFrame = None  # obtained from ArenaProcessing
-lock = threading.Lock()
- 
+def stopArenas():
+    for arena in arenas.values():
+        arena.stop()
+
 # initialize a flask object
 app = Flask(__name__)
 
@@ -126,95 +409,113 @@ def index():
     # return the rendered template
     return render_template("index.html")
 
-# image processing 
-def updateOutputFrame():
-    # grab global references to the video stream, output frame, and
-    # lock variables
-    global outputFrame, lock, ipd,Robots
-
-    lastPush=time.time()-1  # force a push on first pass
-    while True:
-        with lock:
-            # order is important
-            outputFrame = AP.update()
-
-            if time.time()-lastPush>=1:
-                # push robot info to game controller
-                R=AP.getRobots()
-                Robots={}
-                for bot in R:
-                    #botId=bot() # bound method
-                    (x,y),pos=R[bot]
-                    x=int(x)
-                    y=int(y)
-                    Robots[bot]=(x,y,pos)
-
-                reply = {
-                    Strings.robots: Robots
-                }
-
-                payload = json.dumps(reply)
-                MQTT.publishPayload(Strings.mainTopic + Strings.location, payload)
-                lastPush=time.time()
-
-        # scale down maintaining aspect ratio
-        # just making a 640 pixel wide image for streaming
-        h,w=outputFrame.shape[:2]
-        aspect=640/w
-        newHeight=int(aspect*h)
-
-        outputFrame=cv2.resize(outputFrame, (640,newHeight), interpolation=cv2.INTER_LINEAR)
-
-        cv2.imshow("output", outputFrame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-
-            cv2.destroyAllWindows()
-            break
-
-def generate():
+@app.route("/stats")
+def stats():
+    # cpu use of the front end (this process) and each detection process
+    return {
+        "frontEndCpu":frontEndCpu.read(),
+        "arenas":{name:arena.workerStats for name,arena in arenas.items()},
+        "streams":{name:arena.stream.stats() for name,arena in arenas.items()},
+        "h264":{name:arena.h264.stats() for name,arena in arenas.items()},
+        "replay":{name:arena.replay.stats() for name,arena in arenas.items()},
+        "publish":{name:arena.publisher.stats() for name,arena in arenas.items() if arena.publisher is not None},
+        "paths":{name:arena.planner.stats() for name,arena in arenas.items() if arena.planner is not None},
+        "zones":{name:arena.zones.stats() for name,arena in arenas.items() if arena.zones is not None},
+        "mqtt":MQTT.stats() if MQTT is not None else None,
+        "frameRead":{name:arena.worker.frames.stats() for name,arena in arenas.items()}
+    }
+
+def findArena(name):
+    if name is None:
+        return next(iter(arenas.values()))
+    if name in arenas:
+        return arenas[name]
+    abort(404)
+
+def streamOptions():
     '''
-    Generate the video stream
-    :return: Nothing
+    Stream settings from the query string e.g. /video_feed?width=320&quality=50&fps=2&raw=1
+
+    width:   pixels, default STREAM_WIDTH. Frames are never scaled up.
+    quality: JPEG quality 1-100, default is OpenCV's (95)
+    fps:     maximum frames per second, default 0 which is every frame
+    raw:     1 for the camera image without the robot annotations
+
+    :return: tuple (width,quality,fps,raw)
     '''
+    width=request.args.get("width",STREAM_WIDTH,type=int)
+    quality=request.args.get("quality",None,type=int)
+    fps=request.args.get("fps",0,type=float)
+    raw=request.args.get("raw",0,type=int)!=0
 
-    global outputFrame, lock
- 
-    # loop over frames from the output stream
-    while True:
-        # wait until the lock is acquired
-        with lock:
-            # check if the output frame is available, otherwise skip
-            # the iteration of the loop
-            if outputFrame is None:
-                continue
- 
-            # encode the frame in JPEG format
-            (flag, encodedImage) = cv2.imencode(".jpg", outputFrame)
- 
-            # ensure the frame was successfully encoded
-            if not flag:
-                continue
- 
-        # yield the output frame in the byte format
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
-            bytearray(encodedImage) + b'\r\n')
+    width=max(16,width)
+    if quality is not None: quality=min(max(quality,1),100)
+    fps=min(max(fps,0),MAX_STREAM_FPS)
+    return width,quality,fps,raw
 
 @app.route("/video_feed")
-def video_feed():
+@app.route("/video_feed/<name>")
+def video_feed(name=None):
+    arena=findArena(name)
+    options=streamOptions()
+    if arena.stream.isFull(*options):
+        abort(503)  # too many different streams
     # return the response generated along with the specific media
     # type (mime type)
-    return Response(generate(),
+    return Response(arena.stream.generate(*options),
+        mimetype = "multipart/x-mixed-replace; boundary=frame")
+
+@app.route("/h264_feed")
+@app.route("/h264_feed/<name>")
+def h264_feed(name=None):
+    # H.264 in MPEG-TS for players such as VLC or ffplay, see H264Stream.py
+    arena=findArena(name)
+    if not arena.h264.isAvailable():
+        print("ffmpeg is not installed, /h264_feed is not available")
+        abort(503)
+    return Response(arena.h264.generate(),mimetype="video/mp2t")
+
+@app.route("/snapshot.jpg")
+@app.route("/snapshot/<name>.jpg")
+def snapshot(name=None):
+    arena=findArena(name)
+    width,quality,fps,raw=streamOptions()
+    jpeg=arena.stream.snapshot(width,quality,raw)
+    if jpeg is None:
+        abort(503)  # no frame from the camera
+    return Response(jpeg,mimetype="image/jpeg")
+
+@app.route("/replay")
+@app.route("/replay/<name>")
+def replay(name=None):
+    '''
+    Replay the recent past e.g. /replay?from=30&to=0&speed=0.5
+
+    from:   seconds ago to start, default 30
+    to:     seconds ago to finish, default 0 (now)
+    speed:  0.5 for half speed etc., default 1
+    '''
+    arena=findArena(name)
+    now=time.time()
+    start=now-request.args.get("from",30,type=float)
+    end=now-request.args.get("to",0,type=float)
+    speed=request.args.get("speed",1.0,type=float)
+    return Response(arena.replay.generate(start,end,speed),
         mimetype = "multipart/x-mixed-replace; boundary=frame")
 
 # check to see if this is the main thread of execution
 if __name__ == '__main__':
 
-    # start a thread that will perform bot detection
-    t = threading.Thread(target=updateOutputFrame)
-    t.daemon = True
-    t.start()
- 
+    # start the detection process for each arena
+    for config in ARENAS:
+        arenas[config["name"]]=Arena(config)
+    atexit.register(stopArenas)
+
+    # initialise the MQTT manager, each arena adds a handler for its commands
+    MQTT=MqttManager.MQTT()
+
+    for arena in arenas.values():
+        arena.start(MQTT)
+
     # start the flask app
     app.run(host="0.0.0.0", port=8000, debug=True,threaded=True, use_reloader=False)
- 
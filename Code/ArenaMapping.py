@@ -0,0 +1,110 @@
+"""
+ArenaMapping.py
+
+Converts camera pixel coordinates into arena millimetres.
+
+If CameraCalibration.py has been run the lens distortion is removed and the
+arena homography applied. Only the detected points are mapped, never the
+whole frame, and all the robots are done in one call so the cost per frame
+is tiny.
+
+Without a calibration the single CAMERA_SCALE factor from CameraScaling.py
+is used, as before.
+
+typical usage:
+    mapper=ArenaMapper()
+    mm=mapper.toArena([(x0,y0),(x1,y1)])    # numpy array [[x,y]...]
+"""
+
+import cv2
+import numpy as np
+from Params import *
+
+
+def headings(centres,directors):
+    '''
+    Nautical headings (North=0, y increasing down the image) from robot centres
+    to their direction indicators. Same sums as robot.getHeading() but for all
+    robots at once.
+
+    :param centres: numpy array [[x,y]...]
+    :param directors: numpy array [[x,y]...] same length as centres
+    :return: numpy int array of headings 0-359
+    '''
+    centres=np.asarray(centres,dtype=np.float64).reshape(-1,2)
+    directors=np.asarray(directors,dtype=np.float64).reshape(-1,2)
+    angle=np.arctan2(directors[:,1]-centres[:,1],centres[:,0]-directors[:,0])
+    deg=np.degrees(angle).astype(int)  # truncate like int(math.degrees())
+    return np.where(deg<0,(450+deg)%360,90+deg)
+
+
+class ArenaMapper:
+    '''
+    Maps pixel coordinates to arena millimetres
+    '''
+
+    cameraMatrix=None
+    distCoeffs=None
+    homography=None
+
+    def __init__(self,calibration=None):
+        '''
+        :param calibration: optional dict with CAMERA_MATRIX, DIST_COEFFS and ARENA_HOMOGRAPHY
+                            entries. Default is to use the values in Params.
+        '''
+        if calibration is None:
+            calibration={
+                PARAM_CAMERA_MATRIX:getParam(PARAM_CAMERA_MATRIX),
+                PARAM_DIST_COEFFS:getParam(PARAM_DIST_COEFFS),
+                PARAM_ARENA_HOMOGRAPHY:getParam(PARAM_ARENA_HOMOGRAPHY)
+            }
+        self.setCalibration(calibration)
+
+    def setCalibration(self,calibration):
+        '''
+        Change the calibration in use
+
+        :param calibration: dict, missing or None entries are not used
+        :return: Nothing
+        '''
+        K=calibration.get(PARAM_CAMERA_MATRIX)
+        D=calibration.get(PARAM_DIST_COEFFS)
+        H=calibration.get(PARAM_ARENA_HOMOGRAPHY)
+
+        self.cameraMatrix=None if K is None else np.array(K,dtype=np.float64).reshape(3,3)
+        self.distCoeffs=None if D is None else np.array(D,dtype=np.float64).ravel()
+        self.homography=None if H is None else np.array(H,dtype=np.float64).reshape(3,3)
+
+    def isCalibrated(self):
+        '''
+        :return: True if a homography is available, False if CAMERA_SCALE is used
+        '''
+        return self.homography is not None
+
+    def undistort(self,points):
+        '''
+        Remove lens distortion from pixel coordinates
+
+        :param points: sequence of (x,y) pixel coordinates
+        :return: numpy float array [[x,y]...] in (undistorted) pixels
+        '''
+        pts=np.asarray(points,dtype=np.float64).reshape(-1,1,2)
+        if self.cameraMatrix is not None and self.distCoeffs is not None and len(pts)>0:
+            # P= keeps the result in pixels rather than normalised coordinates
+            pts=cv2.undistortPoints(pts,self.cameraMatrix,self.distCoeffs,P=self.cameraMatrix)
+        return pts.reshape(-1,2)
+
+    def toArena(self,points):
+        '''
+        Convert pixel coordinates into arena millimetres
+
+        :param points: sequence of (x,y) pixel coordinates
+        :return: numpy float array [[x,y]...] in mm
+        '''
+        pts=self.undistort(points)
+        if len(pts)==0: return pts
+
+        if self.homography is None:
+            return pts*Params[PARAM_CAMERA_SCALE]
+
+        return cv2.perspectiveTransform(pts.reshape(-1,1,2),self.homography).reshape(-1,2)
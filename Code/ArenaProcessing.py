@@ -22,6 +22,9 @@ CameraSetup.py      allows you to adjust parameters which affect the
 CameraMask.py       allows you to setup a mask to exclude objects
                     on the periphery of the arena - should speed up processing
 
+ArenaBoundary.py    finds the arena boundary automatically and saves it as
+                    a polygon mask - the smallest mask which covers the arena
+
 ArenaSetup.py       allows you to adjust feature sizes which determine if a
                     shape is robot, ID dot or direction indicator.
 
@@ -37,14 +40,19 @@ from Params import *
 import imutils
 from imutils import contours
 import math
-from Camera import CameraStream
+from Camera import openCamera
 from Decorators import timeit,traceit,tracebot,FPS
 from Robot import robot
 from Exceptions import *
+from ArenaBoundary import checkDrift
+from ArenaMapping import ArenaMapper,headings
+from Overlay import describeRobots,shape
+from VideoRecorder import VideoRecorder
 
 TEAM_A_COLOR=(255,0,0)
 TEAM_B_COLOR=(0,0,255)
 NUM_ROBOTS=8
+FRAME_WAIT=1.0      # seconds update() waits for a new frame before reusing the last
 
 readParams() # load parameters from Settings.json (See Params.py)
 
@@ -57,8 +65,8 @@ class ArenaProcessor:
     The contours are then found in the EDGES image and used to identify the
     robots and their positions.
 
-    The color image is then overlaid with robot identification information
-    and passed back to the ArenaManager for streaming.
+    The color image is passed back to the ArenaManager for streaming along with
+    the robot identification information to overlay on it (see Overlay.py).
 
     Records the robot information for the ArenaManager to use.
 
@@ -71,14 +79,17 @@ class ArenaProcessor:
     useingSmallEDGES=False
 
     showScaleRect=False
+    staticKey=None
+    staticShapes=(0,[])     # (version,shapes) see getStaticShapes()
     cam=None
     recording=False
 
     contours=None
     hierarchy=None
-    video_writer=None
-    recordingFps=0      # higher values cause recording to take place
+    recorder=None       # VideoRecorder whilst recording
     scene=None
+    frameSeq=0          # incremented by update() for each new capture
+    captureTime=0       # time.time() the camera captured the scene
     botColors={}    # botColors[id]=tuple (R,G,B)
     maskOffsets=(0,0)    # x,y position of smallEDGES image mnsk
 
@@ -94,22 +105,27 @@ class ArenaProcessor:
 
         :param size: tuple (w,h) of the video frame
         :param useSmallEDGES: boolean True to use the masked EDGES frame
-        :param cameraIndex: int default 0, camera to use (see openCV VideoCapture())
+        :param cameraIndex: int default 0, camera to use (see openCV VideoCapture()) or a video file to replay
         :param recordingFPS: int recording frame rate Turns on video recording if >0
         '''
         self.usingSmallEDGES=useSmallEDGES
 
-        self.recordingFps=recordingFps
-        self.cam=CameraStream(size,cameraIndex)
+        self.size=size
+        self.cam=openCamera(size,cameraIndex)
         self.cam.start()
 
         # setup the image mask
-        maskW,maskH=Params[PARAM_ARENA_MASK_SIZE]
-        self.cam.makeMask(maskW,maskH)
+        self.updateArenaMask()
         self.maskOffsets=self.cam.getMaskOffsets()
 
+        # has the camera moved since ArenaBoundary.py was run?
+        score,drifted=checkDrift(self.cam.readBGR())
+        if drifted:
+            print("WARNING: arena boundary score",round(score,2),"is low. The camera may have moved, re-run ArenaBoundary.py")
+
         self.botsFound=[]
         self.scale=Params[PARAM_CAMERA_SCALE]
+        self.mapper=ArenaMapper()    # pixels to mm, see CameraCalibration.py
 
         # temp - init bot colors
         for b in range(1,NUM_ROBOTS+1): # range stops one short
@@ -120,13 +136,7 @@ class ArenaProcessor:
 
         # Video recording?
         if recordingFps>0:
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                self.video_writer = cv2.VideoWriter("output.avi", fourcc, recordingFps,size)
-                assert self.video_writer.isOpened(), "Unable to open the VideoWriter."
-                print("Recording to output.avi at",recordingFps,"fps")
-            except Exception as e:
-                print("Video Writer problem",e)
+            if not self.startRecording("output.avi",recordingFps):
                 exit()
 
     def __del__(self):
@@ -138,8 +148,7 @@ class ArenaProcessor:
 
         :return: nothing
         """
-        if self.video_writer is not None:
-            self.video_writer.release()
+        self.stopRecording()
         self.cam.release()
         cv2.destroyAllWindows()
 
@@ -151,8 +160,7 @@ class ArenaProcessor:
 
         :return: Nothing
         '''
-        if self.video_writer is not None:
-            self.video_writer.release()
+        self.stopRecording()
         self.cam.release()
         cv2.destroyAllWindows()
 
@@ -362,67 +370,94 @@ class ArenaProcessor:
         thisBot.setLocation((botX, botY))
         thisBot.setSize(botR)   # depracated
         thisBot.setContour(box) # now use contour instead
+        thisBot.setFill(min(1.0,cv2.contourArea(contour)/max(area,1)))
         self.botsFound.append(thisBot)
 
         #print("- addRobot() OK @",botX,botY,"contour",box)
         #cv2.circle(self.scene, (botX, botY), int(botR), (0, 255, 255), 2)
         return True
 
-    def drawScaleRect(self):
+    def scaleRectShape(self,W,H):
         '''
-        Draws a scaled A4 rectangle on self.scene to allow the camera scale to be shown/set..
+        A scaled A4 rectangle to allow the camera scale to be shown/set..
 
         This gives us the pixel/mm ratio since we know the size of an A4
         shape.
 
-
-        :return: nothing, the rectangle is drawn
+        :param W: frame width
+        :param H: frame height
+        :return: Overlay shape
         '''
-        H, W = self.scene.shape[:2]
         CX = W / 2
         CY = H / 2
         # assum
         sx,sy=Params[PARAM_SCALE_RECT_SIZE]
         rw, rh = sx * Params[PARAM_CAMERA_SCALE], sy * Params[PARAM_CAMERA_SCALE]
 
-        # target rectangle points
-        TL = (int(CX - rw / 2), int(CY - rh / 2))
-        BR = (int(CX + rw / 2), int(CY + rh / 2))
+        # target rectangle corners
+        L,T = CX - rw / 2, CY - rh / 2
+        R,B = CX + rw / 2, CY + rh / 2
 
-        # draw the scaled recangle
-        cv2.rectangle(self.scene, TL, BR, (0, 255, 0), 1)
+        return shape([(L,T),(R,T),(R,B),(L,B)],(0, 255, 0))
 
-    def drawMaskRectangle(self):
+    def maskShape(self,W,H):
         '''
-        Draws a rectangle on self.scene showing the masked area
+        A rectangle, or the boundary polygon, showing the masked area
 
-        :return: None
+        :param W: frame width
+        :param H: frame height
+        :return: Overlay shape
         '''
-        frame_h, frame_w = self.scene.shape[:2]
+        polygon=getParam(PARAM_ARENA_MASK_POLYGON)
+        if polygon is not None:
+            return shape(polygon,(0, 255, 255))
 
         mask_scale = Params[PARAM_ARENA_MASK_SCALE]
 
         (mask_w, mask_h) = Params[PARAM_ARENA_MASK_SIZE]
         mask_w = int(mask_w * mask_scale)
         mask_h = int(mask_h * mask_scale)
-        y = int((frame_h - mask_h) / 2)
-        x = int((frame_w - mask_w) / 2)
-        cv2.rectangle(self.scene, (x, y), (x + mask_w, y + mask_h), (0, 255, 255), 1)
+        y = int((H - mask_h) / 2)
+        x = int((W - mask_w) / 2)
+        return shape([(x,y),(x+mask_w,y),(x+mask_w,y+mask_h),(x,y+mask_h)],(0, 255, 255))
 
-    def drawCrossHairs(self):
+    def crossHairShapes(self,W,H):
         '''
-        Add a white cross to the scene.
+        A white cross through the centre of the scene horizontally and
+        vertically - mostly for checking the heading values are correct
 
-        The cross passes through the centre of the scene
-        horizontally and vertically - mostly for checking the heading values are correct
-        :return: None
+        :param W: frame width
+        :param H: frame height
+        :return: list of Overlay shapes
         '''
-        H, W = self.scene.shape[:2]
         halfW = int(W / 2)
         halfH = int(H / 2)
 
-        cv2.line(self.scene, (0, halfH), (W, halfH), (255, 255, 255), 1)
-        cv2.line(self.scene, (halfW, 0), (halfW, H), (255, 255, 255), 1)
+        return [shape([(0, halfH), (W, halfH)], (255, 255, 255), closed=False),
+                shape([(halfW, 0), (halfW, H)], (255, 255, 255), closed=False)]
+
+    def getStaticShapes(self):
+        '''
+        The crosshairs, mask and scale rectangle, if enabled
+
+        They are only worked out again when the frame size, the enable*Display()
+        settings or the Params they use change. The version number changes at
+        the same time so the stream's StaticLayers know to redraw them.
+
+        :return: tuple (version,list of Overlay shapes)
+        '''
+        H, W = self.scene.shape[:2]
+        key=json.dumps([W,H,self.showCrossHairs,self.showMaskRect,self.showScaleRect,
+                        Params[PARAM_SCALE_RECT_SIZE],Params[PARAM_CAMERA_SCALE],getParam(PARAM_ARENA_MASK_POLYGON),
+                        Params[PARAM_ARENA_MASK_SCALE],Params[PARAM_ARENA_MASK_SIZE]])
+        if key!=self.staticKey:
+            shapes=[]
+            if self.showCrossHairs: shapes+=self.crossHairShapes(W,H)
+            if self.showMaskRect:   shapes.append(self.maskShape(W,H))
+            if self.showScaleRect:  shapes.append(self.scaleRectShape(W,H))
+            self.staticKey=key
+            self.staticShapes=(self.staticShapes[0]+1,shapes)
+        return self.staticShapes
 
     def compensateXY(self,x,y):
         '''
@@ -466,34 +501,26 @@ class ArenaProcessor:
                 x, y = self.compensateXY(x, y)
                 self.addRobotIdDot(x, y)
 
+        # the bot outlines and numbers are drawn later on the stream
+        # frame, see getOverlay()
         for bot in self.botsFound:
-            # draw the bot outline and put its number in the middle so
-            # people can see where their bots are
             botId=bot.getId()
             if botId is None:
                 print("No bot id for bot @",bot.getLocation())
-            # bot outline colour default is cyan
-            if botId in self.botColors:
-                bot.setColor(self.botColors[botId])
-            bot.drawOutline(self.scene)
-            #bot.drawScaledOutline(self.scene)
-
-            # debugging
-            avgDotR=(Params[PARAM_MIN_DOT_R]+Params[PARAM_MAX_DOT_R])//2
-            bot.drawDots(self.scene,avgDotR)
-
-            avgDirR=(Params[PARAM_MIN_DIRECTOR_R]+Params[PARAM_MAX_DIRECTOR_R])//2
-            bot.drawDirector(self.scene,avgDirR)
-
-            bot.drawId(self.scene)
-            # bot.annotate(self.scene)
 
     def updateArenaMask(self):
         '''
         tell the camera the size of mask to use during image processing
 
+        The arena boundary polygon (see ArenaBoundary.py) is used if
+        one has been saved.
+
         :return: Nothing
         '''
+        polygon=getParam(PARAM_ARENA_MASK_POLYGON)
+        if polygon is not None:
+            self.cam.makeMaskFromPolygon(polygon)
+            return
         w,h=Params[PARAM_ARENA_MASK_SIZE]
         self.cam.makeMask(int(w),int(h))
 
@@ -507,6 +534,9 @@ class ArenaProcessor:
         '''
         Called from ArenaManager to update the scene image and bot information
 
+        The scene is not drawn on, see getOverlay(). It is a new image each
+        time so the caller may keep or draw on it.
+
         :return: numpy array updated scene image
         '''
         print("\nUPDATE Pass\n")
@@ -515,7 +545,12 @@ class ArenaProcessor:
         self.setCameraProps()    # incase changed`dynamically
         self.updateArenaMask()   # incase the mask has been dynamically changed
         self.maskOffsets=self.cam.getMaskOffsets()
-        self.scene = self.cam.readBGR()
+        # the camera threads don't block, wait for a capture this hasn't seen
+        self.cam.waitForFrame(self.captureTime,FRAME_WAIT)
+        self.scene,captureTime = self.cam.readStampedBGR()
+        if captureTime!=self.captureTime:
+            self.frameSeq+=1    # not the same capture read again after a timeout
+            self.captureTime=captureTime
 
         assert self.scene is not None,"Unable to load scene image - is the camera running?"
 
@@ -557,34 +592,112 @@ class ArenaProcessor:
         if self.contours is not None:
             self.processContours()  # looking for dots and direction indicators
 
-        # show cross hairs to show heading is correct
-        # just two lines drawn through the centre of the image
-        if self.showCrossHairs: self.addCrossHairs()
-        if self.showMaskRect:   self.addMaskRectangle()
-
-        if self.showScaleRect:  self.addScaleRect()
+        # the cross hairs, mask and scale rectangle are drawn with the
+        # robots, see getOverlay(). The recorder draws them on its own thread.
+        if self.recorder is not None:
+            self.recorder.write(self.scene,None if self.recorder.raw else self.getOverlay())
 
-        if self.recordingFps>0:
-            self.video_writer.write(self.scene)
-
-        return self.scene.copy()
+        return self.scene
 
     def getRobots(self):
         '''
         Retrieve the current bot position and heading.
 
         Called by ArenaManager after the last call to update()
+
+        The centres and direction indicators of all the bots are mapped to arena
+        millimetres in one go (see ArenaMapping.py) and the headings are worked
+        out from the mapped points so they are correct near the edges too.
+
         :return: dict allBots[botId]=(x,y),heading
         '''
         allBots={}
-        for bot in self.botsFound:
-            pos=bot.getLocation()
-            # adjust locations for camera scale turns pixels into mm
-            scaled_pos=(int(pos[0]*Params[PARAM_CAMERA_SCALE]),int(pos[1]*Params[PARAM_CAMERA_SCALE]))
-            allBots[bot.getId()]=scaled_pos,bot.getHeading()
+        if len(self.botsFound)==0: return allBots
+
+        centres=[bot.getLocation() for bot in self.botsFound]
+        directors=[bot.getDirector() for bot in self.botsFound]
+        hasDirector=[d is not None for d in directors]
+
+        points=centres+[d for d in directors if d is not None]
+        mapped=self.mapper.toArena(points)
+        mappedCentres=mapped[:len(centres)]
+        mappedDirectors=mapped[len(centres):]
+
+        botHeadings=[None]*len(centres)
+        if len(mappedDirectors)>0:
+            withDirector=np.flatnonzero(hasDirector)
+            for i,heading in zip(withDirector,headings(mappedCentres[withDirector],mappedDirectors)):
+                botHeadings[i]=int(heading)
+
+        for bot,(x,y),heading in zip(self.botsFound,mappedCentres,botHeadings):
+            allBots[bot.getId()]=(int(x),int(y)),heading
 
         return allBots
 
+    def getConfidence(self):
+        '''
+        :return: dict confidence[botId]=0-1 for the robots found by the last update(), see Robot.getConfidence()
+        '''
+        confidence={}
+        for bot in self.botsFound:
+            botId=bot.getId()
+            confidence[botId]=max(confidence.get(botId,0.0),bot.getConfidence())
+        return confidence
+
+    def getFrameInfo(self):
+        '''
+        Identifies the frame the last update() processed
+
+        :return: tuple (frame sequence number, time.time() the frame was captured)
+        '''
+        return self.frameSeq,self.captureTime
+
+    def getOverlay(self):
+        '''
+        What to draw on the scene to show the robots found by the last update(),
+        and the crosshairs, mask and scale rectangle if they are enabled
+
+        :return: dict in scene pixel coordinates, see Overlay.drawOverlay()
+        '''
+        avgDotR=(Params[PARAM_MIN_DOT_R]+Params[PARAM_MAX_DOT_R])//2
+        avgDirR=(Params[PARAM_MIN_DIRECTOR_R]+Params[PARAM_MAX_DIRECTOR_R])//2
+        return {"robots":describeRobots(self.botsFound,self.botColors,avgDotR,avgDirR),
+                "static":self.getStaticShapes()}
+
+    def startRecording(self,fname="output.avi",fps=10,raw=False):
+        '''
+        Start recording the scene to a video file, stopping any recording in progress
+
+        The file is written on a background thread, see VideoRecorder.py. A raw
+        recording can be replayed by using its file name as the camera.
+
+        :param fname: video file name
+        :param fps: int frame rate written in the file
+        :param raw: True to record the camera image without the robots drawn on
+        :return: True if recording started
+        '''
+        self.stopRecording()
+        recorder=VideoRecorder(fname,fps,self.size,raw)
+        if not recorder.start(): return False
+        self.recorder=recorder
+        return True
+
+    def stopRecording(self):
+        '''
+        Finish writing the video file, if recording
+
+        :return: Nothing
+        '''
+        if self.recorder is None: return
+        self.recorder.stop()
+        self.recorder=None
+
+    def getRecorderStats(self):
+        '''
+        :return: dict from VideoRecorder.stats() or None if not recording
+        '''
+        return None if self.recorder is None else self.recorder.stats()
+
     def enableMaskDisplay(self, on=False):
         '''
         Draw a mask rectangle over the image to show the boundaries of the arena mask
@@ -619,7 +732,7 @@ class ArenaProcessor:
         :param on: True means add the crosshairs
         :return: Nothing
         '''
-        self.showCrosshair = on
+        self.showCrossHairs = on
 
     ###############################################################################
     #
@@ -12,6 +12,7 @@ import cv2
 from Camera import *
 from Decorators import *
 from ArenaProcessing import ArenaProcessor
+from Overlay import drawOverlay,StaticLayer
 
 readParams()    # initial values. Can be re-read on button press
 
@@ -42,6 +43,7 @@ class Setup:
         print("Setup called from",__name__)
 
         self.AP=ArenaProcessor(imageSize)
+        self.layer=StaticLayer()    # crosshairs etc.
 
         self.window = Tk()
 
@@ -105,7 +107,7 @@ class Setup:
         while True:
             if self.closing: break
             self.window.update()
-            self.outframe=self.AP.update()
+            self.outframe=drawOverlay(self.AP.update(),self.AP.getOverlay(),1.0,self.layer)
             self.displayRobotInfo()
             self.showAllCameraImages()
 
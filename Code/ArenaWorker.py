@@ -0,0 +1,221 @@
+"""
+ArenaWorker.py
+
+Runs the robot detection for one arena in its own process so that several
+arenas can be managed from one ArenaManager.py and each gets its own cpu core.
+
+The worker reads its own settings profile, opens its camera(s) and loops
+calling ArenaProcessor.update() and getRobots(). The full size frame is
+written to shared memory (SharedFrame.py), without any annotation, and a
+small snapshot - frame number, capture time, robot positions and confidence, the robot
+outlines to draw on the frame (see Overlay.py) and the worker's fps and cpu
+use - is sent through a pipe. The web server, MJPEG streams and MQTT all run in the
+ArenaManager process so however many people are watching detection never
+waits for them. Commands (e.g. setBotColor) go the other way.
+
+If the arena config has a log file every frame's detections are appended
+to it here (see DetectionLog.py) - the front end skips snapshots when it is
+busy but the log mustn't.
+
+typical usage:
+    worker=ArenaWorker({"name":"arena","camera":0,"settings":"Settings.json"})
+    worker.start()
+    seq,captureTime,robots,confidence,overlay,stats=worker.read()     # blocks till the next result
+    seq,frame=worker.readFrame()
+    worker.command("setBotColor",1,(0,255,0))
+    worker.stop()
+"""
+
+import multiprocessing
+import queue
+import time
+import cv2
+from Params import *
+from SharedFrame import SharedFrame
+from DetectionLog import DetectionLog
+from Stats import CpuMeter,RateMeter
+from Overlay import drawOverlay,StaticLayer
+
+DISPLAY_WIDTH=640   # local display window width
+STOP_TIMEOUT=5      # seconds to wait for the worker to finish
+STATS_INTERVAL=2    # seconds between fps/cpu measurements
+
+
+def detectionLoop(config,frames,snapshots,commands,stopEvent):
+    '''
+    The worker process
+
+    :param config: dict arena configuration, see ArenaManager.ARENAS
+    :param frames: SharedFrame the frames are written to
+    :param snapshots: Connection (send end of a pipe) for (seq,captureTime,robots,confidence,overlay,stats)
+    :param commands: multiprocessing Queue of (method name, args...) tuples
+    :param stopEvent: multiprocessing Event set to tell the loop to exit
+    :return: when stopEvent is set
+    '''
+    # imported here so the cameras are opened in this process only, and before
+    # the profile is read because importing them reads Settings.json
+    from ArenaProcessing import ArenaProcessor
+    from MultiCamera import MultiCameraProcessor
+
+    # each arena has its own settings profile
+    RestoreDefaults()
+    readParams(config["settings"])
+
+    frameSize=(Params[PARAM_FRAME_WIDTH],Params[PARAM_FRAME_HEIGHT])
+    if getParam(PARAM_CAMERAS):
+        AP=MultiCameraProcessor(frameSize,getParam(PARAM_CAMERAS))
+    else:
+        AP=ArenaProcessor(frameSize,cameraIndex=config["camera"])
+
+    name=config["name"]
+    display=config.get("display",False)
+    displayLayer=StaticLayer()
+    log=DetectionLog(config["log"]) if config.get("log") else None
+
+    fps=RateMeter()
+    cpu=CpuMeter()
+    stats={"fps":0,"cpu":0}
+    lastStats=time.time()
+    lastSeq=None        # the camera stalled if update() returns the same frame
+
+    try:
+        while not stopEvent.is_set():
+            while True:
+                try:
+                    cmd=commands.get_nowait()
+                except queue.Empty:
+                    break
+                getattr(AP,cmd[0])(*cmd[1:])
+
+            frame=AP.update()
+            seq,captureTime=AP.getFrameInfo()
+            overlay=AP.getOverlay()
+
+            # push robot info to the front end
+            R=AP.getRobots()
+            Robots={}
+            for bot in R:
+                (x,y),pos=R[bot]
+                Robots[bot]=(int(x),int(y),pos)
+            confidence=AP.getConfidence()
+            if log is not None and seq!=lastSeq:
+                log.write(seq,captureTime,Robots,confidence)
+            lastSeq=seq
+
+            fps.add()
+            if time.time()-lastStats>=STATS_INTERVAL:
+                stats={"fps":fps.read(),"cpu":cpu.read(),"frameWrite":frames.stats(),
+                       "recorder":AP.getRecorderStats(),"log":None if log is None else log.stats()}
+                lastStats=time.time()
+
+            # the frame goes through shared memory, the pipe only carries the
+            # small snapshot. The front end reads the pipe continuously so the
+            # pipe buffer never fills and send() doesn't block.
+            frames.write(frame,seq)
+            snapshots.send((seq,captureTime,Robots,confidence,overlay,stats))
+
+            if display:
+                h,w=frame.shape[:2]
+                small=cv2.resize(frame,(DISPLAY_WIDTH,int(h*DISPLAY_WIDTH/w)))
+                cv2.imshow(name,drawOverlay(small,overlay,DISPLAY_WIDTH/w,displayLayer))
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    finally:
+        if log is not None: log.close()
+        AP.stop()
+        cv2.destroyAllWindows()
+        frames.close()
+        snapshots.close()
+
+
+class ArenaWorker:
+    '''
+    Front end handle for an arena's detection process
+    '''
+
+    def __init__(self,config):
+        '''
+        :param config: dict with name, camera, settings and optional display and log entries
+        '''
+        self.config=config
+        self.frames=SharedFrame()
+        self.snapshots,self.sendEnd=multiprocessing.Pipe(duplex=False)
+        self.commands=multiprocessing.Queue()
+        self.stopEvent=multiprocessing.Event()
+        self.process=None
+
+    def start(self):
+        '''
+        Start the detection process.
+
+        It is not a daemon because MultiCameraProcessor starts processes of its own.
+        Call stop() before exiting.
+
+        :return: Nothing
+        '''
+        self.process=multiprocessing.Process(target=detectionLoop,name=self.config["name"],
+                                             args=(self.config,self.frames,self.sendEnd,self.commands,self.stopEvent))
+        self.process.start()
+        self.sendEnd.close()    # only the worker writes to the pipe
+
+    def stop(self):
+        '''
+        Tell the detection process to exit and wait for it
+
+        :return: Nothing
+        '''
+        if self.process is None: return
+        self.stopEvent.set()
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process=None
+        self.frames.close()
+        self.frames.unlink()
+
+    def isAlive(self):
+        '''
+        :return: True if the detection process is running
+        '''
+        return self.process is not None and self.process.is_alive()
+
+    def read(self,timeout=None):
+        '''
+        Wait for the next detection snapshot, skipping any older ones still in the pipe
+
+        :param timeout: seconds or None to wait forever
+        :return: (seq,captureTime,robots,confidence,overlay,stats) or None on timeout or if the worker has stopped.
+                 robots is dict robots[botId]=(x,y,heading), confidence is dict confidence[botId]=0-1
+                 (see Robot.getConfidence()), overlay is for Overlay.drawOverlay()
+                 and stats is dict with fps, cpu
+                 and the SharedFrame lock timings in the worker
+                 and the video recorder's frames written and dropped, None if not recording
+                 and the detection log's size, None if not logging
+        '''
+        snapshot=None
+        try:
+            if not self.snapshots.poll(timeout): return None
+            while self.snapshots.poll():
+                snapshot=self.snapshots.recv()
+        except EOFError:
+            pass    # worker has finished
+        return snapshot
+
+    def readFrame(self,lastSeq=None):
+        '''
+        Get a copy of the latest full size frame
+
+        :param lastSeq: if the frame still has this sequence number None is returned
+        :return: tuple (seq,frame) or None
+        '''
+        return self.frames.read(lastSeq)
+
+    def command(self,method,*args):
+        '''
+        Call an ArenaProcessor method in the detection process
+
+        :param method: string method name e.g. "setBotColor"
+        :param args: the method arguments
+        :return: Nothing
+        '''
+        self.commands.put((method,)+args)
@@ -28,6 +28,7 @@ typical usage:
 """
 
 import cv2
+import os
 import time
 import threading
 from Decorators import timeit,traceit,tracecam
@@ -40,6 +41,8 @@ readParams()
 class CameraStream:
 
     maskROI=(0,0,0,0)   # use as [Y1:Y2,X1:X2]
+    polyMask=None       # ROI sized mask when the arena boundary is a polygon
+    maskPolygon=None    # the polygon polyMask was made from
 
     def __init__(self, size, index=0):
         '''
@@ -63,13 +66,16 @@ class CameraStream:
 
         # images created during conversion
         self.BGRcam=None    # temp, current camera frame
+        self.BGRcamTime=0   # time.time() BGRcam was captured
         self.BGR=None       # copy of BGRcam
+        self.BGRtime=0      # capture time of BGR
         self.GRAY=None      # gray scale
         self.THRESH=None    # thresholded gray scale
         self.EDGES=None     # canny edges
 
         self.BGRlock = threading.Lock()     # lock used with framme aquisition
         self.UPDATElock=threading.Lock()    # locak used to make sure user readable images are in sync
+        self.frameReady=threading.Condition(self.UPDATElock)   # notified when BGR is a new capture
 
         self.threshold=Params[PARAM_THRESH_MIN]   # values to use for thresholding gray scale images
         self.thresholdAfterCanny=Params[PARAM_AFTER_CANNY_THRESH_MIN]
@@ -101,10 +107,14 @@ class CameraStream:
 
         print("Camera: first image obtained in {0:2.2f} seconds".format((time.time() - begin)))
 
-        # set the mask to use from the saved mask size
-        w,h=Params[PARAM_ARENA_MASK_SIZE] # dimensions in pixels
-        #scale=Param[PARAM_ARENA_MASK_SCALE] is this needed?
-        self.makeMask(int(w),int(h))
+        # set the mask to use from the saved arena boundary or mask size
+        polygon=getParam(PARAM_ARENA_MASK_POLYGON)
+        if polygon is not None:
+            self.makeMaskFromPolygon(polygon)
+        else:
+            w,h=Params[PARAM_ARENA_MASK_SIZE] # dimensions in pixels
+            #scale=Param[PARAM_ARENA_MASK_SCALE] is this needed?
+            self.makeMask(int(w),int(h))
 
         self.convertBGR()   # create initial GRAY,THRESH and EDGES images
 
@@ -137,8 +147,10 @@ class CameraStream:
                 (grabbed,BGR) = self.stream.read()
 
                 if grabbed:
+                    captured=time.time()
                     with self.BGRlock:
                         self.BGRcam = BGR  # save till convertBGR() runs
+                        self.BGRcamTime = captured
                 else:
                     print("Unable to read camera stream")
             except Exception as e:
@@ -303,11 +315,13 @@ class CameraStream:
         :return:
         '''
         (X1,X2,Y1,Y2)=self.maskROI
+        polyMask=self.polyMask
 
         with self.BGRlock:
             # lock required in case BGRcam is being written
             # by the BGR collector
             bgr=self.BGRcam
+            bgrTime=self.BGRcamTime
 
         # process the image
         gray = cv2.cvtColor(bgr[Y1:Y2,X1:X2], cv2.COLOR_BGR2GRAY)
@@ -322,14 +336,22 @@ class CameraStream:
         if self.thresholdAfterCanny>0:
             th, edges = cv2.threshold(edges, self.thresholdAfterCanny, 255, cv2.THRESH_BINARY)
 
+        # remove edges outside the arena boundary polygon
+        # the mask may have been changed since maskROI was read
+        if polyMask is not None and polyMask.shape==edges.shape:
+            edges=cv2.bitwise_and(edges,polyMask)
+
         # update the images used by the caller
         # this ensures that all the images correspond
         # to the BGR - otherwise there could
         # be a lag
         with self.UPDATElock:
 
+            if bgrTime!=self.BGRtime:
+                self.frameReady.notify_all()
             self.GRAY=gray
             self.BGR=bgr
+            self.BGRtime=bgrTime
             self.THRESH=thresh
 
             # EDGES is just a black image with edges drawn on it
@@ -350,6 +372,28 @@ class CameraStream:
         with self.UPDATElock:
             return self.BGR.copy()
 
+    def readStampedBGR(self):
+        '''
+        gets the last BGR image and the time it was captured
+        :return: tuple (BGR image, time.time() of capture)
+        '''
+        assert self.BGR is not None,"Attempt to call readStampedBGR() no image available. Did you call start()"
+
+        with self.UPDATElock:
+            return self.BGR.copy(),self.BGRtime
+
+
+    def waitForFrame(self,after,timeout=None):
+        '''
+        Wait for a frame captured after a given time. The collector threads
+        don't block so without this the same frame can be read many times.
+
+        :param after: time.time() capture time of the last frame read
+        :param timeout: seconds or None to wait for ever
+        :return: True if there is a newer frame, False if timed out
+        '''
+        with self.frameReady:
+            return self.frameReady.wait_for(lambda:self.BGRtime>after,timeout)
 
     def readGRAY(self):
         '''
@@ -406,6 +450,9 @@ class CameraStream:
         :return:Nothing
         '''
 
+        self.polyMask=None
+        self.maskPolygon=None
+
         if mask_w>self.frame_w or mask_h>self.frame_h:
             # mask must not be larger than the video frame
             # so make it fit the whole image
@@ -419,6 +466,30 @@ class CameraStream:
         x2=x1+mask_w
         self.maskROI=(x1,x2,y1,y2)
 
+    def makeMaskFromPolygon(self,polygon):
+        '''
+        creates a mask from the arena boundary found by ArenaBoundary.py
+        the ROI is the polygon bounding rectangle, which need not be centred,
+        and edges outside the polygon are discarded
+        :param polygon: list of [x,y] vertices in frame pixels
+        :return: Nothing
+        '''
+        if polygon==self.maskPolygon: return    # called every update
+
+        pts=np.array(polygon,dtype=np.int32)
+        pts[:,0]=np.clip(pts[:,0],0,self.frame_w-1)
+        pts[:,1]=np.clip(pts[:,1],0,self.frame_h-1)
+        x,y,w,h=cv2.boundingRect(pts)
+
+        polyMask=np.zeros((h,w),dtype=np.uint8)
+        cv2.fillPoly(polyMask,[pts-(x,y)],255)
+
+        # convertBGR() checks the shapes match so the order matters less
+        self.maskROI=(x,x+w,y,y+h)
+        self.polyMask=polyMask
+        self.maskPolygon=polygon
+        self.mask_w,self.mask_h=w,h
+
 
     def getMaskSize(self):
         '''
@@ -455,6 +526,79 @@ class CameraStream:
         '''
         self.stopped = True
 
+class ReplayStream(CameraStream):
+    '''
+    A CameraStream which plays back a recorded video file instead of using a
+    live camera. Frames are delivered at the recording frame rate, resized to
+    the requested size if necessary, and the file loops so detection code can
+    be run and tested without a camera.
+    '''
+
+    def __init__(self, size, path, fps=None, loop=True):
+        '''
+        :param size: tuple (w,h) frames are resized to this if needed
+        :param path: video file to play
+        :param fps: playback rate, default is the rate stored in the file
+        :param loop: True to rewind at the end of the file
+        '''
+        assert os.path.isfile(path),"ReplayStream: no such file "+str(path)
+        self.fps=fps
+        self.loop=loop
+        CameraStream.__init__(self,size,path)
+
+    def setCAP(self,CAP,Value):
+        '''
+        Camera properties don't apply to a recording
+        :return: False
+        '''
+        return False
+
+    def collectBGR(self):
+        '''
+        Thread to deliver the file frames in real time
+        :return:
+        '''
+        fps=self.fps or self.stream.get(cv2.CAP_PROP_FPS) or 10
+        interval=1.0/fps
+        nextFrame=time.time()
+
+        while not self.stopped:
+            (grabbed,BGR) = self.stream.read()
+
+            if not grabbed:
+                if not self.loop:
+                    print("Replay finished")
+                    return
+                self.stream.set(cv2.CAP_PROP_POS_FRAMES,0)
+                continue
+
+            if (BGR.shape[1],BGR.shape[0])!=(self.frame_w,self.frame_h):
+                BGR=cv2.resize(BGR,(self.frame_w,self.frame_h))
+
+            with self.BGRlock:
+                self.BGRcam = BGR
+                self.BGRcamTime = time.time()
+
+            nextFrame+=interval
+            delay=nextFrame-time.time()
+            if delay>0:
+                time.sleep(delay)
+            else:
+                nextFrame=time.time()   # running late, don't try to catch up
+
+
+def openCamera(size, source=0):
+    '''
+    Open a live camera or, if source is the name of a video file, replay it
+
+    :param size: tuple (w,h) of the video frame
+    :param source: int camera index or video file name
+    :return: CameraStream or ReplayStream
+    '''
+    if isinstance(source,str) and os.path.isfile(source):
+        return ReplayStream(size,source)
+    return CameraStream(size,source)
+
 if __name__ == "__main__":
 
     cam=CameraStream((1920,1080))
@@ -0,0 +1,194 @@
+'''
+CameraCalibration.py
+
+Utility to calibrate the camera lens and the arena geometry so that robot
+positions are accurate right out to the edges of a wide angle camera image.
+
+Two steps, either can be done on its own:
+
+1. Lens. Hold a printed chessboard (CHESSBOARD_SIZE inner corners, squares
+   CHESSBOARD_SQUARE mm) in front of the camera at different positions and
+   angles and press 'c' to capture each view. After at least MIN_VIEWS
+   views press 'k' to calculate the camera matrix and distortion.
+
+2. Arena. Click the four corners of the arena in the order top left, top
+   right, bottom right, bottom left - or press 'b' to use the corners of the
+   ARENA_MASK_POLYGON saved by ArenaBoundary.py, shrunk by the
+   ARENA_BOUNDARY_MARGIN it was grown by. The corners are matched to
+   ARENA_SIZE_MM to give the homography from (undistorted) pixels to mm.
+
+Press 's' to save to Settings.json or 'q' to quit.
+
+With several cameras (see MultiCamera.py) give the camera's position in the
+CAMERAS list on the command line, e.g. 'python CameraCalibration.py 1'. The
+results are then saved in that CAMERAS entry and the homography should map
+to the shared arena coordinates - click the corners of the part of the arena
+that camera sees and set ARENA_SIZE_MM for it, or edit the target corners.
+
+The results are used by ArenaMapping.py. If no homography is saved
+ArenaProcessing.py carries on using CAMERA_SCALE.
+'''
+
+import sys
+import cv2
+import numpy as np
+from Params import *
+from ArenaMapping import ArenaMapper
+from ArenaBoundary import growPolygon
+
+MIN_VIEWS=10
+PREVIEW_WIDTH=960
+
+
+def findChessboard(gray,boardSize):
+    '''
+    Locate the chessboard inner corners to sub pixel accuracy
+
+    :param gray: grayscale image
+    :param boardSize: tuple (cols,rows) of inner corners
+    :return: corners array or None
+    '''
+    found,corners=cv2.findChessboardCorners(gray,boardSize,None)
+    if not found: return None
+    criteria=(cv2.TERM_CRITERIA_EPS+cv2.TERM_CRITERIA_MAX_ITER,30,0.001)
+    return cv2.cornerSubPix(gray,corners,(11,11),(-1,-1),criteria)
+
+
+def calibrateLens(views,boardSize,square,imageSize):
+    '''
+    Calculate the camera intrinsics from a list of chessboard views
+
+    :param views: list of corner arrays from findChessboard()
+    :param boardSize: tuple (cols,rows) inner corners
+    :param square: chessboard square size in mm
+    :param imageSize: tuple (w,h)
+    :return: rms error, camera matrix, distortion coefficients
+    '''
+    cols,rows=boardSize
+    board=np.zeros((cols*rows,3),np.float32)
+    board[:,:2]=np.mgrid[0:cols,0:rows].T.reshape(-1,2)*square
+
+    rms,K,D,rvecs,tvecs=cv2.calibrateCamera([board]*len(views),views,imageSize,None,None)
+    return rms,K,D
+
+
+def orderCorners(points):
+    '''
+    Sort four points into top left, top right, bottom right, bottom left
+
+    :param points: four (x,y) points in any order
+    :return: numpy float32 array of 4 points
+    '''
+    pts=np.asarray(points,dtype=np.float32).reshape(-1,2)
+    s=pts.sum(axis=1)
+    d=pts[:,1]-pts[:,0]
+    return np.array([pts[np.argmin(s)],pts[np.argmin(d)],pts[np.argmax(s)],pts[np.argmax(d)]],dtype=np.float32)
+
+
+def arenaHomography(corners,arenaSize,mapper):
+    '''
+    Homography from undistorted pixels to arena millimetres
+
+    :param corners: four pixel corners TL,TR,BR,BL
+    :param arenaSize: tuple (w,h) in mm
+    :param mapper: ArenaMapper holding the lens calibration (may be uncalibrated)
+    :return: 3x3 numpy array
+    '''
+    w,h=arenaSize
+    target=np.array([(0,0),(w,0),(w,h),(0,h)],dtype=np.float64)
+    H,mask=cv2.findHomography(mapper.undistort(corners),target)
+    return H
+
+
+if __name__ == "__main__":
+
+    readParams()
+
+    # calibrating one of several cameras?
+    cameraNumber=int(sys.argv[1]) if len(sys.argv)>1 else None
+    if cameraNumber is None:
+        target=Params
+        source=0
+    else:
+        target=getParam(PARAM_CAMERAS)[cameraNumber]
+        source=target[PARAM_CAMERA_SOURCE]
+
+    cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH,Params[PARAM_FRAME_WIDTH])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT,Params[PARAM_FRAME_HEIGHT])
+
+    boardSize=tuple(getParam(PARAM_CHESSBOARD_SIZE))
+    mapper=ArenaMapper(None if cameraNumber is None else target)
+    views=[]
+    clicks=[]
+    previewScale=1.0
+
+    def onMouse(event,x,y,flags,param):
+        if event==cv2.EVENT_LBUTTONDOWN and len(clicks)<4:
+            clicks.append((x/previewScale,y/previewScale))
+            if len(clicks)==4:
+                mapper.homography=arenaHomography(clicks,getParam(PARAM_ARENA_SIZE_MM),mapper)
+                print("Arena homography calculated")
+
+    cv2.namedWindow("calibration")
+    cv2.setMouseCallback("calibration",onMouse)
+
+    print("'c' capture chessboard, 'k' calibrate lens, click corners or 'b' use boundary, 'x' clear corners, 's' save, 'q' quit")
+
+    while True:
+        ret,scene=cap.read()
+        if not ret: continue
+
+        h,w=scene.shape[:2]
+        previewScale=PREVIEW_WIDTH/w
+        preview=cv2.resize(scene,(PREVIEW_WIDTH,int(h*previewScale)))
+        for x,y in clicks:
+            cv2.circle(preview,(int(x*previewScale),int(y*previewScale)),5,(0,255,255),2)
+        cv2.putText(preview,"views {0} lens {1} arena {2}".format(len(views),
+                    "ok" if mapper.cameraMatrix is not None else "-",
+                    "ok" if mapper.isCalibrated() else "-"),(10,30),cv2.FONT_HERSHEY_SIMPLEX,0.8,(0,255,0),2)
+        cv2.imshow("calibration",preview)
+
+        key=cv2.waitKey(1) & 0xFF
+
+        if key==ord('q'):
+            break
+        elif key==ord('c'):
+            corners=findChessboard(cv2.cvtColor(scene,cv2.COLOR_BGR2GRAY),boardSize)
+            if corners is None:
+                print("Chessboard not found")
+            else:
+                views.append(corners)
+                print("Captured view",len(views))
+        elif key==ord('k'):
+            if len(views)<MIN_VIEWS:
+                print("Need at least",MIN_VIEWS,"views")
+                continue
+            rms,K,D=calibrateLens(views,boardSize,getParam(PARAM_CHESSBOARD_SQUARE),(w,h))
+            print("Lens calibrated, rms error {0:.3f} pixels".format(rms))
+            mapper.cameraMatrix,mapper.distCoeffs=K,D.ravel()
+            if len(clicks)==4:
+                mapper.homography=arenaHomography(clicks,getParam(PARAM_ARENA_SIZE_MM),mapper)
+        elif key==ord('b'):
+            polygon=getParam(PARAM_ARENA_MASK_POLYGON)
+            if polygon is None or len(polygon)!=4:
+                print("ARENA_MASK_POLYGON needs exactly 4 corners, run ArenaBoundary.py or click the corners")
+                continue
+            # the mask was grown by the margin, the homography needs the boundary itself
+            outline=growPolygon(polygon,-getParam(PARAM_ARENA_BOUNDARY_MARGIN),(w,h))
+            clicks[:]=[tuple(p) for p in orderCorners(outline)]
+            mapper.homography=arenaHomography(clicks,getParam(PARAM_ARENA_SIZE_MM),mapper)
+        elif key==ord('x'):
+            clicks.clear()
+            mapper.homography=None
+        elif key==ord('s'):
+            if mapper.cameraMatrix is not None:
+                target[PARAM_CAMERA_MATRIX]=mapper.cameraMatrix.tolist()
+                target[PARAM_DIST_COEFFS]=mapper.distCoeffs.tolist()
+            if mapper.isCalibrated():
+                target[PARAM_ARENA_HOMOGRAPHY]=mapper.homography.tolist()
+            saveParams()
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
@@ -0,0 +1,260 @@
+"""
+DetectionLog.py
+
+A compact binary log of every robot detection for analysis after a game -
+possession time, distance travelled etc. - without recording video.
+
+Each detection is a fixed size record (RECORD) appended to the file. The
+file is divided into blocks of INDEX_EVERY record slots and the first slot
+of each block is an index record (id INDEX_ID) holding the time and frame
+seq at that point. The index is read by striding through the file, a small
+fraction of it, and a time range query then only reads the blocks it needs. The reader memory-maps the
+file and returns NumPy structured arrays, a whole day of detections loads in
+milliseconds.
+
+At 30 fps and 8 robots the log grows by about 25MB an hour. A partly
+written record at the end (e.g. after a power cut) is ignored and is
+overwritten when logging resumes.
+
+file layout:
+    header      HEADER_BYTES, magic, record size and INDEX_EVERY
+    records     slot 0, INDEX_EVERY, 2*INDEX_EVERY... are index records
+
+typical usage:
+    log=DetectionLog("arena.dlog")
+    log.write(seq,captureTime,robots,confidence)    # each frame
+    log.close()
+
+    reader=DetectionLogReader("arena.dlog")
+    d=reader.query(start,end,botId=3)
+    print(d["time"],d["x"],d["y"])
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+MAGIC=b"PXDLOG01"
+HEADER_BYTES=64
+INDEX_EVERY=1024        # one index record per block of this many slots
+INDEX_ID=-1             # id of an index record
+NO_HEADING=-1           # heading not known, the direction indicator wasn't found
+FLUSH_INTERVAL=1.0      # seconds between writes to the file
+
+RECORD=np.dtype([
+    ("seq","<u4"),          # frame sequence number
+    ("time","<f8"),         # time.time() the frame was captured
+    ("id","<i2"),           # robot id or INDEX_ID
+    ("heading","<i2"),      # degrees or NO_HEADING
+    ("x","<f4"),            # mm
+    ("y","<f4"),
+    ("confidence","<f4")    # 0-1 see Robot.getConfidence()
+])
+HEADER=np.dtype([("magic","S8"),("recordSize","<u4"),("indexEvery","<u4"),("created","<f8")])
+
+
+def readHeader(f):
+    '''
+    :param f: file open for binary reading
+    :return: header as a numpy record or None if the file is empty
+    :raises: ValueError if it isn't a detection log
+    '''
+    data=f.read(HEADER_BYTES)
+    if len(data)==0: return None
+    if len(data)<HEADER_BYTES:
+        raise ValueError("DetectionLog: file too short")
+    header=np.frombuffer(data[:HEADER.itemsize],HEADER)[0]
+    if header["magic"]!=MAGIC or header["recordSize"]!=RECORD.itemsize:
+        raise ValueError("DetectionLog: not a detection log or a different version")
+    return header
+
+
+class DetectionLog:
+    '''
+    Appends detections to a log file
+    '''
+
+    def __init__(self,fname,indexEvery=INDEX_EVERY):
+        '''
+        Open the log, creating it if it doesn't exist
+
+        :param fname: log file name
+        :param indexEvery: slots per block, only used for a new file
+        '''
+        self.fname=fname
+        self.f=open(fname,"a+b")
+        self.f.seek(0)
+        header=readHeader(self.f)
+        if header is None:
+            header=np.zeros(1,HEADER)
+            header[0]=(MAGIC,RECORD.itemsize,indexEvery,time.time())
+            self.f.write(header.tobytes().ljust(HEADER_BYTES,b"\0"))
+            header=header[0]
+        self.indexEvery=int(header["indexEvery"])
+
+        # drop a partly written record
+        self.slots=(self.f.seek(0,os.SEEK_END)-HEADER_BYTES)//RECORD.itemsize
+        self.f.truncate(HEADER_BYTES+self.slots*RECORD.itemsize)
+
+        self.pending=[]         # arrays waiting to be written
+        self.lastFlush=time.time()
+        self.written=0          # detections written
+
+    def write(self,seq,captureTime,robots,confidence=None):
+        '''
+        Log the robots found in one frame
+
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param robots: dict robots[botId]=(x,y,heading) as sent by ArenaWorker
+        :param confidence: dict confidence[botId]=0-1 or None
+        :return: Nothing
+        '''
+        bots=[(botId,pos) for botId,pos in robots.items() if botId is not None]
+        if not bots: return
+
+        # make room for any index records which fall among these
+        first=self.slots
+        n=0
+        found=0
+        while found<len(bots):
+            if (first+n)%self.indexEvery!=0: found+=1
+            n+=1
+        records=np.zeros(n,RECORD)
+        records["seq"]=seq
+        records["time"]=captureTime
+        isIndex=np.arange(first,first+n)%self.indexEvery==0
+        records["id"][isIndex]=INDEX_ID
+
+        detections=records[~isIndex]
+        detections["id"]=[botId for botId,pos in bots]
+        detections["x"]=[pos[0] for botId,pos in bots]
+        detections["y"]=[pos[1] for botId,pos in bots]
+        detections["heading"]=[NO_HEADING if pos[2] is None else pos[2] for botId,pos in bots]
+        if confidence is not None:
+            detections["confidence"]=[confidence.get(botId,0.0) for botId,pos in bots]
+        records[~isIndex]=detections
+
+        self.pending.append(records)
+        self.slots+=n
+        self.written+=len(bots)
+        if time.time()-self.lastFlush>=FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write the pending records to the file
+
+        :return: Nothing
+        '''
+        if self.pending:
+            self.f.write(np.concatenate(self.pending).tobytes())
+            self.f.flush()
+            self.pending=[]
+        self.lastFlush=time.time()
+
+    def close(self):
+        if self.f.closed: return
+        self.flush()
+        self.f.close()
+
+    def stats(self):
+        '''
+        :return: dict detections written and the file size in bytes
+        '''
+        return {"written":self.written,"bytes":HEADER_BYTES+self.slots*RECORD.itemsize}
+
+
+class DetectionLogReader:
+    '''
+    Memory-maps a log for queries. Records written after it was opened are
+    not seen, open another reader to see them.
+    '''
+
+    def __init__(self,fname):
+        '''
+        :param fname: log file name
+        :raises: ValueError if it isn't a detection log
+        '''
+        with open(fname,"rb") as f:
+            header=readHeader(f)
+        if header is None:
+            raise ValueError("DetectionLog: empty file")
+        self.indexEvery=int(header["indexEvery"])
+        self.created=float(header["created"])
+
+        slots=(os.path.getsize(fname)-HEADER_BYTES)//RECORD.itemsize
+        if slots==0:
+            self.records=np.zeros(0,RECORD)
+        else:
+            self.records=np.memmap(fname,RECORD,"r",HEADER_BYTES,(slots,))
+        self.index=self.records[::self.indexEvery]     # a view, nothing is read yet
+
+    def __len__(self):
+        return len(self.records)-len(self.index)
+
+    def find(self,t):
+        '''
+        Binary search the index for the block then the block for the record
+
+        :param t: time.time() value
+        :return: int slot of the first record at or after t
+        '''
+        block=max(int(np.searchsorted(self.index["time"],t,"left"))-1,0)
+        lo=block*self.indexEvery
+        return lo+int(np.searchsorted(self.records["time"][lo:lo+self.indexEvery],t,"left"))
+
+    def query(self,start=None,end=None,botId=None):
+        '''
+        The detections in a time range
+
+        :param start: time.time() value or None for the beginning
+        :param end: time.time() value (not included) or None for the end
+        :param botId: int to return one robot only or None for all
+        :return: numpy structured array of RECORD, a copy
+        '''
+        first=0 if start is None else self.find(start)
+        last=len(self.records) if end is None else self.find(end)
+        if last<=first: return np.zeros(0,RECORD)
+
+        chunk=self.records[first:last]
+        keep=chunk["id"]!=INDEX_ID
+        if botId is not None:
+            keep&=chunk["id"]==botId
+        return np.array(chunk[keep])
+
+    def timeRange(self):
+        '''
+        :return: tuple (first,last) capture times or None if the log is empty
+        '''
+        if len(self.records)==0: return None
+        return float(self.records["time"][0]),float(self.records["time"][-1])
+
+
+def distanceTravelled(detections):
+    '''
+    An example analysis
+
+    :param detections: structured array from query() for one robot
+    :return: float mm, jumps of more than 500mm between frames are ignored as misidentifications
+    '''
+    if len(detections)<2: return 0.0
+    steps=np.hypot(np.diff(detections["x"]),np.diff(detections["y"]))
+    return float(steps[steps<500].sum())
+
+
+########################################################################
+#
+# Manual Testing
+#
+
+if __name__ == "__main__":
+    # python DetectionLog.py arena.dlog
+    reader=DetectionLogReader(sys.argv[1] if len(sys.argv)>1 else "arena.dlog")
+    t=time.perf_counter()
+    d=reader.query()
+    print(len(d),"detections loaded in",round(1000*(time.perf_counter()-t),1),"ms")
+    for botId in np.unique(d["id"]):
+        bot=d[d["id"]==botId]
+        print("robot",botId,"seen in",len(bot),"frames, travelled",int(distanceTravelled(bot)),"mm")
@@ -0,0 +1,228 @@
+"""
+H264Stream.py
+
+A low bandwidth alternative to the MJPEG stream for busy WiFi.
+
+The frames, with the robots drawn on after scaling, are piped into an ffmpeg process which encodes them as
+H.264 in an MPEG-TS container. Everyone watching gets the same bytes so there
+is one encoder however many viewers there are, and it only runs while
+somebody is watching. Browsers don't play MPEG-TS directly, use VLC, ffplay
+or mpv e.g.
+
+    ffplay http://<pi address>:8000/h264_feed
+
+Frames are handed to the encoder thread through a small queue. If the
+encoder falls behind the oldest frames are dropped, detection and the MJPEG
+streams never wait for it. The encoder is fed at a steady H264_FPS, repeating
+the last frame if no new one has arrived.
+
+ffmpeg must be installed (sudo apt install ffmpeg). On a Raspberry Pi set
+H264_CODEC to "h264_v4l2m2m" to use the hardware encoder.
+
+typical usage:
+    h264=H264Stream()
+    # the thread collecting frames
+    if h264.hasClients():
+        h264.publish(frame,overlay)
+    # a Flask route
+    return Response(h264.generate(),mimetype="video/mp2t")
+"""
+
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import cv2
+from Stats import RateMeter
+from Overlay import drawOverlay,StaticLayer
+
+FFMPEG="ffmpeg"
+H264_CODEC="libx264"
+H264_WIDTH=640
+H264_FPS=15
+H264_BITRATE="400k"
+FRAME_QUEUE_SIZE=2      # frames waiting for the encoder
+CLIENT_QUEUE_SIZE=64    # chunks of encoded video waiting to be sent to a viewer
+CHUNK_SIZE=188*64       # bytes, a whole number of MPEG-TS packets
+CLIENT_TIMEOUT=1.0      # seconds a viewer waits before checking again
+
+
+class H264Stream:
+
+    def __init__(self,width=H264_WIDTH,fps=H264_FPS,bitrate=H264_BITRATE):
+        '''
+        :param width: int pixels, frames are scaled to this width
+        :param fps: int frames per second sent to the encoder
+        :param bitrate: ffmpeg bitrate string e.g. "400k"
+        '''
+        self.width=width
+        self.fps=fps
+        self.bitrate=bitrate
+
+        self.frames=queue.Queue(FRAME_QUEUE_SIZE)
+        self.lock=threading.Lock()
+        self.clients=[]         # a queue of encoded chunks for each viewer
+        self.encoder=None       # thread feeding ffmpeg
+
+        self.framesDropped=0
+        self.chunksDropped=0    # not sent to a slow viewer
+        self.encoded=RateMeter()
+        self.bytesOut=RateMeter()
+
+    def isAvailable(self):
+        '''
+        :return: True if ffmpeg is installed
+        '''
+        return shutil.which(FFMPEG) is not None
+
+    def hasClients(self):
+        '''
+        :return: True if anyone is watching
+        '''
+        return len(self.clients)>0
+
+    def publish(self,frame,overlay):
+        '''
+        Queue a frame for the encoder, dropping the oldest if it is busy
+
+        :param frame: numpy BGR image, not changed afterwards
+        :param overlay: the robots to draw on it, see Overlay.py
+        :return: Nothing
+        '''
+        while True:
+            try:
+                self.frames.put_nowait((frame,overlay))
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.framesDropped+=1
+                except queue.Empty:
+                    pass
+
+    def startEncoder(self,size):
+        '''
+        Start ffmpeg and the thread reading from it
+
+        :param size: tuple (w,h) of the frames to be encoded
+        :return: the ffmpeg Popen
+        '''
+        w,h=size
+        cmd=[FFMPEG,"-loglevel","error",
+             "-f","rawvideo","-pix_fmt","bgr24","-s","{0}x{1}".format(w,h),"-r",str(self.fps),"-i","-",
+             "-c:v",H264_CODEC,"-b:v",self.bitrate,"-g",str(self.fps),"-pix_fmt","yuv420p"]
+        if H264_CODEC=="libx264":
+            cmd+=["-preset","ultrafast","-tune","zerolatency"]
+        cmd+=["-f","mpegts","-"]
+
+        process=subprocess.Popen(cmd,stdin=subprocess.PIPE,stdout=subprocess.PIPE)
+        print("H264Stream: encoding",size,"at",self.fps,"fps")
+
+        t=threading.Thread(target=self.sendChunks,args=(process,),name="h264 send")
+        t.daemon=True
+        t.start()
+        return process
+
+    def encodeFrames(self):
+        '''
+        Thread feeding ffmpeg at a steady frame rate whilst anyone is watching
+
+        :return: when the last viewer has gone
+        '''
+        interval=1.0/self.fps
+        layer=StaticLayer()
+        process=None
+        size=None
+        frame=None
+        nextTime=time.time()
+        try:
+            while True:
+                with self.lock:
+                    if not self.clients:
+                        self.encoder=None
+                        break
+                try:
+                    latest,overlay=self.frames.get(timeout=interval)
+                    h,w=latest.shape[:2]
+                    if size is None:
+                        # x264 needs even dimensions
+                        size=(self.width//2*2,int(h*self.width/w)//2*2)
+                        process=self.startEncoder(size)
+                    frame=cv2.resize(latest,size,interpolation=cv2.INTER_LINEAR)
+                    drawOverlay(frame,overlay,size[0]/w,layer)
+                except queue.Empty:
+                    pass    # repeat the last frame
+                if frame is None: continue
+
+                # keep to the frame rate ffmpeg was told
+                delay=nextTime-time.time()
+                if delay>0: time.sleep(delay)
+                nextTime=max(nextTime+interval,time.time()-interval)
+
+                process.stdin.write(frame.tobytes())
+                self.encoded.add()
+        except (BrokenPipeError,ValueError,OSError) as e:
+            print("H264Stream: encoder stopped",e)
+            with self.lock:
+                self.encoder=None
+        finally:
+            if process is not None:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+                process.terminate()
+
+    def sendChunks(self,process):
+        '''
+        Thread passing ffmpeg's output to every viewer
+
+        :param process: the ffmpeg Popen
+        :return: when ffmpeg stops
+        '''
+        while True:
+            chunk=process.stdout.read1(CHUNK_SIZE)
+            if not chunk: break
+            self.bytesOut.add(len(chunk))
+            with self.lock:
+                clients=list(self.clients)
+            for q in clients:
+                try:
+                    q.put_nowait(chunk)
+                except queue.Full:
+                    # the player will recover at the next key frame
+                    self.chunksDropped+=1
+        process.wait()
+
+    def generate(self):
+        '''
+        Generate the video stream for one viewer, starting the encoder if needed
+
+        :return: Nothing, yields MPEG-TS bytes
+        '''
+        q=queue.Queue(CLIENT_QUEUE_SIZE)
+        with self.lock:
+            self.clients.append(q)
+            if self.encoder is None:
+                self.encoder=threading.Thread(target=self.encodeFrames,name="h264 encode")
+                self.encoder.daemon=True
+                self.encoder.start()
+        try:
+            while True:
+                try:
+                    yield q.get(timeout=CLIENT_TIMEOUT)
+                except queue.Empty:
+                    if self.encoder is None: break  # encoder failed
+        finally:
+            # the viewer has gone, the encoder stops after the last one
+            with self.lock:
+                self.clients.remove(q)
+
+    def stats(self):
+        '''
+        :return: dict viewers, frames encoded per second, bytes per second sent to each viewer and drops
+        '''
+        return {"clients":len(self.clients),"encodesPerSec":self.encoded.read(),
+                "bytesPerSecPerViewer":self.bytesOut.read(),
+                "framesDropped":self.framesDropped,"chunksDropped":self.chunksDropped}
@@ -0,0 +1,448 @@
+"""
+LoadTest.py
+
+Finds how many loc/getAllRobots queries a second ArenaManager can answer,
+and whether answering them slows detection down, before an event rather
+than during one.
+
+An arena is run in this process exactly as ArenaManager.py runs it - its
+detection worker process, PositionPublisher and MQTT command handling -
+usually from a video file so the same frames are seen every run. The
+simulated game controllers send {"cmd":"getAllRobots","replyTo":...} and
+the simulated robots send {"cmd":"loc","botId":n,"replyTo":...} on
+pixelbot/arena, each at a steady
+rate from its own MQTT connection, and time the replies.
+
+By default the broker is LocalBroker, a minimal stand-in started in this
+process on a free port, so nothing else needs to be running. --broker
+host:port uses a real broker (e.g. the Mosquitto the event will use)
+instead, which includes the broker's own cost.
+
+First the detection fps is measured with no queries, then for each rate
+in --rate the queries are sent for --seconds and the replies per second,
+latency percentiles, lost queries, detection fps and the cpu use of the
+front end (this process) are printed:
+
+    rate  queries/s  replies/s   lost   p50ms   p90ms   p99ms   maxms   fps  front cpu%
+    none          0          0      0       -       -       -       -  24.1        9.5
+      10        120        118      0     1.9     3.2     6.8    12.4  24.0       14.2
+      50        600        590      1     2.4     5.1    11.0    25.3  23.2       31.8
+
+Each simulated client asks for its replies on its own replyTo topic, e.g.
+pixelbot/loadtest/robot-3, so it never sees another's. A reply answers only
+the oldest of the client's queries still waiting, so a reply which was
+coalesced by MqttManager with a newer one (only the latest for a topic is
+kept) leaves a query unanswered rather than answering it early. A query
+with no reply after REPLY_TIMEOUT seconds is lost. loc is only answered for
+robots which are seen, so the simulated robots ask for the ids which were
+seen in every frame for the last STEADY seconds of the warm up, several
+robots asking for the same id if there are more simulated robots than
+robots seen. A robot which drops out of view has its queries answered late,
+when it is seen again, so use a video in which the robots are detected
+steadily.
+
+typical usage:
+    python LoadTest.py --camera match.avi --controllers 4 --robots 8 --rate 5,10,20,50
+"""
+
+import argparse
+import collections
+import json
+import socket
+import struct
+import threading
+import time
+import paho.mqtt.client as paho
+import MqttManager
+from ArenaManager import Arena
+from ArenaWorker import STATS_INTERVAL
+from Stats import CpuMeter
+
+REPLY_TIMEOUT=2.0   # seconds before a query without a reply is lost
+WARMUP=6            # seconds for the camera and detection to settle
+STEADY=2            # seconds at the end of the warm up a robot must be seen throughout
+PHASE_SECONDS=20    # default seconds at each rate
+
+
+########################################################################
+#
+# The broker stand-in
+#
+
+def readLength(sock):
+    '''
+    :return: the MQTT variable length "remaining length" field
+    '''
+    multiplier,value=1,0
+    while True:
+        b=readBytes(sock,1)[0]
+        value+=(b&127)*multiplier
+        multiplier*=128
+        if not b&128: return value
+
+
+def readBytes(sock,n):
+    buf=b""
+    while len(buf)<n:
+        data=sock.recv(n-len(buf))
+        if not data: raise EOFError
+        buf+=data
+    return buf
+
+
+def encodeLength(n):
+    out=bytearray()
+    while True:
+        b=n%128
+        n//=128
+        if n: b|=128
+        out.append(b)
+        if not n: return bytes(out)
+
+
+class LocalBroker:
+    '''
+    Just enough of an MQTT 3.1.1 broker for the load test - connect,
+    subscribe with wildcards, QoS 0 publish, retained messages and ping - on
+    127.0.0.1, one thread per client.
+    '''
+
+    def __init__(self,port=0):
+        '''
+        :param port: int, 0 for any free port
+        '''
+        self.server=socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        self.server.bind(("127.0.0.1",port))
+        self.server.listen(32)
+        self.port=self.server.getsockname()[1]
+        self.clients={}         # clients[socket]=set of topic filters
+        self.retained={}        # retained[topic]=payload
+        self.lock=threading.Lock()
+        t=threading.Thread(target=self.accept,name="broker")
+        t.daemon=True
+        t.start()
+
+    def accept(self):
+        while True:
+            try:
+                client,_=self.server.accept()
+            except OSError:
+                return          # closed
+            client.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            t=threading.Thread(target=self.serve,args=(client,),name="broker client")
+            t.daemon=True
+            t.start()
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for client in self.clients:
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.clients.clear()
+
+    def send(self,client,packet):
+        try:
+            client.sendall(packet)
+        except OSError:
+            pass
+
+    def serve(self,client):
+        '''
+        Handle one client's packets until it disconnects
+        '''
+        try:
+            while True:
+                header=readBytes(client,1)[0]
+                body=readBytes(client,readLength(client))
+                packetType=header>>4
+                if packetType==1:       # CONNECT
+                    with self.lock: self.clients[client]=set()
+                    self.send(client,b"\x20\x02\x00\x00")
+                elif packetType==3:     # PUBLISH
+                    self.publish(header,body)
+                elif packetType==8:     # SUBSCRIBE
+                    self.subscribe(client,body)
+                elif packetType==12:    # PINGREQ
+                    self.send(client,b"\xd0\x00")
+                elif packetType==14:    # DISCONNECT
+                    break
+        except (EOFError,OSError):
+            pass
+        finally:
+            with self.lock: self.clients.pop(client,None)
+            client.close()
+
+    def publish(self,header,body):
+        n=struct.unpack(">H",body[:2])[0]
+        topic=body[2:2+n].decode()
+        start=2+n+(2 if (header>>1)&3 else 0)   # skip the packet id if QoS>0
+        payload=body[start:]
+        if header&1:
+            self.retained[topic]=payload
+        packet=b"\x30"+encodeLength(2+n+len(payload))+body[:2+n]+payload
+        with self.lock:
+            subscribers=[c for c,filters in self.clients.items()
+                         if any(paho.topic_matches_sub(f,topic) for f in filters)]
+        for client in subscribers:
+            self.send(client,packet)
+
+    def subscribe(self,client,body):
+        packetId=body[:2]
+        i=2
+        granted=bytearray()
+        while i<len(body):
+            n=struct.unpack(">H",body[i:i+2])[0]
+            topicFilter=body[i+2:i+2+n].decode()
+            i+=3+n                                  # and the requested QoS
+            with self.lock: self.clients[client].add(topicFilter)
+            granted.append(0)
+            for topic,payload in list(self.retained.items()):
+                if paho.topic_matches_sub(topicFilter,topic):
+                    t=topic.encode()
+                    self.send(client,b"\x31"+encodeLength(2+len(t)+len(payload))+struct.pack(">H",len(t))+t+payload)
+        self.send(client,b"\x90"+encodeLength(2+len(granted))+packetId+bytes(granted))
+
+
+########################################################################
+#
+# The simulated controllers and robots
+#
+
+class SimulatedClient:
+    '''
+    A controller or robot sending one query at a steady rate on its own
+    connection and timing the replies
+    '''
+
+    def __init__(self,name,host,port,commandTopic,replyTopic,query):
+        '''
+        :param name: str MQTT client id
+        :param host: broker address
+        :param port: broker port
+        :param commandTopic: str e.g. "pixelbot/arena"
+        :param replyTopic: str topic the replies come back on
+        :param query: dict sent each time
+        '''
+        self.commandTopic=commandTopic
+        self.replyTopic=replyTopic
+        self.payload=json.dumps(query)
+        self.interval=None      # seconds between queries, None when idle
+
+        self.lock=threading.Lock()
+        self.pending=collections.deque()    # send times of queries waiting for a reply
+        self.reset()
+
+        self.subscribed=threading.Event()
+        self.mqttc=paho.Client(client_id=name)
+        self.mqttc.on_connect=lambda c,o,f,rc:c.subscribe(replyTopic,0)
+        self.mqttc.on_subscribe=lambda c,o,mid,q:self.subscribed.set()
+        self.mqttc.on_message=self.on_reply
+        self.mqttc.connect(host,port)
+        self.mqttc.loop_start()
+
+        t=threading.Thread(target=self.sendLoop,name=name)
+        t.daemon=True
+        t.start()
+
+    def reset(self):
+        '''
+        Start counting again
+
+        :return: Nothing
+        '''
+        with self.lock:
+            self.sent=0
+            self.answered=0
+            self.lost=0
+            self.pending.clear()
+            self.latencies=[]
+
+    def setRate(self,rate):
+        '''
+        :param rate: float queries per second, 0 to stop
+        '''
+        self.interval=1.0/rate if rate>0 else None
+
+    def sendLoop(self):
+        nextTime=time.perf_counter()
+        while True:
+            interval=self.interval
+            if interval is None:
+                time.sleep(0.05)
+                nextTime=time.perf_counter()
+                continue
+            delay=nextTime-time.perf_counter()
+            if delay>0: time.sleep(delay)
+            nextTime=max(nextTime+interval,time.perf_counter()-interval)
+            now=time.perf_counter()
+            with self.lock:
+                self.expire(now)
+                self.pending.append(now)
+                self.sent+=1
+            self.mqttc.publish(self.commandTopic,self.payload)
+
+    def expire(self,now):
+        '''
+        Count the queries which have waited too long as lost. Called holding the lock.
+        '''
+        while self.pending and now-self.pending[0]>REPLY_TIMEOUT:
+            self.pending.popleft()
+            self.lost+=1
+
+    def on_reply(self,mqttc,obj,msg):
+        # the replies come in the order of the queries, each answers the oldest waiting
+        now=time.perf_counter()
+        with self.lock:
+            self.expire(now)
+            if self.pending:
+                self.latencies.append(now-self.pending.popleft())
+                self.answered+=1
+
+    def results(self):
+        '''
+        :return: tuple (sent,answered,lost,latencies) since reset()
+        '''
+        with self.lock:
+            self.expire(time.perf_counter())
+            return self.sent,self.answered,self.lost,list(self.latencies)
+
+    def close(self):
+        self.interval=None
+        self.mqttc.loop_stop()
+        self.mqttc.disconnect()
+
+
+def percentile(values,p):
+    '''
+    :param values: sorted list
+    :param p: 0-100
+    :return: the value p percent of the way through, None if there are none
+    '''
+    if not values: return None
+    return values[min(len(values)-1,int(len(values)*p/100))]
+
+
+def measure(arena,seconds):
+    '''
+    Run for a while sampling the detection fps and front end cpu
+
+    :return: tuple (average detection fps, front end cpu %)
+    '''
+    cpu=CpuMeter()
+    samples=[]
+    end=time.time()+seconds
+    while time.time()<end:
+        time.sleep(min(STATS_INTERVAL,max(end-time.time(),0)))
+        samples.append(arena.workerStats.get("fps",0))
+    return sum(samples)/max(len(samples),1),cpu.read()
+
+
+def report(rate,clients,seconds,fps,cpu):
+    sent=answered=lost=0
+    latencies=[]
+    for client in clients:
+        s,a,l,lat=client.results()
+        sent+=s
+        answered+=a
+        lost+=l
+        latencies+=lat
+    latencies.sort()
+
+    def ms(p):
+        v=percentile(latencies,p)
+        return "-" if v is None else "{0:.1f}".format(1000*v)
+
+    print("{0:>6} {1:>10.0f} {2:>10.0f} {3:>6} {4:>7} {5:>7} {6:>7} {7:>7} {8:>5.1f} {9:>10.1f}".format(
+        rate,sent/seconds,answered/seconds,lost,ms(50),ms(90),ms(99),ms(100),fps,cpu))
+
+
+########################################################################
+#
+# main
+#
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Load test the ArenaManager MQTT queries")
+    parser.add_argument("--camera",default=0,help="camera index or video file")
+    parser.add_argument("--settings",default="Settings.json",help="settings profile")
+    parser.add_argument("--topic",default="pixelbot/",help="arena MQTT topic prefix")
+    parser.add_argument("--controllers",type=int,default=2,help="simulated game controllers sending getAllRobots")
+    parser.add_argument("--robots",type=int,default=8,help="simulated robots sending loc")
+    parser.add_argument("--rate",default="5,10,20",help="queries per second from each, comma separated to step up")
+    parser.add_argument("--seconds",type=float,default=PHASE_SECONDS,help="seconds at each rate")
+    parser.add_argument("--broker",default=None,help="host:port of a real broker instead of the stand-in")
+    args=parser.parse_args()
+
+    camera=int(args.camera) if str(args.camera).isdigit() else args.camera
+    rates=[float(r) for r in args.rate.split(",")]
+
+    # the detection process is started before any network threads
+    arena=Arena({"name":"loadtest","camera":camera,"settings":args.settings,"topic":args.topic})
+
+    broker=None
+    if args.broker is None:
+        broker=LocalBroker()
+        host,port="127.0.0.1",broker.port
+    else:
+        host,_,port=args.broker.partition(":")
+        port=int(port) if port else 1883
+    MqttManager.mqttBroker,MqttManager.mqttPort=host,port
+    MQTT=MqttManager.MQTT()
+    arena.start(MQTT)
+
+    print("warming up for",WARMUP,"seconds")
+    time.sleep(WARMUP-STEADY)
+    steady=None
+    end=time.time()+STEADY
+    while time.time()<end:
+        seen=set(arena.robots.get().robots)
+        steady=seen if steady is None else steady&seen
+        time.sleep(0.02)
+    ids=sorted(botId for botId in steady if botId is not None)
+    if args.robots and not ids:
+        print("no robots are detected, the loc queries won't be answered")
+    print("robots detected",ids)
+
+    Strings=arena.Strings
+    # each has its own reply topic so a reply is only counted by the client it was for
+    clients=[]
+    for i in range(args.controllers):
+        replyTopic="{0}loadtest/controller-{1}".format(Strings.mainTopic,i)
+        clients.append(SimulatedClient("loadtest-controller-{0}".format(i),host,port,Strings.arenaTopic,replyTopic,
+                                       {Strings.cmd:Strings.getAllRobots,Strings.replyTo:replyTopic}))
+    for i in range(args.robots):
+        botId=ids[i%len(ids)] if ids else i+1
+        replyTopic="{0}loadtest/robot-{1}".format(Strings.mainTopic,i)
+        clients.append(SimulatedClient("loadtest-robot-{0}".format(i),host,port,Strings.arenaTopic,replyTopic,
+                                       {Strings.cmd:Strings.loc,Strings.botId:botId,Strings.replyTo:replyTopic}))
+    for client in clients:
+        client.subscribed.wait(REPLY_TIMEOUT)
+
+    print("{0:>6} {1:>10} {2:>10} {3:>6} {4:>7} {5:>7} {6:>7} {7:>7} {8:>5} {9:>10}".format(
+        "rate","queries/s","replies/s","lost","p50ms","p90ms","p99ms","maxms","fps","front cpu%"))
+    fps,cpu=measure(arena,args.seconds)
+    report("none",clients,args.seconds,fps,cpu)
+
+    coalesced=MQTT.stats()["coalesced"]
+    for rate in rates:
+        for client in clients:
+            client.reset()
+            client.setRate(rate)
+        fps,cpu=measure(arena,args.seconds)
+        for client in clients:
+            client.setRate(0)
+        time.sleep(REPLY_TIMEOUT)       # let the last replies arrive
+        report("{0:g}".format(rate),clients,args.seconds,fps,cpu)
+        mqtt=MQTT.stats()
+        print("       replies replaced by a newer one before they were sent",mqtt["coalesced"]-coalesced)
+        coalesced=mqtt["coalesced"]
+
+    for client in clients:
+        client.close()
+    arena.stop()
+    if broker is not None:
+        broker.close()
@@ -9,28 +9,57 @@ mqttc.setCallback(which,target_function)
 
 mqttc.publish(topic,payload
 
+publishPayload() never blocks. Messages wait in a queue which is emptied by
+a publisher thread so a slow or disconnected broker can't hold up the
+caller. Only the latest message for each topic is kept - the robots only
+want the newest positions - and if MAX_JOBS topics are waiting the oldest
+is dropped. Messages which must all be sent, e.g. events, are published
+with coalesce=False. stats() reports the queue depth, drops and publish latency.
+
+Incoming messages are only received for the topics which have a handler,
+addHandler(topic,handler), not everything on the broker. The network thread
+just hands each message to a small pool of threads which decode the JSON
+payload and call the handler with the dict, so a slow handler or a burst of
+commands doesn't hold up the network. If MAX_MESSAGES are already waiting
+for a thread new ones are dropped, and counted, rather than piling up.
+
+Connecting doesn't hold up startup. PAHO's network thread makes the
+connection in the background and, if the broker goes away (e.g. restarted
+mid-game), keeps retrying, waiting RECONNECT_MIN doubling up to
+RECONNECT_MAX seconds between attempts. The topics are subscribed again
+each time it connects. Whilst disconnected publishes wait in the queue,
+still only the latest for each topic, and are sent when it reconnects.
+
 """
 
 import paho.mqtt.client as paho
-import sys
 import time
 import logging
+import threading
+import collections
+import json
+from concurrent.futures import ThreadPoolExecutor
+from Stats import RateMeter,TimeMeter
 
 
 # todo - allow access to connected humber broker
 mqttBroker = 'localhost'    # mqtt.connectedhumber.org
+mqttPort = 1883
 mqttClientUser = None       #
 mqttClientPassword = None   #
 
-mqttConnectTimeout=20	    # only checked on startup
+mqttConnectTimeout=5	    # seconds startup waits for the broker before carrying on without it
 mqttKeepAlive=60		    # client pings server if no messages have been sent in this time period.
 MAX_MESSAGE_NUMBER=9999
-MAX_JOBS=200                # job backlog
+MAX_JOBS=200                # job backlog, topics waiting to be published
+MESSAGE_WORKERS=2           # threads decoding and handling incoming messages
+MAX_MESSAGES=200            # incoming messages waiting for a worker, more are dropped
+RECONNECT_MIN=1             # seconds between reconnect attempts, doubling each time
+RECONNECT_MAX=30
 
 
 class MQTT():
 
-    topic='#'
     mqttc=paho.Client()
 
     om_message_callback=None    # function to call
@@ -38,6 +67,29 @@ class MQTT():
     def __init__(self,on_message_callback=None):
 
         self.on_message_callback=on_message_callback
+        self.brokerConnected=False
+        self.connected=threading.Event()
+        self.connects=0
+        self.topics=set()       # subscribed with subscribe()
+        self.handlers={}        # handlers[topic]=function(msgDic), see addHandler()
+        self.workers=ThreadPoolExecutor(MESSAGE_WORKERS,thread_name_prefix="mqtt message")
+        self.received=RateMeter()
+        self.badMessages=0
+        self.messagesWaiting=0  # submitted to the workers and not yet handled
+        self.messagesDropped=0
+        self.messagesLock=threading.Lock()
+
+        # messages waiting to be published, latest for each topic
+        self.jobs=collections.OrderedDict()  # jobs[topic]=(topic,payload,retain,time queued)
+        self.jobNumber=0        # keeps messages which aren't coalesced apart
+        self.jobsReady=threading.Condition()
+        self.dropped=0
+        self.coalesced=0
+        self.published=RateMeter()
+        self.latency=TimeMeter()
+        t=threading.Thread(target=self.publishJobs,name="mqtt publish")
+        t.daemon=True
+        t.start()
 
         # connect to the mqtt broker or bust
         # the following method logs any errors
@@ -53,13 +105,26 @@ class MQTT():
     def on_connect(self,mqttc, obj, flags, rc):
 
         if rc==0:
+            topics=self.topics|set(self.handlers)
+            logging.info("on_connect(): callback ok, subscribing to Topics: %s",topics)
+            for topic in topics:
+                mqttc.subscribe(topic, 0)
+            self.connects+=1
             self.brokerConnected=True
-            logging.info("on_connect(): callback ok, subscribing to Topic: %s",self.topic)
-            mqttc.subscribe(self.topic, 0)
+            self.connected.set()
+            # send anything queued whilst disconnected
+            with self.jobsReady:
+                self.jobsReady.notify()
         else:
             self.brokerConnected=False
             logging.info("on_connect(): callback error rc=%s",str(rc))
 
+    def on_disconnect(self,mqttc,obj,rc):
+        self.brokerConnected=False
+        self.connected.clear()
+        if rc!=0:
+            logging.warning("on_disconnect(): lost the broker rc=%s, reconnecting",str(rc))
+
     #####################################
     #
     def set_on_message_callback(self,callback):
@@ -71,26 +136,150 @@ class MQTT():
     #
     # subscribes to the topic and sets the callback
     # function
+    # if not connected the topic is subscribed when the connection is made
     def subscribe(self,topic,on_message_callback):
-        if not self.brokerConnected: self.connectToBroker()
-        if not self.brokerConnected:
-            logging.error("subscribe(): Unable to connect to broker")
-            return False
-        self.mqttc.subscribe(topic, 0)
+        self.topics.add(topic)
         self.on_message_callback=on_message_callback
+        if self.brokerConnected:
+            self.mqttc.subscribe(topic, 0)
         return True
 
+    def addHandler(self,topic,handler):
+        '''
+        Subscribe to a topic and have its messages passed to a handler
+
+        The handler is called on a worker thread, not the network thread,
+        with the decoded JSON payload. Messages which aren't JSON are logged
+        and ignored.
+
+        :param topic: str e.g. "pixelbot/arena"
+        :param handler: function(msgDic)
+        :return: Nothing
+        '''
+        self.handlers[topic]=handler
+        self.mqttc.message_callback_add(topic,self.on_handled_message)
+        if self.brokerConnected:
+            self.mqttc.subscribe(topic, 0)
+
+    def on_handled_message(self,mqttc,obj,msg):
+        # on the network thread, do as little as possible
+        self.received.add()
+        with self.messagesLock:
+            if self.messagesWaiting>=MAX_MESSAGES:
+                self.messagesDropped+=1
+                return
+            self.messagesWaiting+=1
+        self.workers.submit(self.handleMessage,msg)
+
+    def handleMessage(self,msg):
+        '''
+        Decode a message and call its handler, on a worker thread
+
+        :param msg: paho MQTTMessage
+        :return: Nothing
+        '''
+        try:
+            self.callHandler(msg)
+        finally:
+            with self.messagesLock:
+                self.messagesWaiting-=1
+
+    def callHandler(self,msg):
+        '''
+        The body of handleMessage(), which keeps the count of messages waiting
 
-    def publishPayload(self,topic,payload):
+        :param msg: paho MQTTMessage
+        :return: Nothing
+        '''
+        handler=self.handlers.get(msg.topic)
+        if handler is None:
+            # subscribed with a wildcard
+            for topic,h in list(self.handlers.items()):
+                if paho.topic_matches_sub(topic,msg.topic):
+                    handler=h
+                    break
+            else:
+                return
+        try:
+            msgDic=json.loads(msg.payload)
+        except ValueError:
+            self.badMessages+=1
+            logging.warning("handleMessage(): %s payload is not json %s",msg.topic,msg.payload[:40])
+            return
+        try:
+            handler(msgDic)
+        except Exception:
+            logging.exception("handleMessage(): handler for %s failed",msg.topic)
+
+
+    def publishPayload(self,topic,payload,retain=False,coalesce=True):
         '''
         meant to be called from outside
+
+        Queues the message and returns straight away, it replaces any message
+        for the same topic which is still waiting, keeping its place in the
+        queue so a busy topic isn't held back.
+
         :param topic:
         :param payload:
+        :param retain: True for the broker to keep it for new subscribers
+        :param coalesce: False to send it even if there's a newer message for the topic
         :return:
         '''
 
         #print("MqttManager: Publish to ",topic,payload)
-        self.mqttc.publish(topic,payload)
+        with self.jobsReady:
+            key=topic
+            if not coalesce:
+                self.jobNumber+=1
+                key=(topic,self.jobNumber)
+            if key in self.jobs:
+                self.coalesced+=1
+            elif len(self.jobs)>=MAX_JOBS:
+                self.jobs.popitem(last=False)
+                self.dropped+=1
+            self.jobs[key]=(topic,payload,retain,time.perf_counter())
+            self.jobsReady.notify()
+
+    def publishJobs(self):
+        '''
+        The publisher thread, passes the queued messages to paho oldest first
+        whilst connected to the broker
+
+        :return: Nothing, runs forever
+        '''
+        while True:
+            with self.jobsReady:
+                while not self.jobs or not self.brokerConnected:
+                    self.jobsReady.wait()
+                key,(topic,payload,retain,queued)=self.jobs.popitem(last=False)
+            try:
+                info=self.mqttc.publish(topic,payload,retain=retain)
+            except Exception as e:
+                logging.error("publishJobs(): publish to %s failed %s",topic,e)
+                continue
+            if info.rc==paho.MQTT_ERR_NO_CONN:
+                # disconnected meanwhile, keep it for the reconnect unless there's a newer one
+                with self.jobsReady:
+                    if key not in self.jobs:
+                        self.jobs[key]=(topic,payload,retain,queued)
+                        self.jobs.move_to_end(key,last=False)
+                continue
+            self.latency.add(time.perf_counter()-queued)
+            self.published.add()
+
+    def stats(self):
+        '''
+        :return: dict messages waiting, dropped, replaced by a newer one, published per second
+                 and the time from publishPayload() to paho accepting them, messages received
+                 per second, those waiting for a worker, dropped because too many were waiting
+                 and those which weren't json, whether connected and how many times
+        '''
+        return {"queued":len(self.jobs),"dropped":self.dropped,"coalesced":self.coalesced,
+                "publishedPerSec":self.published.read(),"latency":self.latency.read(),
+                "receivedPerSec":self.received.read(),"messagesWaiting":self.messagesWaiting,
+                "messagesDropped":self.messagesDropped,"badMessages":self.badMessages,
+                "connected":self.brokerConnected,"connects":self.connects}
 
     ################################
     #
@@ -118,14 +307,17 @@ class MQTT():
     # connectToBroker
     #
     #
+    # starts connecting in the background and waits up to mqttConnectTimeout
+    # seconds for the connection, returns True if connected. Startup can carry
+    # on if not, paho keeps trying.
+    #
     def connectToBroker(self):
 
-        self.brokerConnected=False
-
         logging.info("connectToBroker(): Trying to connect to the MQTT broker")
 
         # calls may be redirected
         self.mqttc.on_connect = self.on_connect
+        self.mqttc.on_disconnect = self.on_disconnect
         self.mqttc.on_subscribe = self.on_subscribe
         self.mqttc.on_message = self.on_message
 
@@ -136,16 +328,15 @@ class MQTT():
         else:
             logging.info("main(): not using MQTT autentication")
 
-        # terminate if the connection takes too long
-        # on_connect sets a global flag brokerConnected
+        # on_connect sets the connected event
         startConnect = time.time()
+        self.mqttc.reconnect_delay_set(min_delay=RECONNECT_MIN,max_delay=RECONNECT_MAX)
+        self.mqttc.connect_async(mqttBroker, mqttPort, keepalive=mqttKeepAlive)
         self.mqttc.loop_start()	# runs in the background, reconnects if needed
-        self.mqttc.connect(mqttBroker, keepalive=mqttKeepAlive)
 
-        while not self.brokerConnected:
-            if (time.time() - startConnect) > mqttConnectTimeout:
-                logging.error("connectToBroker(): broker on_connect time out (%ss)", mqttConnectTimeout)
-                return False
+        if not self.connected.wait(mqttConnectTimeout):
+            logging.error("connectToBroker(): no broker after %ss, carrying on, publishes are queued until it connects", mqttConnectTimeout)
+            return False
 
         logging.info("connectToBroker(): Connected to MQTT broker after %s s", int(time.time() - startConnect))
         return True
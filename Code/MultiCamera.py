@@ -0,0 +1,400 @@
+"""
+MultiCamera.py
+
+Lets several cameras cover one arena - a single 1920x1080 camera can't
+resolve the ID dots over a full size pitch.
+
+Each camera runs its own ArenaProcessor in a separate process, pinned to its
+own core where the OS allows it, and maps its detections into the shared
+arena coordinates with its own calibration (see CameraCalibration.py). The
+detections are merged here - a robot seen by two cameras in an overlap zone
+is reported once - and a combined preview image is made for streaming.
+
+MultiCameraProcessor has the same methods as ArenaProcessor which
+ArenaManager uses so either can be used.
+
+The cameras are listed in Settings.json:
+
+    "CAMERAS": [
+        {"SOURCE": 0, "ARENA_HOMOGRAPHY": [...], "CAMERA_MATRIX": [...], "DIST_COEFFS": [...]},
+        {"SOURCE": 1, ...}
+    ]
+
+Every camera must have an ARENA_HOMOGRAPHY (see CameraCalibration.py),
+without one a camera's detections would be in its own pixel frame scaled by
+CAMERA_SCALE and couldn't be merged with the others'.
+
+update() merges whichever cameras' results have arrived, waiting at most
+CAMERA_TIMEOUT for the first of them, the others' previous results are used.
+A camera which has stopped, or sent nothing for CAMERA_TIMEOUT, is left out
+until it sends again so its robots don't linger and its old capture time
+doesn't make every position look stale.
+
+SOURCE may be the name of a video file which is replayed instead of using a
+live camera - for testing run, with the CAMERAS calibrations:
+
+    python MultiCamera.py left.avi right.avi
+"""
+
+import os
+import sys
+import math
+import multiprocessing
+import multiprocessing.connection
+import time
+import cv2
+import numpy as np
+from Params import *
+from Decorators import FPS
+from Exceptions import *
+from Overlay import scaleOverlay,drawOverlay,emptyOverlay,StaticLayer
+
+PREVIEW_WIDTH=640       # each camera sends a preview this wide
+CAMERA_TIMEOUT=2.0      # seconds to wait for any camera before using the last results
+
+
+def cameraWorker(conn,size,camera,core,useSmallEDGES):
+    '''
+    Runs in a separate process. Detects robots seen by one camera and sends
+    a preview image and the detections back through the pipe.
+
+    Commands from MultiCameraProcessor arrive on the same pipe.
+
+    :param conn: multiprocessing Connection
+    :param size: tuple (w,h) video frame size
+    :param camera: dict, one entry from CAMERAS
+    :param core: int cpu to run on
+    :param useSmallEDGES: passed to ArenaProcessor
+    :return: when told to stop
+    '''
+    # import here so the camera is only opened in the worker process
+    from ArenaProcessing import ArenaProcessor
+
+    if hasattr(os,"sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0,{core})
+        except OSError as e:
+            print("Camera",camera[PARAM_CAMERA_SOURCE],"unable to set cpu affinity",e)
+
+    AP=ArenaProcessor(size,useSmallEDGES,camera[PARAM_CAMERA_SOURCE])
+    AP.mapper.setCalibration(camera)
+
+    w,h=size
+    halfDiagonal=math.hypot(w,h)/2
+
+    try:
+        while True:
+            while conn.poll():
+                cmd=conn.recv()
+                if cmd[0]=="stop":
+                    return
+                getattr(AP,cmd[0])(*cmd[1:])
+
+            frame=AP.update()
+            robots=AP.getRobots()
+
+            # robots near the centre of the image are measured more accurately
+            # than those at the edges, used to decide between cameras
+            detections=[]
+            for bot in AP.botsFound:
+                botId=bot.getId()
+                if botId not in robots: continue
+                x,y=bot.getLocation()
+                weight=1.0-math.hypot(x-w/2,y-h/2)/halfDiagonal
+                pos,heading=robots[botId]
+                detections.append((botId,pos,heading,weight,bot.getConfidence()))
+
+            aspect=PREVIEW_WIDTH/w
+            preview=cv2.resize(frame,(PREVIEW_WIDTH,int(h*aspect)),interpolation=cv2.INTER_LINEAR)
+            overlay=scaleOverlay(AP.getOverlay(),aspect)
+
+            seq,captureTime=AP.getFrameInfo()
+            conn.send((preview,detections,captureTime,overlay))
+
+    except (EOFError,BrokenPipeError):
+        pass    # MultiCameraProcessor has gone
+    finally:
+        AP.stop()
+
+
+def mergeDetections(detections,mergeDistance):
+    '''
+    Combine the detections from all the cameras
+
+    A robot id seen by more than one camera close to the same place is one
+    robot seen in an overlap zone, its position is averaged weighted by how
+    central it was in each camera. Otherwise the most central sighting wins.
+
+    :param detections: list of (botId,(x,y),heading,weight,confidence) from all cameras
+    :param mergeDistance: mm, sightings closer than this are the same robot
+    :return: dict allBots[botId]=(x,y),heading like ArenaProcessor.getRobots()
+    '''
+    byId={}
+    for d in detections:
+        byId.setdefault(d[0],[]).append(d)
+
+    allBots={}
+    for botId,sightings in byId.items():
+        sightings.sort(key=lambda d:d[3],reverse=True)
+        best=sightings[0]
+        bx,by=best[1]
+
+        sumW=sumX=sumY=0.0
+        for sightingId,(x,y),heading,weight,confidence in sightings:
+            if math.hypot(x-bx,y-by)>mergeDistance: continue
+            weight=max(weight,0.01)
+            sumW+=weight
+            sumX+=x*weight
+            sumY+=y*weight
+
+        allBots[best[0]]=(int(sumX/sumW),int(sumY/sumW)),best[2]
+
+    return allBots
+
+
+class MultiCameraProcessor:
+    '''
+    Drop in replacement for ArenaProcessor using several cameras
+    '''
+
+    def __init__(self,size,cameras,useSmallEDGES=False):
+        '''
+        Start a worker process for each camera
+
+        :param size: tuple (w,h) video frame size, the same for every camera
+        :param cameras: list of dicts, see CAMERAS in the module notes
+        :param useSmallEDGES: passed to each ArenaProcessor
+        '''
+        self.workers=[]     # first, __del__ needs it if a camera is rejected
+        for camera in cameras:
+            if camera.get(PARAM_ARENA_HOMOGRAPHY) is None:
+                raise ValueError("MultiCamera: camera {0} has no {1}, calibrate it with CameraCalibration.py"
+                                 .format(camera.get(PARAM_CAMERA_SOURCE),PARAM_ARENA_HOMOGRAPHY))
+        self.size=size
+        self.results=[]
+        self.robots={}
+        self.confidence={}
+        self.overlay=emptyOverlay()
+        self.frameSeq=0
+        self.captureTime=0
+        self.received={}        # received[camera]=time.time() its last result arrived
+        self.preview=None       # the last combined previews
+
+        cpus=os.cpu_count() or 1
+        for i,camera in enumerate(cameras):
+            parentConn,childConn=multiprocessing.Pipe()
+            p=multiprocessing.Process(target=cameraWorker,args=(childConn,size,camera,i%cpus,useSmallEDGES))
+            p.daemon=True
+            p.start()
+            self.workers.append((p,parentConn))
+            self.results.append(None)
+            print("MultiCamera: started camera",camera[PARAM_CAMERA_SOURCE],"on cpu",i%cpus)
+
+    def __del__(self):
+        self.stop()
+
+    def stop(self):
+        '''
+        Tell the camera processes to exit
+
+        :return: Nothing
+        '''
+        for p,conn in self.workers:
+            try:
+                conn.send(("stop",))
+            except (OSError,BrokenPipeError):
+                pass
+        for p,conn in self.workers:
+            p.join(CAMERA_TIMEOUT)
+        self.workers=[]
+
+    def sendAll(self,*cmd):
+        '''
+        Pass a command on to every camera's ArenaProcessor
+
+        :param cmd: method name followed by its arguments
+        :return: Nothing
+        '''
+        for p,conn in self.workers:
+            conn.send(cmd)
+
+    def combinePreviews(self):
+        '''
+        Put the camera previews side by side and move each camera's overlay
+        to where its preview is
+
+        :return: image
+        '''
+        results=[r for r in self.results if r is not None]
+        h=max(r[0].shape[0] for r in results)
+        padded=[]
+        robots=[]
+        versions=[]
+        shapes=[]
+        x=0
+        for preview,detections,captureTime,overlay in results:
+            padded.append(cv2.copyMakeBorder(preview,0,h-preview.shape[0],0,0,cv2.BORDER_CONSTANT))
+            moved=scaleOverlay(overlay,1.0,(x,0))
+            robots.extend(moved["robots"])
+            version,cameraShapes=moved["static"]
+            versions.append((x,version))
+            shapes.extend(cameraShapes)
+            x+=preview.shape[1]
+        # the combined static layer changes if any camera's does
+        self.overlay={"robots":robots,"static":(hash(tuple(versions)),shapes)}
+        return np.hstack(padded)
+
+    ##############################################################################
+    #
+    # the ArenaProcessor methods used by ArenaManager
+    #
+    ##############################################################################
+    @FPS
+    def update(self):
+        '''
+        Wait for a result from any camera and merge the latest from each
+
+        The cameras work on their next frame whilst this runs.
+
+        :return: numpy array the camera previews side by side
+        '''
+        live={}
+        for i,(p,conn) in enumerate(self.workers):
+            if p.is_alive():
+                live[conn]=i
+            elif self.results[i] is not None:
+                print("MultiCamera: camera",i,"has stopped")
+                self.results[i]=None
+
+        ready=multiprocessing.connection.wait(list(live),CAMERA_TIMEOUT)
+        for conn in ready:
+            # skip to the newest result if several are waiting
+            try:
+                while conn.poll():
+                    self.results[live[conn]]=conn.recv()
+                    self.received[live[conn]]=time.time()
+            except EOFError:
+                pass    # died since is_alive() was checked
+
+        # leave out a camera which has gone quiet rather than repeat its old robots
+        now=time.time()
+        for i,r in enumerate(self.results):
+            if r is not None and now-self.received[i]>CAMERA_TIMEOUT:
+                print("MultiCamera: camera",i,"has sent nothing for",CAMERA_TIMEOUT,"seconds, leaving it out")
+                self.results[i]=None
+
+        if ready:
+            self.frameSeq+=1
+        detections=[]
+        for r in self.results:
+            if r is not None:
+                detections.extend(r[1])
+
+        if all(r is None for r in self.results):
+            assert self.preview is not None,"MultiCamera: no camera has delivered an image"
+            self.robots={}
+            self.confidence={}
+            self.overlay=emptyOverlay()
+            return np.zeros_like(self.preview)
+
+        self.robots=mergeDetections(detections,getParam(PARAM_MERGE_DISTANCE))
+        self.confidence={}
+        for d in detections:
+            self.confidence[d[0]]=max(self.confidence.get(d[0],0.0),d[4])
+        # the positions are as old as the oldest camera frame used
+        self.captureTime=min(r[2] for r in self.results if r is not None)
+        self.preview=self.combinePreviews()
+        return self.preview
+
+    def getRobots(self):
+        '''
+        :return: dict allBots[botId]=(x,y),heading in shared arena mm
+        '''
+        return self.robots
+
+    def getConfidence(self):
+        '''
+        :return: dict confidence[botId]=0-1, the best of the cameras which saw it
+        '''
+        return self.confidence
+
+    def getFrameInfo(self):
+        '''
+        :return: tuple (count of the updates with a new result, capture time of the oldest camera frame used)
+        '''
+        return self.frameSeq,self.captureTime
+
+    def getOverlay(self):
+        '''
+        :return: dict robots etc. to draw on the combined preview, see Overlay.py
+        '''
+        return self.overlay
+
+    def setBotColor(self,botId,color):
+        self.sendAll("setBotColor",botId,color)
+
+    def enableCrosshairDisplay(self,on=False):
+        self.sendAll("enableCrosshairDisplay",on)
+
+    def enableMaskDisplay(self,on=False):
+        self.sendAll("enableMaskDisplay",on)
+
+    def enableScaleDisplay(self,on=False):
+        self.sendAll("enableScaleDisplay",on)
+
+    def startRecording(self,fname="output.avi",fps=10,raw=False):
+        '''
+        Each camera records its own full size video, fname with the camera
+        number added e.g. output_0.avi
+
+        :return: True, failures are reported by the camera processes
+        '''
+        base,ext=os.path.splitext(fname)
+        for i,(p,conn) in enumerate(self.workers):
+            conn.send(("startRecording","{0}_{1}{2}".format(base,i,ext),fps,raw))
+        return True
+
+    def stopRecording(self):
+        self.sendAll("stopRecording")
+
+    def getRecorderStats(self):
+        '''
+        :return: None, each camera process keeps its own recorder stats
+        '''
+        return None
+
+
+########################################################################
+#
+# Manual Testing
+#
+
+if __name__ == "__main__":
+    # python MultiCamera.py source1 source2 ...
+    # sources can be camera numbers or video files
+    readParams()
+    size=(Params[PARAM_FRAME_WIDTH],Params[PARAM_FRAME_HEIGHT])
+
+    cameras=getParam(PARAM_CAMERAS)
+    assert cameras,"No cameras in CAMERAS"
+    if len(sys.argv)>1:
+        # the sources replace those of the calibrated cameras in order
+        assert len(sys.argv)-1==len(cameras),"Give a source for each of the {0} CAMERAS".format(len(cameras))
+        cameras=[dict(camera,**{PARAM_CAMERA_SOURCE:int(s) if s.isdigit() else s})
+                 for camera,s in zip(cameras,sys.argv[1:])]
+
+    MC=MultiCameraProcessor(size,cameras)
+    layer=StaticLayer()
+
+    try:
+        while True:
+            outFrame=drawOverlay(MC.update(),MC.getOverlay(),1.0,layer)
+            print(MC.getRobots())
+            cv2.imshow("cameras",outFrame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    except Exception as e:
+        traceException(5)
+
+    MC.stop()
+    cv2.destroyAllWindows()
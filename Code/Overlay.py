@@ -0,0 +1,240 @@
+"""
+Overlay.py
+
+Draws the robot outlines, ID dots, direction indicators and ID numbers on a
+stream frame, along with the static annotations - crosshairs, the arena mask
+and the A4 scale rectangle.
+
+Detection no longer draws on the camera image. ArenaProcessor.getOverlay()
+describes what to draw, in the pixel coordinates of the camera frame, and
+the drawing is done afterwards on the frame actually being shown - usually
+one already scaled down for streaming. The coordinates are scaled once, the
+text is sized for the image it is drawn on so it stays readable, and nothing
+is drawn at all when nobody is watching.
+
+The static annotations only change when their settings do so they are drawn
+once into a StaticLayer - an image and an alpha mask the size of the frame -
+and copied onto each frame in one numpy operation on just the pixels they
+cover. More of them (goal zones, a grid...) cost nothing extra per frame.
+The layer is rebuilt when the overlay's static version or the image size
+changes.
+
+An overlay is a dict:
+    robots: list of dicts from describeRobots()
+    static: tuple (version,shapes), see shape()
+
+typical usage:
+    frame=AP.update()
+    overlay=AP.getOverlay()
+    layer=StaticLayer()         # keep one for each stream size
+    small=cv2.resize(frame,(640,360))
+    drawOverlay(small,overlay,640/frame.shape[1],layer)
+"""
+
+import cv2
+import numpy as np
+
+MIN_FONT_SCALE=0.6      # ID numbers are never drawn smaller than this
+ID_FONT_SCALE=2.0       # at full size (scale=1)
+
+
+def describeRobots(bots,botColors,dotR,dirR):
+    '''
+    Make the overlay for a list of detected robots
+
+    :param bots: list of Robot.robot
+    :param botColors: dict botColors[id]=color, robots not in it use their own color
+    :param dotR: ID dot radius in pixels
+    :param dirR: direction indicator radius in pixels
+    :return: list of dicts, one per robot, which can be pickled
+    '''
+    overlay=[]
+    for bot in bots:
+        botId=bot.getId()
+        contour=bot.getContour()
+        overlay.append({
+            "id":botId,
+            "color":botColors.get(botId,bot.color),
+            "textColor":bot.textColor,
+            "outline":None if contour is None else np.asarray(contour,dtype=np.float32).reshape(-1,2),
+            "centre":bot.getLocation(),
+            "director":bot.getDirector(),
+            "dots":list(bot.dotsFound.keys()),
+            "dotR":dotR,
+            "dirR":dirR
+        })
+    return overlay
+
+
+def shape(points,color,closed=True,thickness=1,fill=False,alpha=1.0):
+    '''
+    A static annotation
+
+    :param points: sequence of (x,y) in frame pixels
+    :param color: tuple (b,g,r)
+    :param closed: True to join the last point to the first
+    :param thickness: line thickness in pixels at the size drawn
+    :param fill: True to fill the polygon, e.g. a goal zone
+    :param alpha: 0-1 opacity
+    :return: dict
+    '''
+    return {"points":np.asarray(points,dtype=np.float32).reshape(-1,2),"color":color,
+            "closed":closed,"thickness":thickness,"fill":fill,"alpha":alpha}
+
+
+def emptyOverlay():
+    '''
+    :return: an overlay with nothing to draw
+    '''
+    return {"robots":[],"static":(0,[])}
+
+
+def scaleOverlay(overlay,scale,offset=(0,0)):
+    '''
+    Move an overlay to another image, e.g. a preview of the frame
+
+    :param overlay: dict, see the module notes
+    :param scale: float multiplier for the coordinates and sizes
+    :param offset: tuple (x,y) added after scaling
+    :return: new dict
+    '''
+    version,shapes=overlay["static"]
+    return {"robots":scaleRobots(overlay["robots"],scale,offset),
+            "static":(version,[dict(s,points=s["points"]*scale+np.float32(offset)) for s in shapes])}
+
+
+def scaleRobots(robots,scale,offset=(0,0)):
+    '''
+    :param robots: list from describeRobots()
+    :param scale: float multiplier for the coordinates and sizes
+    :param offset: tuple (x,y) added after scaling
+    :return: new list
+    '''
+    ox,oy=offset
+
+    def move(p):
+        return None if p is None else (p[0]*scale+ox,p[1]*scale+oy)
+
+    scaled=[]
+    for r in robots:
+        r=dict(r)
+        if r["outline"] is not None:
+            r["outline"]=r["outline"]*scale+np.float32((ox,oy))
+        r["centre"]=move(r["centre"])
+        r["director"]=move(r["director"])
+        r["dots"]=[move(d) for d in r["dots"]]
+        r["dotR"]=r["dotR"]*scale
+        r["dirR"]=r["dirR"]*scale
+        scaled.append(r)
+    return scaled
+
+
+class StaticLayer:
+    '''
+    The static annotations pre-drawn for one image size
+    '''
+
+    def __init__(self):
+        self.key=None
+        self.index=None     # flat indices of the pixels covered
+        self.pixels=None    # layer colours at those pixels
+        self.alpha=None     # opacity at those pixels, None if all opaque
+
+    def build(self,shapes,size,scale):
+        '''
+        Draw the shapes into a layer and alpha mask
+
+        :param shapes: list of dicts from shape()
+        :param size: tuple (w,h) of the images it will be used on
+        :param scale: float size of image compared to the full size frame
+        :return: Nothing
+        '''
+        w,h=size
+        layer=np.zeros((h,w,3),np.uint8)
+        alpha=np.zeros((h,w),np.uint8)
+        for s in shapes:
+            pts=[np.int32(np.round(s["points"]*scale))]
+            a=int(255*s["alpha"])
+            if s["fill"]:
+                cv2.fillPoly(layer,pts,s["color"])
+                cv2.fillPoly(alpha,pts,a)
+            else:
+                cv2.polylines(layer,pts,s["closed"],s["color"],s["thickness"])
+                cv2.polylines(alpha,pts,s["closed"],a,s["thickness"])
+
+        self.index=np.flatnonzero(alpha)
+        self.pixels=layer.reshape(-1,3)[self.index]
+        a=alpha.ravel()[self.index]
+        self.alpha=None if np.all(a==255) else (a.astype(np.float32)/255)[:,None]
+
+    def composite(self,image,static,scale=1.0):
+        '''
+        Put the static annotations on an image
+
+        :param image: numpy BGR image, contiguous, drawn on
+        :param static: tuple (version,shapes) from the overlay
+        :param scale: float size of image compared to the full size frame
+        :return: image
+        '''
+        version,shapes=static
+        if not shapes: return image
+
+        h,w=image.shape[:2]
+        key=(version,w,h,scale)
+        if key!=self.key:
+            self.build(shapes,(w,h),scale)
+            self.key=key
+
+        flat=image.reshape(-1,3)
+        if self.alpha is None:
+            flat[self.index]=self.pixels
+        else:
+            blended=flat[self.index]*(1-self.alpha)+self.pixels*self.alpha
+            flat[self.index]=blended.astype(np.uint8)
+        return image
+
+
+def drawOverlay(image,overlay,scale=1.0,layer=None):
+    '''
+    Draw the static annotations and the robots on an image
+
+    :param image: numpy BGR image, drawn on
+    :param overlay: dict from getOverlay() in the coordinates of the full size frame
+    :param scale: float size of image compared to the full size frame
+    :param layer: StaticLayer to reuse, keep one for each stream. If None the
+                  static annotations are drawn from scratch.
+    :return: image
+    '''
+    if not overlay: return image
+
+    if layer is None: layer=StaticLayer()
+    layer.composite(image,overlay["static"],scale)
+
+    robots=overlay["robots"]
+    if scale!=1.0:
+        robots=scaleRobots(robots,scale)
+
+    fontScale=max(MIN_FONT_SCALE,ID_FONT_SCALE*scale)
+    thickness=2 if fontScale>=1 else 1
+
+    for r in robots:
+        color=r["color"]
+        if r["outline"] is not None:
+            cv2.polylines(image,[np.int32(r["outline"])],True,color,2)  # True = isClosed
+
+        dotR=max(1,int(r["dotR"]))
+        for x,y in r["dots"]:
+            cv2.circle(image,(int(x),int(y)),dotR,color,1)
+
+        if r["director"] is not None:
+            x,y=r["director"]
+            cv2.circle(image,(int(x),int(y)),max(1,int(r["dirR"])),color,1)
+
+        if r["id"] is not None:
+            # centre the number on the robot
+            text=str(r["id"])
+            (tw,th),base=cv2.getTextSize(text,cv2.FONT_HERSHEY_SIMPLEX,fontScale,thickness)
+            x,y=r["centre"]
+            cv2.putText(image,text,(int(x-tw/2),int(y+th/2)),cv2.FONT_HERSHEY_SIMPLEX,fontScale,r["textColor"],thickness)
+
+    return image
@@ -55,6 +55,30 @@ PARAM_ARENA_MASK_SIZE="ARENA_MASK_SIZE"
 PARAM_SCALE_RECT_SIZE="SCALE_RECT_SIZE"
 PARAM_MIN_RAD_BOT="MIN_RAD_BOT"
 
+# arena boundary found by ArenaBoundary.py - polygon vertices in frame pixels
+# the score is the fraction of the polygon outline which lay on an edge at
+# calibration time and is used to spot camera drift on later runs
+PARAM_ARENA_MASK_POLYGON="ARENA_MASK_POLYGON"
+PARAM_ARENA_BOUNDARY_SCORE="ARENA_BOUNDARY_SCORE"
+PARAM_ARENA_BOUNDARY_MARGIN="ARENA_BOUNDARY_MARGIN"
+PARAM_ARENA_DRIFT_TOLERANCE="ARENA_DRIFT_TOLERANCE"
+
+# lens and arena calibration from CameraCalibration.py
+# if these are missing CAMERA_SCALE is used to convert pixels to mm
+PARAM_CAMERA_MATRIX="CAMERA_MATRIX"
+PARAM_DIST_COEFFS="DIST_COEFFS"
+PARAM_ARENA_HOMOGRAPHY="ARENA_HOMOGRAPHY"
+PARAM_ARENA_SIZE_MM="ARENA_SIZE_MM"
+PARAM_CHESSBOARD_SIZE="CHESSBOARD_SIZE"
+PARAM_CHESSBOARD_SQUARE="CHESSBOARD_SQUARE"
+
+# multiple cameras covering one arena, see MultiCamera.py
+# a list of dicts each with a SOURCE (camera index or video file) and
+# its own CAMERA_MATRIX, DIST_COEFFS and ARENA_HOMOGRAPHY
+PARAM_CAMERAS="CAMERAS"
+PARAM_CAMERA_SOURCE="SOURCE"
+PARAM_MERGE_DISTANCE="MERGE_DISTANCE"
+
 CV2_CAMERA_BRIGHTNESS=(cv2.CAP_PROP_BRIGHTNESS,PARAM_CAMERA_BRIGHTNESS)
 CV2_CAMERA_CONTRAST=(cv2.CAP_PROP_CONTRAST,PARAM_CAMERA_CONTRAST)
 CV2_CAMERA_SATURATION=(cv2.CAP_PROP_SATURATION,PARAM_CAMERA_SATURATION)
@@ -114,7 +138,19 @@ DefaultParams = {
     PARAM_EPSILON: 0.05,
     PARAM_ARENA_MASK_SCALE: 1,
     PARAM_ARENA_MASK_SIZE: (597, 420),  # W,H
-    PARAM_SCALE_RECT_SIZE:(297,210) # A4 target for camera scaling
+    PARAM_SCALE_RECT_SIZE:(297,210), # A4 target for camera scaling
+    PARAM_ARENA_MASK_POLYGON: None,  # None means use the centred ARENA_MASK_SIZE
+    PARAM_ARENA_BOUNDARY_SCORE: 0,
+    PARAM_ARENA_BOUNDARY_MARGIN: 10,    # pixels added around the detected boundary
+    PARAM_ARENA_DRIFT_TOLERANCE: 0.8,   # re-run ArenaBoundary.py if score falls below this fraction
+    PARAM_CAMERA_MATRIX: None,  # 3x3 camera intrinsics
+    PARAM_DIST_COEFFS: None,    # lens distortion coefficients
+    PARAM_ARENA_HOMOGRAPHY: None,   # 3x3 undistorted pixels to arena mm
+    PARAM_ARENA_SIZE_MM: (2000, 1400),  # W,H used to calibrate the homography
+    PARAM_CHESSBOARD_SIZE: (9, 6),  # inner corners of the calibration chessboard
+    PARAM_CHESSBOARD_SQUARE: 25,    # mm
+    PARAM_CAMERAS: None,    # None means a single camera
+    PARAM_MERGE_DISTANCE: 100   # mm, detections closer than this are the same robot
 }
 
 
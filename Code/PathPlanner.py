@@ -0,0 +1,487 @@
+"""
+PathPlanner.py
+
+Plans paths for robots sent to a target by the game controller, around the
+arena's fixed obstacles and the other robots, and publishes each robot's
+waypoints on its own topic, e.g. pixelbot/3/path:
+
+    {"path":[[x,y],...],"target":[x,y],"seq":1234,"time":1700000000.123,"planMs":1.8}
+
+The arena is divided into GRID_MM square cells. A cell is blocked if a robot
+centred there would hit an obstacle or the arena wall (the obstacles are
+grown by ROBOT_RADIUS) or another robot (a circle of 2*ROBOT_RADIUS around
+each of them). The fixed obstacles are worked out once, the robots each
+frame.
+
+Each path is planned with D* Lite. The first plan is an A* search, from the
+target back to the robot. After that, as the robots move, only the cells
+which have become blocked or free since the last frame and the robot's
+new position are passed to the planner, which repairs the part of the
+search they affect instead of starting again. The waypoints are the
+corners of the path, the robot drives straight between them. They are only
+published when they change, and an empty path when the robot arrives
+(within ARRIVED_MM), is cancelled, or can't reach the target ("path":null).
+A search which needs more than MAX_EXPANSIONS cells is carried on the next
+frame instead of holding up the other robots' plans, meanwhile
+{"status":"pending",...} without a path is published.
+
+A target outside the arena is refused. A plan whose robot hasn't been seen,
+or whose target has been unreachable, for PLAN_TIMEOUT seconds is dropped
+and an empty path with "expired":true published, so robots which have gone
+don't keep being planned for.
+
+Planning runs on its own thread so neither detection nor the MQTT commands
+wait for it. stats() reports the plans per second and the time they take.
+
+typical usage:
+    planner=PathPlanner(MQTT,"pixelbot/{0}/path",(2000,1400),obstacles)
+    planner.start()
+    planner.request(3,(1500,700))     # None cancels
+    planner.update(snapshot)          # each frame, see RobotSnapshot.py
+    planner.stop()
+"""
+
+import heapq
+import json
+import math
+import threading
+import time
+import cv2
+import numpy as np
+from ArenaGrid import cellOf,fillPolygon
+from Stats import RateMeter,TimeMeter
+
+ARENA_SIZE=(2000,1400)  # mm W,H if the arena config doesn't give one
+GRID_MM=40              # cell size
+ROBOT_RADIUS=60         # mm
+ARRIVED_MM=50           # a robot this close to its target has arrived
+MAX_EXPANSIONS=20000    # cells a plan may expand each frame
+PLAN_TIMEOUT=10         # seconds a robot may be unseen, or its target unreachable, before its plan is dropped
+INF=float("inf")
+# costs are whole numbers, 10 across a cell and 14 diagonally, so equal
+# priorities compare equal - with floats rounding can end a search early
+STRAIGHT=10
+DIAGONAL=14
+NEIGHBOURS=[(1,0,STRAIGHT),(-1,0,STRAIGHT),(0,1,STRAIGHT),(0,-1,STRAIGHT),
+            (1,1,DIAGONAL),(1,-1,DIAGONAL),(-1,1,DIAGONAL),(-1,-1,DIAGONAL)]
+
+
+def octile(a,b):
+    '''
+    :return: the cost between two cells moving in 8 directions with nothing in the way
+    '''
+    dx,dy=abs(a[0]-b[0]),abs(a[1]-b[1])
+    return STRAIGHT*max(dx,dy)+(DIAGONAL-STRAIGHT)*min(dx,dy)
+
+
+def circleOffsets(radius):
+    '''
+    :param radius: in cells
+    :return: list of (dc,dr) of the cells within radius of a cell
+    '''
+    r=int(math.ceil(radius))
+    return [(dc,dr) for dc in range(-r,r+1) for dr in range(-r,r+1) if dc*dc+dr*dr<=radius*radius]
+
+
+class OccupancyGrid:
+    '''
+    The cells of the arena and those blocked by the fixed obstacles
+    '''
+
+    def __init__(self,size=ARENA_SIZE,obstacles=None,cell=GRID_MM,radius=ROBOT_RADIUS):
+        '''
+        :param size: (W,H) arena mm
+        :param obstacles: list of polygons, each a list of (x,y) mm, or None
+        :param cell: int mm
+        :param radius: int robot radius mm
+        '''
+        self.cell=cell
+        self.cols=int(math.ceil(size[0]/cell))
+        self.rows=int(math.ceil(size[1]/cell))
+
+        grid=np.zeros((self.rows,self.cols),np.uint8)
+        for polygon in obstacles or ():
+            fillPolygon(grid,polygon,cell)
+        # grown by the robot radius, the walls too
+        r=max(int(math.ceil(radius/cell)),1)
+        kernel=cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(2*r+1,2*r+1))
+        grid=cv2.dilate(cv2.copyMakeBorder(grid,r,r,r,r,cv2.BORDER_CONSTANT,value=1),kernel)[r:-r,r:-r]
+        self.static={(int(c),int(r)) for r,c in zip(*np.nonzero(grid))}
+
+        self.footprint=circleOffsets(2*radius/cell)     # cells another robot blocks
+
+    def cellOf(self,x,y):
+        '''
+        :return: (col,row) of the cell containing a point, clamped to the arena
+        '''
+        c,r=cellOf(x,y,self.cell)
+        return (min(max(c,0),self.cols-1),min(max(r,0),self.rows-1))
+
+    def centre(self,cell):
+        '''
+        :return: (x,y) mm of the centre of a cell
+        '''
+        return (int((cell[0]+0.5)*self.cell),int((cell[1]+0.5)*self.cell))
+
+    def neighbours(self,cell):
+        '''
+        :return: list of (neighbour cell,cost) inside the arena
+        '''
+        c,r=cell
+        return [((c+dc,r+dr),cost) for dc,dr,cost in NEIGHBOURS
+                if 0<=c+dc<self.cols and 0<=r+dr<self.rows]
+
+    def robotCells(self,x,y):
+        '''
+        :return: set of the cells another robot centred at (x,y) mm blocks
+        '''
+        c,r=self.cellOf(x,y)
+        return {(c+dc,r+dr) for dc,dr in self.footprint
+                if 0<=c+dc<self.cols and 0<=r+dr<self.rows}
+
+
+class DStarLite:
+    '''
+    An incrementally repaired shortest path from a moving start to a fixed
+    goal over an OccupancyGrid (Koenig and Likhachev's D* Lite). Moving
+    into a blocked cell costs INF, moving out of one doesn't so a robot
+    which has ended up in one can still leave.
+    '''
+
+    def __init__(self,grid,start,goal,blocked):
+        '''
+        :param grid: OccupancyGrid
+        :param start: (col,row) the robot's cell
+        :param goal: (col,row) the target's cell
+        :param blocked: set of cells blocked by the other robots
+        '''
+        self.grid=grid
+        self.start=start
+        self.last=start
+        self.goal=goal
+        self.blocked=blocked
+        self.km=0
+        self.g={}
+        self.rhs={goal:0}
+        self.queue=[(self.key(goal),goal)]
+        self.expansions=0
+
+    def isBlocked(self,cell):
+        return cell in self.grid.static or cell in self.blocked
+
+    def key(self,cell):
+        m=min(self.g.get(cell,INF),self.rhs.get(cell,INF))
+        return (m+octile(self.start,cell)+self.km,m)
+
+    def updateCell(self,cell):
+        '''
+        Recalculate a cell's best cost to the goal from its neighbours'
+        '''
+        if cell!=self.goal:
+            best=INF
+            for n,cost in self.grid.neighbours(cell):
+                if not self.isBlocked(n):
+                    best=min(best,cost+self.g.get(n,INF))
+            self.rhs[cell]=best
+        if self.g.get(cell,INF)!=self.rhs.get(cell,INF):
+            heapq.heappush(self.queue,(self.key(cell),cell))     # old entries are skipped when popped
+
+    def computePath(self):
+        '''
+        Expand cells until the start's cost is known
+
+        :return: True if it finished, False if it stopped after MAX_EXPANSIONS and needs calling again
+        '''
+        g,rhs,queue=self.g,self.rhs,self.queue
+        expansions=0
+        while queue:
+            start=self.start
+            if not (queue[0][0]<self.key(start) or rhs.get(start,INF)!=g.get(start,INF)):
+                break
+            kOld,cell=heapq.heappop(queue)
+            gCell,rhsCell=g.get(cell,INF),rhs.get(cell,INF)
+            if gCell==rhsCell: continue     # already consistent, an old entry
+            kNew=self.key(cell)
+            if kOld<kNew:
+                heapq.heappush(queue,(kNew,cell))
+                continue
+            if expansions==MAX_EXPANSIONS:
+                heapq.heappush(queue,(kOld,cell))   # carried on next time
+                self.expansions+=expansions
+                return False
+            expansions+=1
+            if gCell>rhsCell:
+                g[cell]=rhsCell
+            else:
+                g[cell]=INF
+                self.updateCell(cell)
+            # moving into this cell from its neighbours now costs differently
+            for n,cost in self.grid.neighbours(cell):
+                self.updateCell(n)
+        self.expansions+=expansions
+        return True
+
+    def moveTo(self,start):
+        '''
+        :param start: (col,row) the robot's cell now
+        '''
+        if start!=self.start:
+            self.km+=octile(self.last,start)
+            self.last=start
+            self.start=start
+
+    def setBlocked(self,blocked):
+        '''
+        Tell the planner which cells the other robots block now
+
+        :param blocked: set of cells
+        :return: Nothing
+        '''
+        changed=self.blocked^blocked
+        self.blocked=blocked
+        for cell in changed:
+            # the cost of moving into it has changed
+            for n,cost in self.grid.neighbours(cell):
+                self.updateCell(n)
+
+    def path(self):
+        '''
+        :return: list of cells from the start to the goal or None if there isn't a way
+        '''
+        g=self.g
+        cell=self.start
+        if g.get(cell,INF)==INF and cell!=self.goal: return None
+        cells=[cell]
+        for _ in range(self.grid.cols*self.grid.rows):
+            if cell==self.goal: return cells
+            best,bestCost=None,INF
+            for n,cost in self.grid.neighbours(cell):
+                if self.isBlocked(n): continue
+                c=cost+g.get(n,INF)
+                if c<bestCost:
+                    best,bestCost=n,c
+            if best is None: return None
+            cell=best
+            cells.append(cell)
+        return None
+
+
+def corners(cells):
+    '''
+    :param cells: list of cells along a path
+    :return: the cells where it changes direction, and the last
+    '''
+    if len(cells)<3: return cells[1:]
+    points=[]
+    for a,b,c in zip(cells,cells[1:],cells[2:]):
+        if (b[0]-a[0],b[1]-a[1])!=(c[0]-b[0],c[1]-b[1]):
+            points.append(b)
+    points.append(cells[-1])
+    return points
+
+
+class Plan:
+    '''
+    One robot's journey to its target
+    '''
+
+    def __init__(self,target):
+        self.target=target
+        self.planner=None       # DStarLite once the robot has been seen
+        self.waypoints=None     # as last published
+        self.published=False    # the waypoints are what was last published
+        self.pending=False      # the search ran out of expansions
+        self.seen=time.time()   # when the robot was last seen, or the request if not yet
+        self.unreachableSince=None
+
+    def expired(self,now):
+        '''
+        :param now: time.time()
+        :return: True if the robot hasn't been seen, or the target reached, for PLAN_TIMEOUT seconds
+        '''
+        if now-self.seen>PLAN_TIMEOUT: return True
+        return self.unreachableSince is not None and now-self.unreachableSince>PLAN_TIMEOUT
+
+
+class PathPlanner:
+
+    def __init__(self,MQTT,topic,size=ARENA_SIZE,obstacles=None):
+        '''
+        :param MQTT: MqttManager.MQTT used to publish
+        :param topic: str format for each robot's path topic e.g. "pixelbot/{0}/path"
+        :param size: (W,H) arena mm
+        :param obstacles: list of polygons, each a list of (x,y) mm, or None
+        '''
+        self.MQTT=MQTT
+        self.topic=topic
+        self.size=size
+        self.grid=OccupancyGrid(size,obstacles)
+
+        self.lock=threading.Lock()
+        self.requests={}        # requests[botId]=target or None, waiting for the planner thread
+        self.snapshot=None      # latest RobotSnapshot
+        self.wake=threading.Event()
+        self.stopEvent=threading.Event()
+        self.plans={}           # plans[botId]=Plan, planner thread only
+
+        self.planned=RateMeter()
+        self.planTime=TimeMeter()
+        self.unreachable=0
+        self.pending=0
+        self.expired=0
+
+    def start(self):
+        t=threading.Thread(target=self.planLoop,name="path planner")
+        t.daemon=True
+        t.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        self.wake.set()
+
+    def request(self,botId,target):
+        '''
+        Send a robot to a target, never blocks
+
+        :param botId: int
+        :param target: (x,y) mm or None to cancel
+        :return: False if the target is outside the arena and was ignored, otherwise True
+        '''
+        if target is not None:
+            x,y=target
+            W,H=self.size
+            if not (0<=x<=W and 0<=y<=H): return False     # also catches nan
+        with self.lock:
+            self.requests[botId]=target
+        self.wake.set()
+        return True
+
+    def update(self,snapshot):
+        '''
+        Hand over the latest robot positions, never blocks
+
+        :param snapshot: RobotSnapshot
+        :return: Nothing
+        '''
+        self.snapshot=snapshot
+        if self.plans or self.requests:
+            self.wake.set()
+
+    def planLoop(self):
+        '''
+        The planner thread
+
+        :return: when stop() is called
+        '''
+        lastVersion=None
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            if self.stopEvent.is_set(): return
+
+            with self.lock:
+                requests,self.requests=self.requests,{}
+            for botId,target in requests.items():
+                if target is None:
+                    if self.plans.pop(botId,None) is not None:
+                        self.publish(botId,[])
+                else:
+                    self.plans[botId]=Plan(target)
+
+            now=time.time()
+            for botId,plan in list(self.plans.items()):
+                if plan.expired(now):
+                    del self.plans[botId]
+                    self.expired+=1
+                    self.publish(botId,[],target=plan.target,expired=True)
+
+            snapshot=self.snapshot
+            if snapshot is None or not self.plans: continue
+            if snapshot.version==lastVersion and not requests: continue
+            lastVersion=snapshot.version
+
+            footprints={botId:self.grid.robotCells(x,y) for botId,(x,y,heading) in snapshot.robots.items()
+                        if botId is not None}
+            for botId,plan in list(self.plans.items()):
+                if botId not in snapshot.robots: continue   # wait till it's seen
+                plan.seen=now
+                self.replan(botId,plan,snapshot,footprints)
+
+    def replan(self,botId,plan,snapshot,footprints):
+        '''
+        Bring a robot's path up to date and publish it if it has changed
+
+        :return: Nothing
+        '''
+        x,y=snapshot.robots[botId][:2]
+        if math.hypot(plan.target[0]-x,plan.target[1]-y)<=ARRIVED_MM:
+            del self.plans[botId]
+            self.publish(botId,[],snapshot,arrived=True)
+            return
+
+        blocked=set()
+        for other,cells in footprints.items():
+            if other!=botId: blocked|=cells
+        start=self.grid.cellOf(x,y)
+
+        began=time.perf_counter()
+        if plan.planner is None:
+            plan.planner=DStarLite(self.grid,start,self.grid.cellOf(*plan.target),blocked)
+        else:
+            plan.planner.moveTo(start)
+            plan.planner.setBlocked(blocked)
+        finished=plan.planner.computePath()
+        cells=plan.planner.path() if finished else None
+        seconds=time.perf_counter()-began
+        self.planTime.add(seconds)
+        self.planned.add()
+
+        if not finished:
+            # the search carries on from where it stopped next frame
+            if not plan.pending:
+                self.pending+=1
+                plan.pending=True
+                plan.published=False    # the path is published when it's found
+                self.publish(botId,None,snapshot,plan.target,seconds,pending=True)
+            return
+        plan.pending=False
+        if cells is None:
+            waypoints=None
+            if plan.unreachableSince is None: plan.unreachableSince=time.time()
+        else:
+            plan.unreachableSince=None
+            waypoints=[self.grid.centre(c) for c in corners(cells)]
+            if waypoints: waypoints[-1]=tuple(plan.target)
+        if waypoints!=plan.waypoints or not plan.published:
+            if waypoints is None: self.unreachable+=1
+            plan.waypoints=waypoints
+            plan.published=True
+            self.publish(botId,waypoints,snapshot,plan.target,seconds)
+
+    def publish(self,botId,waypoints,snapshot=None,target=None,seconds=None,arrived=False,pending=False,expired=False):
+        '''
+        :param waypoints: list of (x,y) mm, [] when there's nowhere to go, None if the target can't be reached
+        :param pending: True while the search is still going on, waypoints are left out
+        :param expired: True when the plan was dropped, see Plan.expired()
+        '''
+        reply={"status":"pending"} if pending else {"path":waypoints}
+        if target is not None: reply["target"]=target
+        if arrived: reply["arrived"]=True
+        if expired: reply["expired"]=True
+        if snapshot is not None:
+            reply["seq"]=snapshot.seq
+            reply["time"]=round(snapshot.captureTime,3)
+        if seconds is not None: reply["planMs"]=round(1000*seconds,2)
+        self.MQTT.publishPayload(self.topic.format(botId),json.dumps(reply),retain=True)
+
+    def stats(self):
+        '''
+        :return: dict robots with a target, not counting plans which have expired but not yet
+                 been dropped, plans per second, the time they took, how many times a target
+                 couldn't be reached, how many searches took more than one frame and how
+                 many plans were dropped
+        '''
+        now=time.time()
+        active=sum(1 for plan in list(self.plans.values()) if not plan.expired(now))
+        return {"active":active,"plansPerSec":self.planned.read(),"planTime":self.planTime.read(),
+                "unreachable":self.unreachable,"pending":self.pending,"expired":self.expired}
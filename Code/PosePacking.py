@@ -0,0 +1,133 @@
+"""
+PosePacking.py
+
+A compact fixed layout binary alternative to the JSON location payload for
+the robots' microcontrollers - no parsing, the bytes can be read straight
+into C structs. It is published alongside the JSON when an arena's config
+has "binary":True (see PositionPublisher.py).
+
+All values are little endian (as on the ESP8266/ESP32), no padding:
+
+    header, HEADER_BYTES=14
+        offset 0   uint8    version, POSE_VERSION
+        offset 1   uint8    number of robot records which follow
+        offset 2   uint32   frame seq
+        offset 6   float64  time.time() the frame was captured
+    each robot, RECORD_BYTES=8
+        offset 0   uint8    robot id
+        offset 1   int16    x mm
+        offset 3   int16    y mm
+        offset 5   uint16   heading degrees 0-359, NO_HEADING if not known
+        offset 7   uint8    confidence 0-255 (0-1 scaled)
+
+8 robots take 78 bytes compared with about 220 as JSON. In Python encoding
+takes about as long as json.dumps() (both a few microseconds), the savings
+are in the bytes sent over the WiFi and the parsing on the robots.
+
+In C:
+
+    #pragma pack(push,1)
+    typedef struct {uint8_t version; uint8_t count; uint32_t seq; double time;} PoseHeader;
+    typedef struct {uint8_t id; int16_t x; int16_t y; uint16_t heading; uint8_t confidence;} PoseRecord;
+    #pragma pack(pop)
+
+decode() is the reference decoder. For the benchmark against JSON run:
+
+    python PosePacking.py
+"""
+
+import json
+import struct
+import timeit
+
+POSE_VERSION=1
+NO_HEADING=0xFFFF
+HEADER=struct.Struct("<BBId")
+RECORD=struct.Struct("<BhhHB")
+HEADER_BYTES=HEADER.size
+RECORD_BYTES=RECORD.size
+MAX_ROBOTS=255
+
+
+def clamp16(v):
+    return min(max(int(v),-32768),32767)
+
+
+_packers={}    # Struct for the whole payload by robot count
+
+
+def packer(count):
+    if count not in _packers:
+        _packers[count]=struct.Struct("<BBId"+"BhhHB"*count)
+    return _packers[count]
+
+
+def encode(seq,captureTime,robots,confidence=None):
+    '''
+    Pack the robot positions
+
+    :param seq: int frame sequence number
+    :param captureTime: time.time() the frame was captured
+    :param robots: dict robots[botId]=(x,y,heading) heading may be None
+    :param confidence: dict confidence[botId]=0-1 or None
+    :return: bytes
+    '''
+    values=[]
+    count=0
+    for botId,(x,y,heading) in robots.items():
+        if botId is None or not 0<=botId<=255: continue
+        c=1.0 if confidence is None else confidence.get(botId,0.0)
+        values+=(botId,clamp16(x),clamp16(y),NO_HEADING if heading is None else int(round(heading))%360,
+                 int(round(255*min(max(c,0.0),1.0))))
+        count+=1
+        if count==MAX_ROBOTS: break
+    return packer(count).pack(POSE_VERSION,count,seq&0xFFFFFFFF,captureTime,*values)
+
+
+def decode(payload):
+    '''
+    The reference decoder
+
+    :param payload: bytes from encode()
+    :return: tuple (seq,captureTime,robots) robots[botId]=(x,y,heading,confidence), heading None if not known
+    :raises: ValueError if the payload is the wrong version or length
+    '''
+    if len(payload)<HEADER_BYTES:
+        raise ValueError("PosePacking: payload too short")
+    version,count,seq,captureTime=HEADER.unpack_from(payload)
+    if version!=POSE_VERSION:
+        raise ValueError("PosePacking: unknown version {0}".format(version))
+    if len(payload)!=HEADER_BYTES+count*RECORD_BYTES:
+        raise ValueError("PosePacking: payload length doesn't match the robot count")
+
+    robots={}
+    for botId,x,y,heading,c in RECORD.iter_unpack(payload[HEADER_BYTES:]):
+        robots[botId]=(x,y,None if heading==NO_HEADING else heading,round(c/255,2))
+    return seq,captureTime,robots
+
+
+########################################################################
+#
+# Benchmark
+#
+
+if __name__ == "__main__":
+    robots={i:(100*i+17,80*i+3,(45*i)%360) for i in range(1,9)}
+    confidence={i:0.9 for i in robots}
+    seq,t=123456,1700000000.123
+
+    asJson=json.dumps({"robots":robots,"seq":seq,"time":t})
+    asBinary=encode(seq,t,robots,confidence)
+    assert decode(asBinary)[2][3][:3]==robots[3]
+
+    n=20000
+    tests=[
+        ("json encode",lambda:json.dumps({"robots":robots,"seq":seq,"time":t})),
+        ("binary encode",lambda:encode(seq,t,robots,confidence)),
+        ("json decode",lambda:json.loads(asJson)),
+        ("binary decode",lambda:decode(asBinary)),
+    ]
+    print("8 robots, payload bytes: json",len(asJson),"binary",len(asBinary))
+    for name,f in tests:
+        us=timeit.timeit(f,number=n)/n*1e6
+        print("{0:14s} {1:6.2f} us".format(name,us))
@@ -0,0 +1,173 @@
+"""
+PositionPublisher.py
+
+Publishes an arena's robot positions to MQTT on its own thread at a steady
+rate, e.g. 20 times a second for robots doing obstacle avoidance.
+
+The detection results are handed over with update() which just swaps in a
+new snapshot - it never waits for MQTT. The publisher thread wakes every
+1/rate seconds and publishes the latest snapshot if there has been a new
+one since it last published. A pause in detection doesn't delay publishing
+and a detection rate higher than the publish rate doesn't raise it. If
+nothing new arrives the last positions are repeated every HEARTBEAT seconds.
+
+The payload includes the frame seq and the time.time() the camera captured
+the frame so a robot can allow for the age of the positions:
+
+    {"robots":{"1":[x,y,heading],...},"seq":1234,"time":1700000000.123}
+
+Each robot's position is also published on its own retained topic, e.g.
+pixelbot/3/pose, so a robot need only subscribe to and parse its own:
+
+    {"x":1245,"y":841,"heading":49,"seq":1234,"time":1700000000.123}
+
+A robot's pose is only published when it has moved more than epsilon mm,
+turned more than epsilon degrees or POSE_HEARTBEAT seconds have passed. A
+robot standing still costs a message a second instead of one every publish.
+The poses are checked every tick, so their heartbeats carry on if the camera
+stalls and the snapshot stops changing.
+The pose of a robot which is no longer seen stays on the broker, its time
+shows how old it is.
+
+If binaryTopic is given the positions are also published there in the
+compact binary format described in PosePacking.py.
+
+typical usage:
+    publisher=PositionPublisher(MQTT,"pixelbot/location",rate=20,poseTopic="pixelbot/{0}/pose")
+    publisher.start()
+    publisher.update(seq,captureTime,robots,confidence)    # each frame
+    publisher.stop()
+"""
+
+import json
+import math
+import threading
+import time
+from Stats import RateMeter
+import PosePacking
+
+PUBLISH_RATE=10     # default publishes per second
+MAX_RATE=50
+HEARTBEAT=1.0       # seconds between publishes when the positions don't change
+POSE_EPSILON=(5,3)  # mm, degrees a robot must move or turn for its pose to be published
+POSE_HEARTBEAT=1.0  # seconds between pose publishes for a robot which hasn't moved
+
+
+class PositionPublisher:
+
+    def __init__(self,MQTT,topic,rate=PUBLISH_RATE,poseTopic=None,epsilon=POSE_EPSILON,binaryTopic=None):
+        '''
+        :param MQTT: MqttManager.MQTT used to publish
+        :param topic: str e.g. "pixelbot/location"
+        :param rate: float publishes per second, at most MAX_RATE
+        :param poseTopic: str format for each robot's topic e.g. "pixelbot/{0}/pose" or None
+        :param epsilon: tuple (mm,degrees) change needed to publish a robot's pose
+        :param binaryTopic: str e.g. "pixelbot/location/bin" or None
+        '''
+        self.MQTT=MQTT
+        self.topic=topic
+        self.interval=1.0/min(max(rate,0.1),MAX_RATE)
+        self.poseTopic=poseTopic
+        self.epsilon=epsilon
+        self.binaryTopic=binaryTopic
+        self.poses={}               # last pose published for each robot (x,y,heading,time)
+
+        self.snapshot=None          # latest (seq,captureTime,robots,confidence), replaced whole
+        self.stopEvent=threading.Event()
+        self.thread=None
+
+        self.published=RateMeter()
+        self.posesPublished=RateMeter()
+        self.bytesOut=RateMeter()
+        self.lastAge=0.0            # seconds from capture to publish of the last publish
+
+    def start(self):
+        self.thread=threading.Thread(target=self.publishLoop,name="publish "+self.topic)
+        self.thread.daemon=True
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def update(self,seq,captureTime,robots,confidence=None):
+        '''
+        Hand over the latest detection results, never blocks
+
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param robots: dict robots[botId]=(x,y,heading), not changed afterwards
+        :param confidence: dict confidence[botId]=0-1 or None, only used for the binary payload
+        :return: Nothing
+        '''
+        self.snapshot=(seq,captureTime,robots,confidence)
+
+    def publishLoop(self):
+        '''
+        The publisher thread
+
+        :return: when stop() is called
+        '''
+        lastSeq=None
+        lastPublish=0.0
+        nextTime=time.time()
+        while not self.stopEvent.wait(max(nextTime-time.time(),0)):
+            nextTime=max(nextTime+self.interval,time.time())
+
+            snapshot=self.snapshot
+            if snapshot is None: continue
+            seq,captureTime,robots,confidence=snapshot
+            # each robot has its own heartbeat, even if the snapshot hasn't changed
+            if self.poseTopic is not None:
+                self.publishPoses(seq,captureTime,robots)
+
+            if seq==lastSeq and time.time()-lastPublish<HEARTBEAT: continue
+            payload=json.dumps({"robots":robots,"seq":seq,"time":round(captureTime,3)})
+            self.MQTT.publishPayload(self.topic,payload)
+            self.published.add()
+            self.bytesOut.add(len(payload))
+            if self.binaryTopic is not None:
+                payload=PosePacking.encode(seq,captureTime,robots,confidence)
+                self.MQTT.publishPayload(self.binaryTopic,payload)
+                self.bytesOut.add(len(payload))
+            lastSeq=seq
+            lastPublish=time.time()
+            self.lastAge=lastPublish-captureTime
+
+    def hasMoved(self,botId,x,y,heading,now):
+        '''
+        :return: True if the robot's pose should be published
+        '''
+        last=self.poses.get(botId)
+        if last is None: return True
+        lastX,lastY,lastHeading,lastTime=last
+        if now-lastTime>=POSE_HEARTBEAT: return True
+        mm,degrees=self.epsilon
+        if math.hypot(x-lastX,y-lastY)>mm: return True
+        if (heading is None)!=(lastHeading is None): return True
+        if heading is not None:
+            turned=abs(heading-lastHeading)%360
+            if min(turned,360-turned)>degrees: return True
+        return False
+
+    def publishPoses(self,seq,captureTime,robots):
+        '''
+        Publish the pose of each robot which has moved on its own retained topic
+
+        :return: Nothing
+        '''
+        now=time.time()
+        for botId,(x,y,heading) in robots.items():
+            if botId is None or not self.hasMoved(botId,x,y,heading,now): continue
+            payload=json.dumps({"x":x,"y":y,"heading":heading,"seq":seq,"time":round(captureTime,3)})
+            self.MQTT.publishPayload(self.poseTopic.format(botId),payload,retain=True)
+            self.poses[botId]=(x,y,heading,now)
+            self.posesPublished.add()
+            self.bytesOut.add(len(payload))
+
+    def stats(self):
+        '''
+        :return: dict publishes per second, payload bytes published per second and the age
+                 of the last positions published in ms
+        '''
+        return {"publishedPerSec":self.published.read(),"posesPerSec":self.posesPublished.read(),
+                "bytesPerSec":self.bytesOut.read(),"ageMs":round(1000*self.lastAge,1)}
@@ -0,0 +1,213 @@
+"""
+ReplayRing.py
+
+Keeps the last minute or so of an arena's stream so the referees can review
+the last 30 seconds of play.
+
+The frames are kept as JPEGs, tagged with their frame seq and capture time,
+in one buffer of a fixed size (REPLAY_BYTES) which is allocated once and
+reused - the newest frame overwrites the oldest. How many seconds that holds
+depends on the JPEG sizes, stats() reports it.
+
+Frames are collected at REPLAY_FPS whether anyone is watching or not. The
+JPEG a stream tier of the same width and quality has already encoded is used
+if there is one (see StreamHub.encoded()), otherwise the frame is encoded on
+the ring's own thread. Detection runs in its own process so it never waits
+for the ring.
+
+generate() replays a time window at any speed as an MJPEG stream. A frame
+overwritten during a long slow motion replay is skipped.
+
+typical usage:
+    ring=ReplayRing(hub)
+    # the thread collecting frames
+    if ring.wants():
+        ring.publish(frame,seq,captureTime,overlay)
+    # a Flask route
+    return Response(ring.generate(time.time()-30,time.time(),0.5),mimetype="multipart/x-mixed-replace; boundary=frame")
+"""
+
+import collections
+import threading
+import time
+from Stats import RateMeter
+from Overlay import StaticLayer
+from StreamHub import encodeJpeg
+
+REPLAY_BYTES=32*1024*1024   # JPEG buffer size, about a minute at 640 pixels and 10 fps
+REPLAY_WIDTH=640
+REPLAY_QUALITY=None         # OpenCV default, the same as the default stream so its encodes are reused
+REPLAY_FPS=10
+MAX_SPEED=10.0
+
+
+class ReplayRing:
+
+    def __init__(self,hub=None,size=REPLAY_BYTES,width=REPLAY_WIDTH,quality=REPLAY_QUALITY,fps=REPLAY_FPS):
+        '''
+        :param hub: StreamHub whose encodes can be reused, or None
+        :param size: int bytes of JPEGs kept
+        :param width: int pixels
+        :param quality: int JPEG quality or None for the OpenCV default
+        :param fps: float frames kept per second
+        '''
+        self.hub=hub
+        self.width=width
+        self.quality=quality
+        self.interval=1.0/fps
+
+        self.buffer=bytearray(size)
+        self.head=0                         # where the next JPEG goes
+        self.entries=collections.deque()    # [seq,time,offset,length] oldest first
+        self.bySeq={}                       # the same entries by seq
+        self.lock=threading.Lock()
+
+        self.condition=threading.Condition()
+        self.latest=None                    # (frame,seq,captureTime,overlay) waiting to be encoded
+        self.lastPublish=0.0
+        self.encoder=None
+
+        self.encodes=RateMeter()
+        self.reused=0                       # JPEGs taken from a stream tier
+        self.tooBig=0
+
+    def wants(self):
+        '''
+        :return: True if it is time for another frame
+        '''
+        return time.time()-self.lastPublish>=self.interval
+
+    def publish(self,frame,seq,captureTime,overlay):
+        '''
+        Hand over a frame, replacing any still waiting to be encoded
+
+        :param frame: numpy BGR image, not changed afterwards
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param overlay: the robots to draw on it, see Overlay.py
+        :return: Nothing
+        '''
+        self.lastPublish=time.time()
+        with self.condition:
+            self.latest=(frame,seq,captureTime,overlay)
+            if self.encoder is None:
+                self.encoder=threading.Thread(target=self.encodeFrames,name="replay")
+                self.encoder.daemon=True
+                self.encoder.start()
+            self.condition.notify()
+
+    def encodeFrames(self):
+        '''
+        The encoder thread, runs forever
+
+        :return: Nothing
+        '''
+        layer=StaticLayer()
+        while True:
+            with self.condition:
+                while self.latest is None:
+                    self.condition.wait()
+                frame,seq,captureTime,overlay=self.latest
+                self.latest=None
+
+            jpeg=None
+            if self.hub is not None:
+                jpeg=self.hub.encoded(seq,self.width,self.quality)
+            if jpeg is not None:
+                self.reused+=1
+            else:
+                jpeg=encodeJpeg(frame,self.width,self.quality,overlay,layer)
+                if jpeg is None: continue
+                self.encodes.add()
+            self.add(seq,captureTime,jpeg)
+
+    def add(self,seq,captureTime,jpeg):
+        '''
+        Copy a JPEG into the ring, overwriting the oldest
+
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param jpeg: bytes
+        :return: Nothing
+        '''
+        n=len(jpeg)
+        if n>len(self.buffer):
+            self.tooBig+=1
+            return
+        with self.lock:
+            if self.head+n>len(self.buffer):
+                # not enough room at the end, start again at the beginning
+                # dropping the frames left at the end
+                while self.entries and self.entries[0][2]>=self.head:
+                    self.evict()
+                self.head=0
+            start,end=self.head,self.head+n
+            while self.entries and self.entries[0][2]<end and self.entries[0][2]+self.entries[0][3]>start:
+                self.evict()
+
+            self.buffer[start:end]=jpeg
+            entry=[seq,captureTime,start,n]
+            self.entries.append(entry)
+            self.bySeq[seq]=entry
+            self.head=end
+
+    def evict(self):
+        '''
+        Forget the oldest frame. Called holding the lock.
+        '''
+        entry=self.entries.popleft()
+        if self.bySeq.get(entry[0]) is entry:
+            del self.bySeq[entry[0]]
+
+    def frames(self,start,end):
+        '''
+        :param start: time.time() value
+        :param end: time.time() value
+        :return: list of (seq,captureTime) in the window, oldest first
+        '''
+        with self.lock:
+            return [(e[0],e[1]) for e in self.entries if start<=e[1]<=end]
+
+    def read(self,seq):
+        '''
+        :param seq: int frame sequence number
+        :return: a copy of its JPEG bytes or None if it has been overwritten
+        '''
+        with self.lock:
+            entry=self.bySeq.get(seq)
+            if entry is None: return None
+            offset,n=entry[2],entry[3]
+            return bytes(self.buffer[offset:offset+n])
+
+    def generate(self,start,end,speed=1.0):
+        '''
+        Replay a time window as an MJPEG stream
+
+        :param start: time.time() value
+        :param end: time.time() value
+        :param speed: float, 0.5 for half speed etc.
+        :return: Nothing, yields multipart jpeg parts
+        '''
+        speed=min(max(speed,0.01),MAX_SPEED)
+        frames=self.frames(start,end)
+        if not frames: return
+        t0=time.time()
+        first=frames[0][1]
+        for seq,captureTime in frames:
+            delay=(captureTime-first)/speed-(time.time()-t0)
+            if delay>0: time.sleep(delay)
+            jpeg=self.read(seq)
+            if jpeg is None: continue   # overwritten during a slow replay
+            yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
+                jpeg + b'\r\n')
+
+    def stats(self):
+        '''
+        :return: dict frames held, seconds they cover, bytes used, encodes per second and JPEGs reused
+        '''
+        with self.lock:
+            frames=len(self.entries)
+            seconds=self.entries[-1][1]-self.entries[0][1] if frames>1 else 0.0
+            used=sum(e[3] for e in self.entries)
+        return {"frames":frames,"seconds":round(seconds,1),"bytes":used,"size":len(self.buffer),
+                "encodesPerSec":self.encodes.read(),"reused":self.reused,"tooBig":self.tooBig}
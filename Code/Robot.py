@@ -32,6 +32,7 @@ class robot:
         self.textColor=(255,255,255)
         self.dotsFound={}    # x,y co-ords to eliminate duplicates
         self.contour=None
+        self.fill=1.0       # fraction of the bounding rectangle the outline fills
 
     def setSize(self,botRadius):
         self.botRadius=botRadius
@@ -54,6 +55,28 @@ class robot:
         '''
         return self.contour
 
+    def setFill(self,fill):
+        '''
+        :param fill: float 0-1 area of the outline found divided by the area of its bounding rectangle
+        :return: Nothing
+        '''
+        self.fill=fill
+
+    def getConfidence(self):
+        '''
+        How sure we are this is a robot, 0-1
+
+        A robot is a rectangle so a blob which fills its bounding rectangle
+        scores higher. Halved if the direction indicator wasn't found, zero
+        if no ID dots were.
+
+        :return: float
+        '''
+        if self.botId is None: return 0.0
+        confidence=self.fill
+        if self.director==(0,0): confidence/=2
+        return round(confidence,2)
+
     def contourContains(self,point):
         if self.contour is None:
             #print("WARNING: contourContains(",point,") - self contour is None")
@@ -121,6 +144,15 @@ class robot:
         self.director=pos
         return True
 
+    def getDirector(self):
+        '''
+        Returns the centre of the direction indicator
+
+        :return: tuple (x,y) or None if no director was found
+        '''
+        if self.director==(0,0): return None
+        return self.director
+
     def getId(self):
         '''
         Returns the robot Id. See also addIdDot()
@@ -0,0 +1,90 @@
+"""
+RobotSnapshot.py
+
+The robot positions for the MQTT query commands (loc, getAllRobots).
+
+Each detection result becomes a new RobotSnapshot which is never changed
+afterwards. RobotStore.publish() makes the new one current with a single
+reference assignment so a command handler, on another thread, always sees
+one complete frame's positions - never a mix of two - without any locking.
+
+A reply is serialised once per snapshot and kept with it, so a burst of
+identical queries from the controllers between two frames costs one
+json.dumps(). Anything else worked out from the snapshot, e.g. the spatial
+index (SpatialIndex.py), can be kept with it the same way.
+
+typical usage:
+    store=RobotStore()
+    store.publish(seq,captureTime,robots)     # each frame
+    snapshot=store.get()
+    payload=snapshot.reply(("all",),lambda s:json.dumps({"robots":s.robots}))
+"""
+
+import threading
+import types
+
+
+class RobotSnapshot:
+    '''
+    The robots found in one frame, read only
+    '''
+    __slots__=("version","seq","captureTime","robots","replies","lock")
+
+    def __init__(self,version,seq,captureTime,robots):
+        '''
+        :param version: int, increases with every snapshot
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param robots: dict robots[botId]=(x,y,heading), copied
+        '''
+        self.version=version
+        self.seq=seq
+        self.captureTime=captureTime
+        self.robots=types.MappingProxyType(dict(robots))
+        self.replies={}             # serialised replies by key
+        self.lock=threading.RLock()     # a build may ask for another reply
+
+    def reply(self,key,build):
+        '''
+        A reply, or anything else, made from this snapshot, built the first time it is asked for
+
+        :param key: hashable e.g. ("loc",3)
+        :param build: function(snapshot) returning the payload
+        :return: the payload
+        '''
+        payload=self.replies.get(key)
+        if payload is None:
+            with self.lock:
+                payload=self.replies.get(key)
+                if payload is None:
+                    payload=build(self)
+                    self.replies[key]=payload
+        return payload
+
+
+class RobotStore:
+    '''
+    Holds the current RobotSnapshot
+    '''
+
+    def __init__(self):
+        self.snapshot=RobotSnapshot(0,None,0.0,{})
+
+    def publish(self,seq,captureTime,robots):
+        '''
+        Make a new snapshot current. Only called from one thread.
+
+        :param seq: int frame sequence number
+        :param captureTime: time.time() the frame was captured
+        :param robots: dict robots[botId]=(x,y,heading)
+        :return: the new RobotSnapshot
+        '''
+        snapshot=RobotSnapshot(self.snapshot.version+1,seq,captureTime,robots)
+        self.snapshot=snapshot      # the swap
+        return snapshot
+
+    def get(self):
+        '''
+        :return: the current RobotSnapshot, keep using the same one for the whole of a query
+        '''
+        return self.snapshot
@@ -0,0 +1,144 @@
+"""
+SharedFrame.py
+
+Passes video frames from a detection process to ArenaManager through shared
+memory, so the frames don't have to be pickled and pushed through a pipe.
+
+The memory is created by the front end before the worker process is started
+and is sized for the largest frame expected - the operating system only
+allocates the pages which are actually used.
+
+There are three frame buffers. The worker copies each new frame into a buffer
+nobody is reading and then makes it the latest with one small update of the
+header, and the reader copies the latest buffer out while the next frame is
+being written into another one. The lock is only held to update the header,
+never while a frame is copied, so neither side waits for the other. How long
+the lock is held and how long readers wait for it are reported by stats().
+
+typical usage:
+    slot=SharedFrame()
+    # in the worker
+    slot.write(frame,seq)
+    # in the front end
+    seq,frame=slot.read()
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from Stats import TimeMeter
+
+MAX_FRAME_BYTES=3840*2160*3     # room for a 4K BGR frame
+BUFFERS=3                       # one being read, one being written and the latest
+HEADER_BYTES=128                # see header()
+
+# header entries, all int64
+LATEST=0                        # index of the latest buffer, -1 if none yet
+FRAME_INFO=1                    # seq,h,w,channels for each buffer
+READERS=FRAME_INFO+4*BUFFERS    # number of readers copying each buffer
+
+
+class SharedFrame:
+
+    def __init__(self,maxBytes=MAX_FRAME_BYTES):
+        '''
+        :param maxBytes: largest frame which can be written
+        '''
+        self.maxBytes=maxBytes
+        self.shm=shared_memory.SharedMemory(create=True,size=HEADER_BYTES+BUFFERS*maxBytes)
+        self.lock=multiprocessing.Lock()
+        self.header()[:]=0
+        self.header()[LATEST]=-1
+
+        # measured separately in each process
+        self.lockHeld=TimeMeter()   # writer and reader
+        self.readWait=TimeMeter()   # reader waiting for the lock
+        self.dropped=0              # frames not written because every buffer was busy
+
+    def header(self):
+        # a fresh view each time, views stop the memory being closed
+        return np.ndarray((READERS+BUFFERS,),dtype=np.int64,buffer=self.shm.buf)
+
+    def buffer(self,index,shape):
+        return np.ndarray(shape,dtype=np.uint8,buffer=self.shm.buf,offset=HEADER_BYTES+index*self.maxBytes)
+
+    def write(self,frame,seq):
+        '''
+        Copy a frame into a free buffer and make it the latest
+
+        :param frame: numpy uint8 image
+        :param seq: int frame sequence number
+        :return: True, or False if every buffer was busy and the frame was dropped
+        '''
+        assert frame.nbytes<=self.maxBytes,"SharedFrame: frame is larger than "+str(self.maxBytes)+" bytes"
+        h,w=frame.shape[:2]
+        c=frame.shape[2] if frame.ndim==3 else 1
+
+        with self.lock,self.lockHeld:
+            header=self.header()
+            free=[i for i in range(BUFFERS) if i!=header[LATEST] and header[READERS+i]==0]
+        if not free:
+            # only possible with more than one reader at a time
+            self.dropped+=1
+            return False
+
+        # nobody reads this buffer until it is made the latest below
+        index=free[0]
+        self.buffer(index,frame.shape)[...]=frame
+
+        with self.lock,self.lockHeld:
+            header=self.header()
+            info=FRAME_INFO+4*index
+            header[info:info+4]=(seq,h,w,c)
+            header[LATEST]=index
+        return True
+
+    def read(self,lastSeq=None):
+        '''
+        Copy the latest frame out of shared memory
+
+        :param lastSeq: sequence number already read, if the frame hasn't changed None is returned
+        :return: tuple (seq,frame) or None if no (new) frame is available
+        '''
+        with self.readWait:
+            self.lock.acquire()
+        with self.lockHeld:
+            header=self.header()
+            index=int(header[LATEST])
+            if index>=0:
+                info=FRAME_INFO+4*index
+                seq,h,w,c=(int(v) for v in header[info:info+4])
+                if seq!=lastSeq:
+                    header[READERS+index]+=1    # stop the writer reusing it
+        self.lock.release()
+
+        if index<0 or seq==lastSeq: return None
+
+        shape=(h,w,c) if c>1 else (h,w)
+        frame=self.buffer(index,shape).copy()
+
+        with self.lock:
+            self.header()[READERS+index]-=1
+        return seq,frame
+
+    def stats(self):
+        '''
+        Lock timings for this process since the last call
+
+        :return: dict lockHeld and readWait (avgMs,maxMs) and the dropped frame count
+        '''
+        return {"lockHeld":self.lockHeld.read(),"readWait":self.readWait.read(),"dropped":self.dropped}
+
+    def close(self):
+        '''
+        Detach from the memory. The front end should also call unlink()
+        :return: Nothing
+        '''
+        self.shm.close()
+
+    def unlink(self):
+        '''
+        Free the shared memory
+        :return: Nothing
+        '''
+        self.shm.unlink()
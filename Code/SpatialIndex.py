@@ -0,0 +1,151 @@
+"""
+SpatialIndex.py
+
+Answers "which robots are within R mm of me" and "which are the k nearest
+robots to (x,y)" so the robots' obstacle avoidance doesn't have to download
+every position and do the geometry on a microcontroller.
+
+GridIndex puts one frame's robots into square cells CELL_MM across. A
+query only looks at the cells which overlap the circle, or for nearest()
+at rings of cells around the point until the k nearest are certainly
+found, instead of at every robot. Only the cells within the robots' bounds
+are looked at, so a point far outside the arena costs no more than one
+in it. ArenaManager builds one the first time a
+frame is queried and keeps it with that frame's RobotSnapshot (see
+RobotSnapshot.py) so the following queries reuse it.
+
+Obstacles holds the arena's fixed obstacles, polygons in mm from the
+arena's config, and reports those within R mm of a point.
+
+All distances are in arena mm, the units of the robot positions.
+
+typical usage:
+    index=GridIndex(robots)                 # robots[botId]=(x,y,heading)
+    index.near(x,y,300,exclude=3)           # [(distance,botId,(x,y,heading)),...] nearest first
+    index.nearest(x,y,2,exclude=3)
+    obstacles=Obstacles([[(0,0),(100,0),(100,100),(0,100)]])
+    obstacles.near(x,y,300)                 # [(distance,index),...] nearest first
+"""
+
+import math
+import cv2
+import numpy as np
+
+CELL_MM=200     # about twice a robot's width
+
+
+def ringCells(cx,cy,r):
+    '''
+    :return: generator of the cells r cells away from (cx,cy), the border of a (2r+1)x(2r+1) square
+    '''
+    if r==0:
+        yield cx,cy
+        return
+    for i in range(cx-r,cx+r+1):
+        yield i,cy-r
+        yield i,cy+r
+    for j in range(cy-r+1,cy+r):
+        yield cx-r,j
+        yield cx+r,j
+
+
+class GridIndex:
+
+    def __init__(self,robots,cell=CELL_MM):
+        '''
+        :param robots: dict robots[botId]=(x,y,heading) in mm
+        :param cell: int cell size in mm
+        '''
+        self.cell=cell
+        self.cells={}       # cells[(cx,cy)]=[(botId,(x,y,heading)),...]
+        self.count=0
+        for botId,pose in robots.items():
+            if botId is None: continue
+            key=(int(pose[0]//cell),int(pose[1]//cell))
+            self.cells.setdefault(key,[]).append((botId,pose))
+            self.count+=1
+        if self.cells:
+            xs=[c[0] for c in self.cells]
+            ys=[c[1] for c in self.cells]
+            self.bounds=(min(xs),min(ys),max(xs),max(ys))
+
+    def near(self,x,y,radius,exclude=None):
+        '''
+        The robots within radius mm of a point
+
+        :param x: mm
+        :param y: mm
+        :param radius: mm
+        :param exclude: botId to leave out, e.g. the robot asking
+        :return: list of (distance,botId,(x,y,heading)) nearest first
+        '''
+        found=[]
+        if not self.cells or not all(math.isfinite(v) for v in (x,y,radius)) or radius<0: return found
+        cell=self.cell
+        x0,y0,x1,y1=self.bounds
+        for cx in range(max(int((x-radius)//cell),x0),min(int((x+radius)//cell),x1)+1):
+            for cy in range(max(int((y-radius)//cell),y0),min(int((y+radius)//cell),y1)+1):
+                for botId,pose in self.cells.get((cx,cy),()):
+                    if botId==exclude: continue
+                    d=math.hypot(pose[0]-x,pose[1]-y)
+                    if d<=radius:
+                        found.append((d,botId,pose))
+        found.sort(key=lambda f:f[0])
+        return found
+
+    def nearest(self,x,y,k,exclude=None):
+        '''
+        The k robots nearest a point
+
+        :param x: mm
+        :param y: mm
+        :param k: int
+        :param exclude: botId to leave out, e.g. the robot asking
+        :return: list of up to k (distance,botId,(x,y,heading)) nearest first
+        '''
+        found=[]
+        if not self.cells or k<=0 or not (math.isfinite(x) and math.isfinite(y)): return found
+        cell=self.cell
+        x0,y0,x1,y1=self.bounds
+        # start from the nearest cell within the bounds, those outside are empty
+        cx=min(max(int(x//cell),x0),x1)
+        cy=min(max(int(y//cell),y0),y1)
+        rings=max(cx-x0,x1-cx,cy-y0,y1-cy)
+        for r in range(rings+1):
+            for i,j in ringCells(cx,cy,r):
+                for botId,pose in self.cells.get((i,j),()):
+                    if botId!=exclude:
+                        found.append((math.hypot(pose[0]-x,pose[1]-y),botId,pose))
+            # every robot closer than r cells has been seen, the point is at
+            # least as far from the unseen cells when it is outside the bounds
+            if len(found)>=k:
+                found.sort(key=lambda f:f[0])
+                if found[k-1][0]<=r*cell: break
+        found.sort(key=lambda f:f[0])
+        return found[:k]
+
+
+class Obstacles:
+
+    def __init__(self,polygons):
+        '''
+        :param polygons: list of polygons, each a list of (x,y) in mm
+        '''
+        self.contours=[np.array(p,dtype=np.float32).reshape(-1,1,2) for p in polygons or ()]
+
+    def near(self,x,y,radius):
+        '''
+        The obstacles within radius mm of a point, 0 if the point is inside one
+
+        :param x: mm
+        :param y: mm
+        :param radius: mm
+        :return: list of (distance,index) nearest first, index into the polygons
+        '''
+        found=[]
+        for i,contour in enumerate(self.contours):
+            d=max(-cv2.pointPolygonTest(contour,(float(x),float(y)),True),0.0)
+            if d<=radius:
+                found.append((d,i))
+        found.sort()
+        return found
@@ -0,0 +1,108 @@
+"""
+Stats.py
+
+Simple meters used to report how busy the different parts of
+ArenaManager are. See the /stats route in ArenaManager.py
+
+    cpu=CpuMeter()
+    ...
+    print("cpu",cpu.read(),"%")     # since the last read()
+"""
+
+import time
+
+
+class CpuMeter:
+    '''
+    CPU time used by this process (all threads) as a percentage of one core
+    '''
+
+    def __init__(self):
+        self.lastCpu=time.process_time()
+        self.lastWall=time.time()
+        self.percent=0.0
+
+    def read(self):
+        '''
+        :return: float percentage of one core used since the last read()
+        '''
+        cpu,wall=time.process_time(),time.time()
+        if wall>self.lastWall:
+            self.percent=100.0*(cpu-self.lastCpu)/(wall-self.lastWall)
+        self.lastCpu,self.lastWall=cpu,wall
+        return round(self.percent,1)
+
+
+class RateMeter:
+    '''
+    Counts events (frames, messages, bytes...) and reports them per second
+    '''
+
+    def __init__(self):
+        self.count=0
+        self.total=0
+        self.lastTime=time.time()
+        self.rate=0.0
+
+    def add(self,n=1):
+        '''
+        :param n: number of events, or bytes etc.
+        :return: Nothing
+        '''
+        self.count+=n
+        self.total+=n
+
+    def read(self):
+        '''
+        :return: float events per second since the last read()
+        '''
+        now=time.time()
+        if now>self.lastTime:
+            self.rate=self.count/(now-self.lastTime)
+        self.count=0
+        self.lastTime=now
+        return round(self.rate,1)
+
+
+class TimeMeter:
+    '''
+    Collects durations, e.g. how long a lock was held, and reports the
+    average and worst in milliseconds
+
+        with meter:
+            ...
+    '''
+
+    def __init__(self):
+        self.count=0
+        self.sum=0.0
+        self.max=0.0
+        self.start=None
+
+    def __enter__(self):
+        self.start=time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        self.add(time.perf_counter()-self.start)
+        return False
+
+    def add(self,seconds):
+        '''
+        :param seconds: one duration
+        :return: Nothing
+        '''
+        self.count+=1
+        self.sum+=seconds
+        self.max=max(self.max,seconds)
+
+    def read(self):
+        '''
+        :return: dict average and maximum in ms since the last read()
+        '''
+        avg=1000.0*self.sum/self.count if self.count else 0.0
+        result={"avgMs":round(avg,3),"maxMs":round(1000.0*self.max,3)}
+        self.count=0
+        self.sum=0.0
+        self.max=0.0
+        return result
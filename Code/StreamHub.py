@@ -0,0 +1,290 @@
+"""
+StreamHub.py
+
+Shares the MJPEG streams of an arena between any number of browsers.
+
+Browsers can ask for different versions of the stream - width, JPEG quality,
+frame rate and raw (before the robots are drawn on) or annotated - e.g. a
+projector at full resolution and phones at 320 pixels and 2 fps. Each
+different version is a tier. A tier exists only while somebody is watching
+it and all the viewers of a tier share it.
+
+The thread collecting frames just publishes the full size camera frame and
+the robot overlay, it does no resizing, drawing or encoding. A tier's frame
+is scaled, has the robots drawn on it (see Overlay.py) unless it is raw, and
+is JPEG encoded once, by the first of its viewers to notice the new frame, and the bytes are kept in a
+single slot which the tier's other viewers are woken to send. A slow viewer
+simply gets whatever frame is newest when it is ready - frames are never
+queued up for it - and because each tier is encoded by its own viewers'
+threads a full resolution tier doesn't hold up a small one.
+
+snapshot() returns a single JPEG, reusing a tier's encoding if one matches.
+encoded() lets others, e.g. ReplayRing.py, do the same.
+
+typical usage:
+    hub=StreamHub()
+    # the thread collecting frames
+    if hub.wants():
+        hub.publish(frame,seq,overlay)
+    # a Flask route
+    return Response(hub.generate(width=320,fps=2),mimetype="multipart/x-mixed-replace; boundary=frame")
+"""
+
+import threading
+import time
+import cv2
+from Stats import RateMeter
+from Overlay import drawOverlay,StaticLayer
+
+CLIENT_TIMEOUT=1.0      # seconds a viewer waits before checking again
+SNAPSHOT_TIMEOUT=2.0    # seconds snapshot() waits for a frame
+SNAPSHOT_KEEP=5.0       # seconds frames keep being collected after a snapshot
+MAX_FRAME_AGE=1.0       # seconds before a published frame is too old for a snapshot
+MAX_TIERS=8             # different stream versions at once
+
+
+class StreamTier:
+    '''
+    One version of the stream and its viewers
+    '''
+
+    def __init__(self,width,quality,fps,raw):
+        '''
+        :param width: int pixels, frames are scaled down to this (never up)
+        :param quality: int JPEG quality 1-100 or None for the OpenCV default
+        :param fps: float maximum frame rate, 0 for every frame
+        :param raw: True for the frames before annotation
+        '''
+        self.width=width
+        self.quality=quality
+        self.interval=1.0/fps if fps>0 else 0.0
+        self.raw=raw
+        self.layer=StaticLayer()    # crosshairs etc. drawn at this tier's size
+
+        self.jpeg=None          # latest encoded frame
+        self.jpegSeq=None       # seq of the frame it was made from
+        self.encoding=False     # a viewer is encoding the next frame
+        self.lastEncode=0.0
+        self.clients=0
+        self.encodes=RateMeter()
+        self.sent=RateMeter()
+        self.bytesSent=RateMeter()
+
+    def render(self,frame,overlay):
+        '''
+        Scale, annotate and encode a frame
+
+        :param frame: numpy BGR image, full size
+        :param overlay: robots to draw, see Overlay.py
+        :return: jpeg bytes or None
+        '''
+        return encodeJpeg(frame,self.width,self.quality,None if self.raw else overlay,self.layer)
+
+    def stats(self):
+        bytesPerSec=self.bytesSent.read()
+        return {"clients":self.clients,"encodesPerSec":self.encodes.read(),
+                "sentPerSec":self.sent.read(),"bytesPerSec":bytesPerSec,
+                "bytesPerSecPerViewer":round(bytesPerSec/max(self.clients,1),1)}
+
+
+def encodeJpeg(frame,width,quality,overlay=None,layer=None):
+    '''
+    Scale down maintaining aspect ratio, draw the robots, then JPEG encode
+
+    :param frame: numpy BGR image, not changed
+    :param width: int pixels
+    :param quality: int 1-100 or None for the default
+    :param overlay: robots to draw in full size frame coordinates or None
+    :param layer: StaticLayer to reuse or None
+    :return: jpeg bytes or None
+    '''
+    h,w=frame.shape[:2]
+    if width<w:
+        frame=cv2.resize(frame,(width,int(h*width/w)),interpolation=cv2.INTER_LINEAR)
+    elif overlay:
+        frame=frame.copy()  # the frame is shared by all the tiers
+    if overlay:
+        drawOverlay(frame,overlay,frame.shape[1]/w,layer)
+    params=[] if quality is None else [cv2.IMWRITE_JPEG_QUALITY,quality]
+    flag,encodedImage=cv2.imencode(".jpg",frame,params)
+    if not flag: return None
+    return encodedImage.tobytes()
+
+
+class StreamHub:
+
+    def __init__(self):
+        self.condition=threading.Condition()
+        self.tiers={}                           # StreamTier by (width,quality,fps,raw)
+        self.frame=None                         # latest (seq,time,frame,overlay)
+        self.lastSnapshot=0.0
+        self.snapshots={}                       # (width,quality,raw):(seq,jpeg)
+
+    def wants(self):
+        '''
+        Does anyone want the frames?
+
+        :return: True if publish() should be called
+        '''
+        if time.time()-self.lastSnapshot<SNAPSHOT_KEEP: return True
+        return self.hasClients()
+
+    def isFull(self,width,quality=None,fps=0,raw=False):
+        '''
+        :return: True if there are already MAX_TIERS streams and this would be another
+        '''
+        return (width,quality,fps,raw) not in self.tiers and len(self.tiers)>=MAX_TIERS
+
+    def hasClients(self):
+        '''
+        :return: True if anyone is watching a stream
+        '''
+        return any(t.clients>0 for t in list(self.tiers.values()))
+
+    def publish(self,frame,seq,overlay):
+        '''
+        Make a new full size frame available and wake the viewers
+
+        :param frame: numpy BGR image, not changed afterwards
+        :param seq: int frame sequence number
+        :param overlay: the robots to draw on it, see Overlay.py
+        :return: Nothing
+        '''
+        with self.condition:
+            self.frame=(seq,time.time(),frame,overlay)
+            self.condition.notify_all()
+
+    def nextFrame(self,tier,lastSeq):
+        '''
+        Decide what a viewer does next. Called holding the condition.
+
+        :return: ("send",seq,jpeg), ("encode",seq,frame,overlay) or ("wait",seconds)
+        '''
+        if tier.jpeg is not None and tier.jpegSeq!=lastSeq:
+            return "send",tier.jpegSeq,tier.jpeg
+
+        latest=self.frame
+        if latest is None or latest[0]==tier.jpegSeq or tier.encoding:
+            return "wait",CLIENT_TIMEOUT
+
+        wait=tier.lastEncode+tier.interval-time.time()
+        if wait>0:
+            return "wait",wait
+
+        return "encode",latest[0],latest[2],latest[3]
+
+    def generate(self,width,quality=None,fps=0,raw=False):
+        '''
+        Generate the video stream for one viewer
+
+        :param width: int pixels
+        :param quality: int JPEG quality or None
+        :param fps: float maximum frames per second, 0 for all
+        :param raw: True for the frames before annotation
+        :return: Nothing, yields multipart jpeg parts
+        '''
+        key=(width,quality,fps,raw)
+        with self.condition:
+            if key not in self.tiers:
+                self.tiers[key]=StreamTier(width,quality,fps,raw)
+            tier=self.tiers[key]
+            tier.clients+=1
+
+        lastSeq=None
+        try:
+            while True:
+                with self.condition:
+                    action=self.nextFrame(tier,lastSeq)
+                    if action[0]=="wait":
+                        self.condition.wait(action[1])
+                        continue
+                    if action[0]=="encode":
+                        tier.encoding=True
+
+                if action[0]=="encode":
+                    # encoded outside the condition so the other tiers carry on
+                    seq,frame,overlay=action[1:]
+                    jpeg=None
+                    try:
+                        jpeg=tier.render(frame,overlay)
+                    finally:
+                        with self.condition:
+                            tier.encoding=False
+                            tier.lastEncode=time.time()
+                            if jpeg is not None:
+                                tier.jpeg,tier.jpegSeq=jpeg,seq
+                                tier.encodes.add()
+                            self.condition.notify_all()
+                    if jpeg is None: continue
+                else:
+                    seq,jpeg=action[1],action[2]
+
+                lastSeq=seq
+                tier.sent.add()
+                tier.bytesSent.add(len(jpeg))
+                # yield the output frame in the byte format
+                yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
+                    jpeg + b'\r\n')
+        finally:
+            # the browser has gone
+            with self.condition:
+                tier.clients-=1
+                if tier.clients==0:
+                    del self.tiers[key]
+
+    def snapshot(self,width,quality=None,raw=False):
+        '''
+        A single JPEG of the latest frame
+
+        Uses a tier's encoding of the frame, or an earlier snapshot's, if there
+        is one with the same width and quality. Otherwise the frame is encoded
+        and kept for the next snapshot.
+
+        :param width: int pixels
+        :param quality: int JPEG quality or None
+        :param raw: True for the frame before annotation
+        :return: jpeg bytes or None if no frame arrived in time
+        '''
+        with self.condition:
+            self.lastSnapshot=time.time()
+            fresh=lambda:self.frame is not None and time.time()-self.frame[1]<MAX_FRAME_AGE
+            if not self.condition.wait_for(fresh,SNAPSHOT_TIMEOUT): return None
+            seq,t,frame,overlay=self.frame
+            jpeg=self.encoded(seq,width,quality,raw)
+            if jpeg is not None: return jpeg
+
+        jpeg=encodeJpeg(frame,width,quality,None if raw else overlay)
+        if jpeg is not None:
+            with self.condition:
+                if len(self.snapshots)>=MAX_TIERS: self.snapshots.clear()
+                self.snapshots[(width,quality,raw)]=(seq,jpeg)
+        return jpeg
+
+    def encoded(self,seq,width,quality=None,raw=False):
+        '''
+        Find a frame already encoded by a tier or an earlier snapshot
+
+        :param seq: int frame sequence number
+        :param width: int pixels
+        :param quality: int JPEG quality or None
+        :param raw: True for the frame before annotation
+        :return: jpeg bytes or None
+        '''
+        with self.condition:
+            for tier in self.tiers.values():
+                if (tier.width,tier.quality,tier.raw)==(width,quality,raw) and tier.jpegSeq==seq:
+                    return tier.jpeg
+
+            cached=self.snapshots.get((width,quality,raw))
+            if cached is not None and cached[0]==seq:
+                return cached[1]
+        return None
+
+    def stats(self):
+        '''
+        :return: dict of tier stats keyed by "width/quality/fps/raw|annotated"
+        '''
+        with self.condition:
+            tiers=list(self.tiers.items())
+        return {"{0}/{1}/{2}/{3}".format(w,q or "default",f,"raw" if r else "annotated"):tier.stats()
+                for (w,q,f,r),tier in tiers}
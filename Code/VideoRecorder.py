@@ -0,0 +1,139 @@
+"""
+VideoRecorder.py
+
+Records the arena to a video file on its own thread so a slow SD card never
+holds up the robot detection.
+
+Frames are handed over through a short queue. If the writer falls behind
+the oldest waiting frame is dropped and counted - the recording skips a
+frame rather than the tracking stalling.
+
+A raw recording is the plain camera image without the robot outlines. It
+can be replayed later in place of a camera, e.g. to tune the detection at
+home, by giving its file name as the camera (see Camera.openCamera()).
+
+typical usage:
+    rec=VideoRecorder("output.avi",10,(1920,1080))
+    rec.start()
+    rec.write(frame,overlay)    # from the detection loop
+    rec.stop()                  # writes what is queued then closes the file
+"""
+
+import collections
+import threading
+import cv2
+from Overlay import drawOverlay,StaticLayer
+
+QUEUE_SIZE=8            # frames waiting to be written
+STOP_TIMEOUT=10         # seconds to wait for the queue to be written
+
+
+class VideoRecorder:
+
+    def __init__(self,fname,fps,size,raw=False,queueSize=QUEUE_SIZE):
+        '''
+        :param fname: video file name
+        :param fps: int frame rate written in the file
+        :param size: tuple (w,h) of the frames
+        :param raw: True to record without the robot overlay
+        :param queueSize: frames which can wait before the oldest is dropped
+        '''
+        self.fname=fname
+        self.fps=fps
+        self.size=size
+        self.raw=raw
+
+        self.queue=collections.deque(maxlen=queueSize)
+        self.condition=threading.Condition()
+        self.running=False
+        self.thread=None
+        self.written=0
+        self.dropped=0
+
+    def start(self):
+        '''
+        Open the video file and start the writer thread
+
+        :return: True if the file could be opened
+        '''
+        fourcc=cv2.VideoWriter_fourcc(*'mp4v')
+        writer=cv2.VideoWriter(self.fname,fourcc,self.fps,self.size)
+        if not writer.isOpened():
+            print("VideoRecorder: unable to open",self.fname)
+            return False
+
+        self.running=True
+        self.thread=threading.Thread(target=self.writeFrames,args=(writer,),name="recorder")
+        self.thread.daemon=True
+        self.thread.start()
+        print("Recording to",self.fname,"at",self.fps,"fps","raw" if self.raw else "")
+        return True
+
+    def stop(self):
+        '''
+        Finish writing the queued frames and close the file
+
+        :return: Nothing
+        '''
+        if self.thread is None: return
+        with self.condition:
+            self.running=False
+            self.condition.notify()
+        self.thread.join(STOP_TIMEOUT)
+        self.thread=None
+        print("Recording to",self.fname,"stopped.",self.written,"frames written",self.dropped,"dropped")
+
+    def isRecording(self):
+        '''
+        :return: True between start() and stop()
+        '''
+        return self.running
+
+    def write(self,frame,overlay=None):
+        '''
+        Queue a frame, dropping the oldest waiting frame if the queue is full
+
+        :param frame: numpy BGR image, not changed afterwards
+        :param overlay: robots etc. to draw on it, see Overlay.py. Ignored for raw recordings
+        :return: Nothing
+        '''
+        if not self.running: return
+        with self.condition:
+            if len(self.queue)==self.queue.maxlen:
+                self.dropped+=1     # the deque drops the oldest
+            self.queue.append((frame,None if self.raw else overlay))
+            self.condition.notify()
+
+    def writeFrames(self,writer):
+        '''
+        The writer thread
+
+        :param writer: cv2.VideoWriter
+        :return: when stopped and the queue is empty
+        '''
+        layer=StaticLayer()
+        try:
+            while True:
+                with self.condition:
+                    while self.running and not self.queue:
+                        self.condition.wait()
+                    if not self.queue: break
+                    frame,overlay=self.queue.popleft()
+
+                w=frame.shape[1]
+                if frame.shape[1::-1]!=self.size:
+                    frame=cv2.resize(frame,self.size)
+                elif overlay is not None:
+                    frame=frame.copy()  # the caller still has it
+                if overlay is not None:
+                    drawOverlay(frame,overlay,self.size[0]/w,layer)
+                writer.write(frame)
+                self.written+=1
+        finally:
+            writer.release()
+
+    def stats(self):
+        '''
+        :return: dict recording, frames written, dropped and waiting
+        '''
+        return {"recording":self.running,"written":self.written,"dropped":self.dropped,"queued":len(self.queue)}
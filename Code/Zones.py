@@ -0,0 +1,127 @@
+"""
+Zones.py
+
+Tells the game controllers when a robot enters or leaves a zone of the
+arena, e.g. a Robot Rugby try zone or the pitch, within the frame it
+happens instead of them polling the positions.
+
+The zones are polygons in mm from the arena's config. They are drawn once
+into a raster of ZONE_MM cells, each cell holding one bit per zone, so
+testing a robot is one lookup however many zones there are or however
+complicated their shapes. Zones may overlap. The cells are laid out the
+same way as the path planner's (see ArenaGrid.py) and are made bigger if
+the zones cover so large an area, e.g. a full size pitch, that the raster
+would have more than MAX_CELLS cells.
+
+Each frame every robot's bits are compared with the last frame's and only
+the differences are published, one message per event:
+
+    {"event":"enter","zone":"try1","botId":3,"x":1245,"y":841,"seq":1234,"time":1700000000.123}
+
+A robot which isn't seen in a frame keeps its zones until it is seen again.
+stats() reports the events per second and the time each frame's check takes.
+
+typical usage:
+    zones=Zones(MQTT,"pixelbot/events",{"try1":[(0,0),(300,0),(300,1400),(0,1400)]})
+    zones.update(snapshot)      # each frame, see RobotSnapshot.py
+"""
+
+import json
+import numpy as np
+from ArenaGrid import MAX_CELLS,cellOf,cellSize,fillPolygon
+from Stats import RateMeter,TimeMeter
+
+ZONE_MM=10          # raster cell size, larger for large zones
+MAX_ZONES=32        # one bit each
+
+
+class Zones:
+
+    def __init__(self,MQTT,topic,zones,cell=ZONE_MM):
+        '''
+        :param MQTT: MqttManager.MQTT used to publish
+        :param topic: str e.g. "pixelbot/events"
+        :param zones: dict zones[name]=polygon, a list of (x,y) mm
+        :param cell: int preferred raster cell size mm
+        '''
+        if len(zones)>MAX_ZONES:
+            raise ValueError("Zones: at most {0} zones".format(MAX_ZONES))
+        self.MQTT=MQTT
+        self.topic=topic
+        self.names=list(zones)
+
+        polygons=[np.array(p,np.float64) for p in zones.values()]
+        if polygons:
+            points=np.concatenate(polygons)
+            low,high=points.min(axis=0),points.max(axis=0)
+            cell=cellSize(high-low+cell,cell,MAX_CELLS)
+            c0,r0=cellOf(low[0],low[1],cell)
+            c1,r1=cellOf(high[0],high[1],cell)
+        else:
+            c0,r0,c1,r1=0,0,0,0
+        self.cell=cell
+        self.origin=(c0,r0)     # cell of the raster's top left
+        self.raster=np.zeros((r1-r0+1,c1-c0+1),np.uint32)
+        layer=np.zeros(self.raster.shape,np.uint8)
+        for bit,polygon in enumerate(polygons):
+            layer[:]=0
+            fillPolygon(layer,polygon,cell,self.origin)
+            self.raster|=layer.astype(np.uint32)<<np.uint32(bit)
+
+        self.inside={}      # inside[botId]=bits of the zones it was last seen in
+        self.events=RateMeter()
+        self.checkTime=TimeMeter()
+
+    def bitsAt(self,x,y):
+        '''
+        :param x: mm
+        :param y: mm
+        :return: int, bit n set if (x,y) is in zone n
+        '''
+        c,r=cellOf(x,y,self.cell)
+        c-=self.origin[0]
+        r-=self.origin[1]
+        rows,cols=self.raster.shape
+        if 0<=r<rows and 0<=c<cols:
+            return int(self.raster[r,c])
+        return 0
+
+    def zonesAt(self,x,y):
+        '''
+        :return: list of the names of the zones (x,y) mm is in
+        '''
+        bits=self.bitsAt(x,y)
+        return [name for i,name in enumerate(self.names) if bits>>i&1]
+
+    def update(self,snapshot):
+        '''
+        Check the robots of a new frame and publish any enter/exit events
+
+        :param snapshot: RobotSnapshot
+        :return: Nothing
+        '''
+        with self.checkTime:
+            events=[]
+            for botId,(x,y,heading) in snapshot.robots.items():
+                if botId is None: continue
+                bits=self.bitsAt(x,y)
+                last=self.inside.get(botId,0)
+                if bits==last: continue
+                self.inside[botId]=bits
+                changed=bits^last
+                for i,name in enumerate(self.names):
+                    if changed>>i&1:
+                        events.append(("enter" if bits>>i&1 else "exit",name,botId,x,y))
+
+        for event,name,botId,x,y in events:
+            self.MQTT.publishPayload(self.topic,json.dumps({"event":event,"zone":name,"botId":botId,
+                                                            "x":x,"y":y,"seq":snapshot.seq,
+                                                            "time":round(snapshot.captureTime,3)}),
+                                     coalesce=False)     # every event matters, not just the latest
+            self.events.add()
+
+    def stats(self):
+        '''
+        :return: dict events published per second and the time the check of each frame takes
+        '''
+        return {"eventsPerSec":self.events.read(),"checkTime":self.checkTime.read()}
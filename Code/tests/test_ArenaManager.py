@@ -0,0 +1,114 @@
+import os
+import time
+import ArenaManager
+from ArenaManager import recordingPath
+from RobotSnapshot import RobotStore
+from SpatialIndex import Obstacles
+
+
+class Worker:
+    '''
+    Stands in for ArenaWorker, keeps the commands
+    '''
+
+    def __init__(self):
+        self.commands=[]
+
+    def command(self,method,*args):
+        self.commands.append((method,)+args)
+
+
+class MQTT:
+    '''
+    Stands in for MqttManager.MQTT
+    '''
+
+    def __init__(self):
+        self.messages=[]
+
+    def publishPayload(self,topic,payload,retain=False,coalesce=True):
+        self.messages.append((topic,payload))
+
+
+def arena(tmp_path):
+    '''
+    :return: an Arena without its detection process
+    '''
+    a=ArenaManager.Arena.__new__(ArenaManager.Arena)
+    a.name="test"
+    a.Strings=ArenaManager.StringDefs("pixelbot/")
+    a.worker=Worker()
+    a.recordings=str(tmp_path/"recordings")
+    a.MQTT=MQTT()
+    a.robots=RobotStore()
+    a.robots.publish(1,time.time(),{3:(100,100,0),4:(300,100,90)})
+    a.obstacles=Obstacles([])
+    return a
+
+
+BAD_REPLY_TOPICS=["pixelbot/4","pixelbot/4/pose","pixelbot/location","pixelbot/location/bin","pixelbot/arena",
+                  "pixelbot/events","pixelbot/","pixelbot/+","pixelbot/c/#","pixelbot2/controller","other/topic",
+                  "controller1",3,None,["pixelbot/c"],{"t":1}]
+
+
+def replyTopics(a,command,bad=BAD_REPLY_TOPICS):
+    a.MQTT.messages=[]
+    for topic in ["pixelbot/controller1","pixelbot/controllers/2"]+bad:
+        a.on_message(dict(command,replyTo=topic))
+    return [topic for topic,payload in a.MQTT.messages]
+
+
+def test_recording_path(tmp_path):
+    directory=str(tmp_path/"recordings")
+    assert recordingPath(directory,"match1.avi")==os.path.join(directory,"match1.avi")
+    assert recordingPath(directory,"Final-2.MP4")==os.path.join(directory,"Final-2.MP4")
+    assert os.path.isdir(directory)
+    for fname in ("../../home/x/.bashrc","../match.avi","/tmp/match.avi","sub/match.avi","sub\\match.avi",
+                  ".hidden.avi","match.sh","match","match.avi\0.sh","","a"*200+".avi",None,3,["match.avi"]):
+        assert recordingPath(directory,fname) is None,fname
+
+
+def test_record_command(tmp_path):
+    a=arena(tmp_path)
+    a.on_message({"cmd":"record","state":"on","file":"match1.avi","fps":15,"raw":True})
+    a.on_message({"cmd":"record","state":"on"})
+    assert a.worker.commands==[("startRecording",str(tmp_path/"recordings"/"match1.avi"),15,True),
+                               ("startRecording",str(tmp_path/"recordings"/"output.avi"),10,False)]
+
+    a.worker.commands=[]
+    for bad in ({"file":"../../home/x/.bashrc"},{"file":"/etc/passwd.avi"},{"fps":"10"},{"fps":0},
+                {"fps":1e9},{"raw":"yes"}):
+        a.on_message(dict({"cmd":"record","state":"on"},**bad))
+    assert a.worker.commands==[]
+    a.on_message({"cmd":"record","state":"off"})
+    assert a.worker.commands==[("stopRecording",)]
+
+
+def test_query_reply_topics(tmp_path):
+    a=arena(tmp_path)
+    # replyTo:None is a bad topic when one is needed
+    assert replyTopics(a,{"cmd":"getAllRobots"})==["pixelbot/controller1","pixelbot/controllers/2"]
+    a.MQTT.messages=[]
+    a.on_message({"cmd":"getAllRobots"})
+    assert a.MQTT.messages==[]
+
+    # loc replies to the robot unless there's an allowed replyTo, its own topic is allowed
+    bad=[t for t in BAD_REPLY_TOPICS if t is not None]
+    assert replyTopics(a,{"cmd":"loc","botId":3},bad+["pixelbot/3"])==["pixelbot/controller1","pixelbot/controllers/2",
+                                                                     "pixelbot/3"]
+    a.MQTT.messages=[]
+    a.on_message({"cmd":"loc","botId":3})
+    assert [topic for topic,payload in a.MQTT.messages]==["pixelbot/3"]
+
+
+def test_near_reply_topics(tmp_path):
+    a=arena(tmp_path)
+    bad=[t for t in BAD_REPLY_TOPICS if t is not None]
+    expected=["pixelbot/controller1","pixelbot/controllers/2","pixelbot/3"]
+    assert replyTopics(a,{"cmd":"near","botId":3},bad+["pixelbot/3"])==expected
+    assert replyTopics(a,{"cmd":"nearest","botId":3},bad+["pixelbot/3"])==expected
+    assert replyTopics(a,{"cmd":"nearest","x":0,"y":0,"k":2})==expected[:2]
+    a.MQTT.messages=[]
+    a.on_message({"cmd":"nearest","x":0,"y":0})
+    a.on_message({"cmd":"near","botId":3})
+    assert [topic for topic,payload in a.MQTT.messages]==["pixelbot/3"]
@@ -0,0 +1,49 @@
+import time
+import cv2
+import numpy as np
+from ArenaProcessing import ArenaProcessor
+from DetectionLog import DetectionLog,DetectionLogReader
+
+CLIP_FPS=20
+CLIP_FRAMES=10
+
+
+def makeClip(path,size):
+    '''
+    A short clip, each frame a different flat grey so there is nothing to detect
+    '''
+    writer=cv2.VideoWriter(str(path),cv2.VideoWriter_fourcc(*"MJPG"),CLIP_FPS,size)
+    for i in range(CLIP_FRAMES):
+        frame=np.full((size[1],size[0],3),20+i*20,np.uint8)
+        writer.write(frame)
+    writer.release()
+
+
+def test_one_log_record_per_captured_frame(tmp_path):
+    size=(640,480)
+    clip=tmp_path/"clip.avi"
+    makeClip(clip,size)
+    AP=ArenaProcessor(size,cameraIndex=str(clip))
+    log=DetectionLog(str(tmp_path/"test.dlog"))
+    try:
+        # as ArenaWorker does, calling update() as fast as it returns
+        updates=0
+        lastSeq=None
+        end=time.time()+1.5
+        while time.time()<end:
+            AP.update()
+            seq,captureTime=AP.getFrameInfo()
+            if seq!=lastSeq:
+                log.write(seq,captureTime,{1:(100,200,90)})
+            lastSeq=seq
+            updates+=1
+    finally:
+        log.close()
+        AP.cam.release()    # stop() also closes the debug windows, headless opencv can't
+
+    records=DetectionLogReader(str(tmp_path/"test.dlog")).query()
+    # update() waits for each frame instead of returning the same one hundreds of times a second
+    assert updates<=1.5*CLIP_FPS+5
+    assert len(records)>=CLIP_FPS
+    assert len(set(records["time"]))==len(records)
+    assert list(records["seq"])==list(range(records["seq"][0],records["seq"][0]+len(records)))
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import cv2
+import numpy as np
+
+CODE=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in a fresh interpreter, so ArenaProcessing and Camera haven't been imported before the worker starts
+WORKER=textwrap.dedent('''
+    import sys
+    from ArenaWorker import ArenaWorker
+    worker=ArenaWorker({"name":"test","camera":sys.argv[1],"settings":sys.argv[2]})
+    worker.start()
+    try:
+        assert worker.read(20) is not None,"no result from the worker"
+        result=None
+        while result is None:
+            result=worker.readFrame()
+        with open(sys.argv[3],"w") as f:
+            f.write(str(result[1].shape))
+    finally:
+        worker.stop()
+''')
+
+
+def test_worker_uses_its_own_profile(tmp_path):
+    clip=str(tmp_path/"clip.avi")
+    writer=cv2.VideoWriter(clip,cv2.VideoWriter_fourcc(*"MJPG"),10,(640,480))
+    for i in range(10):
+        writer.write(np.full((480,640,3),20*i,np.uint8))
+    writer.release()
+
+    with open(os.path.join(CODE,"Settings.json")) as f:
+        settings=json.load(f)
+    assert settings["FRAME_WIDTH"]!=1280
+    settings["FRAME_WIDTH"],settings["FRAME_HEIGHT"]=1280,720
+    profile=str(tmp_path/"profile.json")
+    with open(profile,"w") as f:
+        json.dump(settings,f)
+
+    shape=str(tmp_path/"shape.txt")
+    done=subprocess.run([sys.executable,"-c",WORKER,clip,profile,shape],cwd=CODE,capture_output=True,text=True,timeout=60)
+    assert done.returncode==0,done.stderr
+    # the replayed frames are resized to the profile's frame size, not Settings.json's
+    with open(shape) as f:
+        assert f.read()=="(720, 1280, 3)"
@@ -0,0 +1,73 @@
+import numpy as np
+from DetectionLog import DetectionLog,DetectionLogReader,INDEX_EVERY,INDEX_ID,NO_HEADING
+
+FRAMES=1500         # 3 robots a frame, over four blocks
+START=1700000000.0
+
+
+def frame(seq):
+    '''
+    :return: (captureTime,robots) for a frame
+    '''
+    robots={1:(seq,2*seq,90),2:(100+seq,50,None),5:(7.5,seq%1400,seq%360)}
+    return START+seq/30,robots
+
+
+def writeFrames(fname,seqs):
+    log=DetectionLog(fname)
+    for seq in seqs:
+        captureTime,robots=frame(seq)
+        log.write(seq,captureTime,robots,{1:0.5,2:1.0,5:0.25})
+    log.close()
+
+
+def test_round_trip(tmp_path):
+    fname=str(tmp_path/"arena.dlog")
+    # reopened part way through a block
+    writeFrames(fname,range(1,1001))
+    writeFrames(fname,range(1001,FRAMES+1))
+    with open(fname,"ab") as f:
+        f.write(b"\1\2\3")      # a partly written record
+    writeFrames(fname,[])
+
+    reader=DetectionLogReader(fname)
+    assert len(reader)==3*FRAMES
+    assert len(reader.records)>3*INDEX_EVERY
+    assert (reader.index["id"]==INDEX_ID).all()
+
+    d=reader.query()
+    assert len(d)==3*FRAMES
+    assert list(d["seq"][:6])==[1,1,1,2,2,2]
+    assert list(d["id"][:3])==[1,2,5]
+    seq=d["seq"].astype(np.int64)
+    bot1=d[d["id"]==1]
+    assert np.array_equal(bot1["x"],np.arange(1,FRAMES+1))
+    assert np.array_equal(bot1["y"],2*np.arange(1,FRAMES+1))
+    assert (d["heading"][d["id"]==2]==NO_HEADING).all()
+    assert np.array_equal(d["time"],START+seq/30)
+    assert np.allclose(d["confidence"][d["id"]==5],0.25)
+
+
+def test_find_at_block_boundaries(tmp_path):
+    fname=str(tmp_path/"arena.dlog")
+    writeFrames(fname,range(1,FRAMES+1))
+    reader=DetectionLogReader(fname)
+    times=reader.records["time"]
+
+    # every slot either side of each index record
+    slots=[s+o for s in range(0,len(times),INDEX_EVERY) for o in (-2,-1,0,1,2) if 0<=s+o<len(times)]
+    for slot in slots:
+        for t in (times[slot],np.nextafter(times[slot],0),np.nextafter(times[slot],np.inf)):
+            found=reader.find(t)
+            assert found==int(np.searchsorted(times,t,"left")),(slot,t)
+
+    assert reader.find(0)==0
+    assert reader.find(times[-1]+1)==len(times)
+
+    # queries across the boundaries match a plain filter of every record
+    detections=reader.records[reader.records["id"]!=INDEX_ID]
+    for seqs in ((300,400),(340,350),(1,FRAMES),(680,684)):
+        start,end=frame(seqs[0])[0],frame(seqs[1])[0]
+        d=reader.query(start,end,botId=2)
+        expected=detections[(detections["time"]>=start)&(detections["time"]<end)&(detections["id"]==2)]
+        assert np.array_equal(d,expected)
@@ -0,0 +1,45 @@
+import threading
+import time
+import MqttManager
+
+
+class Message:
+    '''
+    Stands in for paho's MQTTMessage
+    '''
+
+    def __init__(self,topic,payload):
+        self.topic=topic
+        self.payload=payload
+
+
+def test_messages_past_the_limit_are_dropped(monkeypatch):
+    monkeypatch.setattr(MqttManager,"MAX_MESSAGES",5)
+    monkeypatch.setattr(MqttManager.MQTT,"connectToBroker",lambda self:False)
+    mqtt=MqttManager.MQTT()
+
+    release=threading.Event()
+    handled=[]
+    def handler(msgDic):
+        release.wait(5)
+        handled.append(msgDic["n"])
+    mqtt.handlers["pixelbot/arena"]=handler
+
+    for n in range(20):
+        mqtt.on_handled_message(None,None,Message("pixelbot/arena",'{{"n":{0}}}'.format(n)))
+    stats=mqtt.stats()
+    assert stats["messagesWaiting"]==5
+    assert stats["messagesDropped"]==15
+
+    release.set()
+    deadline=time.time()+5
+    while mqtt.stats()["messagesWaiting"] and time.time()<deadline:
+        time.sleep(0.01)
+    assert sorted(handled)==[0,1,2,3,4]
+    assert mqtt.stats()["messagesWaiting"]==0
+
+    # there's room again
+    mqtt.on_handled_message(None,None,Message("pixelbot/arena",'{"n":20}'))
+    mqtt.workers.shutdown(wait=True)
+    assert handled[-1]==20
+    assert mqtt.stats()["messagesDropped"]==15
@@ -0,0 +1,82 @@
+import multiprocessing
+import time
+import numpy as np
+import pytest
+import MultiCamera
+from MultiCamera import MultiCameraProcessor
+from Overlay import emptyOverlay
+
+
+def fakeCamera(conn,botId,interval,count=None,then=None):
+    '''
+    Sends a result like cameraWorker() every interval seconds, after count
+    results it exits if then is None or goes quiet for then seconds
+    '''
+    preview=np.zeros((360,640,3),np.uint8)
+    sent=0
+    try:
+        while not conn.poll():
+            if sent==count:
+                if then is None: return
+                time.sleep(then)
+            conn.send((preview,[(botId,(100*botId,200),90,1.0,0.9)],time.time(),emptyOverlay()))
+            sent+=1
+            time.sleep(interval)
+    except (EOFError,BrokenPipeError):
+        pass
+
+
+def startFakes(MC,cameras):
+    for args in cameras:
+        parentConn,childConn=multiprocessing.Pipe()
+        p=multiprocessing.Process(target=fakeCamera,args=(childConn,)+args)
+        p.daemon=True
+        p.start()
+        MC.workers.append((p,parentConn))
+        MC.results.append(None)
+
+
+def test_slow_camera_does_not_hold_up_the_others():
+    MC=MultiCameraProcessor((1920,1080),[])
+    startFakes(MC,[(1,0.02),(2,1.5)])
+    try:
+        began=time.time()
+        seqs=[]
+        for _ in range(20):
+            MC.update()
+            seqs.append(MC.getFrameInfo()[0])
+        # 20 results from the fast camera take about 0.4s, the slow one sends one in 1.5s
+        assert time.time()-began<1.2
+        assert seqs==list(range(1,21))
+        while 2 not in MC.getRobots():
+            assert time.time()-began<5
+            MC.update()
+        assert set(MC.getRobots())=={1,2}
+    finally:
+        MC.stop()
+
+
+
+def test_stopped_and_quiet_cameras_are_left_out(monkeypatch):
+    monkeypatch.setattr(MultiCamera,"CAMERA_TIMEOUT",0.3)
+    MC=MultiCameraProcessor((1920,1080),[])
+    # camera 2 exits after 5 results, camera 3 goes quiet for a long time after 5
+    startFakes(MC,[(1,0.02),(2,0.02,5),(3,0.02,5,60)])
+    try:
+        seen=set()
+        end=time.time()+1.5
+        while time.time()<end:
+            MC.update()
+            seen|=set(MC.getRobots())
+        assert seen=={1,2,3}
+        assert set(MC.getRobots())=={1}
+        # the capture time is camera 1's, not held back by the others
+        assert time.time()-MC.getFrameInfo()[1]<0.2
+    finally:
+        MC.stop()
+
+
+def test_cameras_need_a_homography():
+    with pytest.raises(ValueError,match="right.avi"):
+        MultiCameraProcessor((1920,1080),[{"SOURCE":"left.avi","ARENA_HOMOGRAPHY":np.eye(3).tolist()},
+                                          {"SOURCE":"right.avi"}])
@@ -0,0 +1,145 @@
+import heapq
+import json
+import random
+import time
+import PathPlanner
+from PathPlanner import DStarLite,OccupancyGrid,Plan
+from RobotSnapshot import RobotStore
+
+WALL=[[(900,400),(1000,400),(1000,1400),(900,1400)]]
+
+
+class Publisher:
+    '''
+    Stands in for MqttManager.MQTT
+    '''
+
+    def __init__(self):
+        self.messages=[]
+
+    def publishPayload(self,topic,payload,retain=False,coalesce=True):
+        self.messages.append((topic,json.loads(payload)))
+
+
+def test_long_search_is_pending_not_unreachable(monkeypatch):
+    monkeypatch.setattr(PathPlanner,"MAX_EXPANSIONS",50)
+    MQTT=Publisher()
+    planner=PathPlanner.PathPlanner(MQTT,"pixelbot/{0}/path",(2000,1400),WALL)
+    store=RobotStore()
+    plan=planner.plans[1]=Plan((1900,700))
+    frames=0
+    while plan.pending or not plan.published:
+        frames+=1
+        assert frames<1000
+        snapshot=store.publish(frames,time.time(),{1:(100,700,0)})
+        planner.replan(1,plan,snapshot,{})
+
+    messages=[m for topic,m in MQTT.messages]
+    assert frames>1
+    assert messages[0]["status"]=="pending" and "path" not in messages[0]
+    # pending is published once, then the path when the search finishes
+    assert len(messages)==2
+    assert messages[1]["path"][-1]==[1900,700]
+    assert planner.stats()["unreachable"]==0
+
+
+def dijkstra(grid,start,goal,blocked):
+    '''
+    :return: the cost of the cheapest way from start to goal or None, the reference for D* Lite
+    '''
+    best={start:0}
+    queue=[(0,start)]
+    while queue:
+        cost,cell=heapq.heappop(queue)
+        if cell==goal: return cost
+        if cost>best[cell]: continue
+        for n,step in grid.neighbours(cell):
+            if n in grid.static or n in blocked: continue
+            if cost+step<best.get(n,PathPlanner.INF):
+                best[n]=cost+step
+                heapq.heappush(queue,(cost+step,n))
+    return None
+
+
+def pathCost(grid,cells):
+    total=0
+    for a,b in zip(cells,cells[1:]):
+        costs=dict(grid.neighbours(a))
+        assert b in costs,"not a step between neighbours"
+        total+=costs[b]
+    return total
+
+
+def test_dstar_lite_matches_dijkstra():
+    random.seed(49)
+    W,H=1200,800    # small enough for 200 trials to run in seconds
+    for trial in range(200):
+        obstacles=[]
+        for _ in range(random.randint(0,5)):
+            x,y=random.uniform(0,W),random.uniform(0,H)
+            w,h=random.uniform(40,300),random.uniform(40,300)
+            obstacles.append([(x,y),(x+w,y),(x+w,y+h),(x,y+h)])
+        grid=OccupancyGrid((W,H),obstacles)
+        others=[(random.uniform(0,W),random.uniform(0,H)) for _ in range(4)]
+
+        def blocked():
+            cells=set()
+            for x,y in others: cells|=grid.robotCells(x,y)
+            return cells
+
+        free=[(c,r) for c in range(grid.cols) for r in range(grid.rows) if (c,r) not in grid.static]
+        start,goal=random.sample(free,2)
+        planner=DStarLite(grid,start,goal,blocked())
+        for step in range(10):
+            assert planner.computePath()
+            cells=planner.path()
+            cost=dijkstra(grid,planner.start,goal,planner.blocked)
+            if cost is None:
+                assert cells is None,(trial,step)
+            else:
+                assert cells is not None and cells[0]==planner.start and cells[-1]==goal,(trial,step)
+                assert not any(planner.isBlocked(c) for c in cells[1:]),(trial,step)
+                assert pathCost(grid,cells)==cost,(trial,step)
+                # the robot drives along its path while the others wander
+                if len(cells)>1: planner.moveTo(cells[min(2,len(cells)-1)])
+            others=[(x+random.uniform(-80,80),y+random.uniform(-80,80)) for x,y in others]
+            planner.setBlocked(blocked())
+
+
+def test_targets_outside_the_arena_are_refused():
+    planner=PathPlanner.PathPlanner(Publisher(),"pixelbot/{0}/path",(2000,1400),WALL)
+    for target in ((-1,700),(2001,700),(1000,-0.5),(1000,1401),(float("nan"),700),(1000,float("inf"))):
+        assert not planner.request(1,target),target
+    assert planner.requests=={}
+    assert planner.request(1,(2000,0))
+    assert planner.request(1,None)
+
+
+def test_unseen_and_unreachable_plans_expire(monkeypatch):
+    monkeypatch.setattr(PathPlanner,"PLAN_TIMEOUT",0.3)
+    MQTT=Publisher()
+    planner=PathPlanner.PathPlanner(MQTT,"pixelbot/{0}/path",(2000,1400),WALL)
+    store=RobotStore()
+    planner.start()
+    try:
+        planner.request(1,(950,800))      # inside the wall
+        planner.request(2,(1500,700))     # never seen
+        planner.request(3,(1500,300))
+        for seq in range(12):
+            planner.update(store.publish(seq,time.time(),{1:(100,700,0),3:(100,300,0)}))
+            time.sleep(0.05)
+        assert planner.stats()["active"]==1
+        # no more frames, robot 3's plan goes stale too
+        time.sleep(0.4)
+        assert planner.stats()["active"]==0
+        planner.update(store.publish(12,time.time(),{1:(100,700,0)}))
+        time.sleep(0.1)
+    finally:
+        planner.stop()
+
+    last={topic:m for topic,m in MQTT.messages}
+    assert [m["path"] for topic,m in MQTT.messages if topic=="pixelbot/1/path"]==[None,[]]
+    for botId in (1,2,3):
+        assert last["pixelbot/{0}/path".format(botId)]["expired"]
+    assert planner.plans=={}
+    assert planner.stats()["expired"]==3
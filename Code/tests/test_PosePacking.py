@@ -0,0 +1,45 @@
+import pytest
+import PosePacking
+from PosePacking import encode,decode,HEADER_BYTES,RECORD_BYTES
+
+
+def test_round_trip():
+    robots={1:(0,0,0),3:(1245,841,49),7:(-300,1399,359),12:(2000,-1,None),255:(5,6,180)}
+    confidence={1:0.0,3:0.9,7:1.0,12:0.5}
+    payload=encode(1234,1700000000.123,robots,confidence)
+    assert len(payload)==HEADER_BYTES+len(robots)*RECORD_BYTES
+
+    seq,captureTime,decoded=decode(payload)
+    assert seq==1234
+    assert captureTime==1700000000.123
+    assert list(decoded)==list(robots)
+    for botId,(x,y,heading) in robots.items():
+        assert decoded[botId][:3]==(x,y,heading)
+    assert [decoded[botId][3] for botId in robots]==[0.0,0.9,1.0,0.5,0.0]
+
+    # no confidence means fully confident, and the unknown robot ids are left out
+    seq,captureTime,decoded=decode(encode(2**32+5,0.0,{None:(1,2,3),256:(1,2,3),4:(1,2,3)}))
+    assert seq==5
+    assert decoded=={4:(1,2,3,1.0)}
+
+
+def test_out_of_range_values_are_clamped():
+    robots={1:(40000,-40000,725),2:(-32769,32768,-90),3:(12.7,-12.7,359.9),4:(0,0,-0.4),5:(0,0,89.6)}
+    confidence={1:1.5,2:-0.5,3:0.333}
+    seq,captureTime,decoded=decode(encode(1,0.0,robots,confidence))
+    assert decoded[1]==(32767,-32768,5,1.0)
+    assert decoded[2]==(-32768,32767,270,0.0)
+    # headings are rounded, 359.9 is nearer 0 than 359
+    assert decoded[3]==(12,-12,0,0.33)
+    assert decoded[4][2]==0
+    assert decoded[5][2]==90
+
+
+def test_bad_payloads():
+    payload=encode(1,0.0,{1:(1,2,3)})
+    with pytest.raises(ValueError):
+        decode(payload[:HEADER_BYTES-1])
+    with pytest.raises(ValueError):
+        decode(payload[:-1])
+    with pytest.raises(ValueError):
+        decode(bytes([PosePacking.POSE_VERSION+1])+payload[1:])
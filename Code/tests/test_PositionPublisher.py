@@ -0,0 +1,32 @@
+import json
+import time
+import PositionPublisher
+from PositionPublisher import PositionPublisher as Publisher
+
+
+class MQTT:
+    '''
+    Stands in for MqttManager.MQTT
+    '''
+
+    def __init__(self):
+        self.messages=[]
+
+    def publishPayload(self,topic,payload,retain=False,coalesce=True):
+        self.messages.append((time.time(),topic,payload))
+
+
+def test_pose_heartbeat_when_the_camera_stalls(monkeypatch):
+    monkeypatch.setattr(PositionPublisher,"POSE_HEARTBEAT",0.1)
+    mqtt=MQTT()
+    publisher=Publisher(mqtt,"pixelbot/location",rate=50,poseTopic="pixelbot/{0}/pose")
+    publisher.update(1,time.time(),{3:(100,200,90)})     # and nothing after that
+    publisher.start()
+    time.sleep(0.65)
+    publisher.stop()
+
+    poses=[(t,json.loads(payload)) for t,topic,payload in mqtt.messages if topic=="pixelbot/3/pose"]
+    assert 5<=len(poses)<=8
+    assert all(pose["seq"]==1 and pose["x"]==100 for t,pose in poses)
+    gaps=[b[0]-a[0] for a,b in zip(poses,poses[1:])]
+    assert min(gaps)>=0.09
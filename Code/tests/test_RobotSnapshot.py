@@ -0,0 +1,47 @@
+import json
+import pytest
+from RobotSnapshot import RobotStore
+
+
+def test_a_reply_is_built_once_per_key():
+    store=RobotStore()
+    snapshot=store.publish(1,1000.0,{1:(100,200,90),2:(300,400,180)})
+    builds=[]
+    def build(s):
+        builds.append(s.version)
+        return json.dumps({"robots":{str(k):v for k,v in s.robots.items()}})
+
+    first=snapshot.reply(("all",),build)
+    assert snapshot.reply(("all",),build) is first
+    assert store.get().reply(("all",),build) is first
+    assert builds==[1]
+    snapshot.reply(("loc",1),lambda s:json.dumps(s.robots[1]))
+    assert builds==[1]
+
+
+def test_a_new_snapshot_has_its_own_replies():
+    store=RobotStore()
+    old=store.publish(1,1000.0,{1:(100,200,90)})
+    build=lambda s:json.dumps({"seq":s.seq,"robots":{str(k):v for k,v in s.robots.items()}})
+    oldPayload=old.reply(("all",),build)
+
+    new=store.publish(2,1000.1,{1:(110,200,90)})
+    assert new.version==old.version+1
+    assert store.get() is new
+    newPayload=new.reply(("all",),build)
+    assert newPayload is not oldPayload
+    assert json.loads(newPayload)=={"seq":2,"robots":{"1":[110,200,90]}}
+    # a query still holding the old snapshot gets the old reply
+    assert old.reply(("all",),build) is oldPayload
+
+
+def test_robots_are_read_only():
+    robots={1:(100,200,90)}
+    snapshot=RobotStore().publish(1,1000.0,robots)
+    with pytest.raises(TypeError):
+        snapshot.robots[2]=(0,0,0)
+    with pytest.raises(AttributeError):
+        snapshot.extra=1
+    # copied, so changing the detector's dict afterwards doesn't change the snapshot
+    robots[2]=(0,0,0)
+    assert dict(snapshot.robots)=={1:(100,200,90)}
@@ -0,0 +1,49 @@
+import multiprocessing
+import time
+import numpy as np
+from SharedFrame import SharedFrame
+
+SHAPE=(1080,1920,3)
+
+
+def writer(slot,stopEvent,written):
+    '''
+    Writes frames as fast as it can, every byte of a frame is its seq
+    '''
+    frame=np.empty(SHAPE,np.uint8)
+    seq=0
+    while not stopEvent.is_set():
+        seq+=1
+        frame[...]=seq&0xff
+        slot.write(frame,seq)
+    written.value=seq
+
+
+def test_reader_never_sees_a_torn_frame():
+    slot=SharedFrame(int(np.prod(SHAPE)))
+    stopEvent=multiprocessing.Event()
+    written=multiprocessing.Value("q",0)
+    p=multiprocessing.Process(target=writer,args=(slot,stopEvent,written))
+    p.start()
+    try:
+        reads=0
+        lastSeq=None
+        end=time.time()+2.0
+        while time.time()<end:
+            result=slot.read(lastSeq)
+            if result is None: continue
+            seq,frame=result
+            assert lastSeq is None or seq>lastSeq
+            # a frame overwritten whilst being copied would have bytes of two seqs
+            assert frame.min()==frame.max()==seq&0xff,"torn frame {0}".format(seq)
+            lastSeq=seq
+            reads+=1
+            time.sleep(0.01)    # a slow reader
+    finally:
+        stopEvent.set()
+        p.join(5)
+        slot.close()
+        slot.unlink()
+
+    assert reads>=20
+    assert written.value>2*reads     # the writer really did run faster
@@ -0,0 +1,98 @@
+import math
+import random
+import time
+from SpatialIndex import GridIndex,Obstacles
+
+
+def bruteNear(robots,x,y,radius,exclude=None):
+    return sorted((math.hypot(p[0]-x,p[1]-y),b) for b,p in robots.items()
+                  if b is not None and b!=exclude and math.hypot(p[0]-x,p[1]-y)<=radius)
+
+
+def bruteNearest(robots,x,y,k,exclude=None):
+    return sorted((math.hypot(p[0]-x,p[1]-y),b) for b,p in robots.items()
+                  if b is not None and b!=exclude)[:k]
+
+
+def check(index,robots,x,y,radius,k,exclude=None):
+    near=index.near(x,y,radius,exclude)
+    assert sorted((d,b) for d,b,p in near)==bruteNear(robots,x,y,radius,exclude)
+    assert [d for d,b,p in near]==sorted(d for d,b,p in near)
+    assert all(p==robots[b] for d,b,p in near)
+    # robots the same distance away may come in either order
+    nearest=index.nearest(x,y,k,exclude)
+    assert [d for d,b,p in nearest]==[d for d,b in bruteNearest(robots,x,y,k,exclude)]
+    assert all(math.hypot(p[0]-x,p[1]-y)==d and p==robots[b] for d,b,p in nearest)
+
+
+def test_random_against_brute_force():
+    random.seed(48)
+    for trial in range(500):
+        robots={i:(random.uniform(-300,2300),random.uniform(-300,1700),random.choice([None,random.randint(0,359)]))
+                for i in range(1,random.randint(0,40)+1)}
+        cell=random.choice([50,200,700])
+        index=GridIndex(robots,cell)
+        x,y=random.uniform(-1000,3000),random.uniform(-1000,2500)
+        check(index,robots,x,y,random.uniform(0,1000),random.randint(1,12),random.choice([None,1,2]))
+
+
+def test_empty():
+    index=GridIndex({})
+    assert index.near(0,0,1000)==[]
+    assert index.nearest(0,0,3)==[]
+    index=GridIndex({None:(10,10,0)})      # unidentified robots are left out
+    assert index.nearest(0,0,3)==[]
+
+
+def test_empty_cells():
+    # two robots far apart, the cells between them and round the point are empty
+    robots={1:(100,100,0),2:(1900,1300,90)}
+    index=GridIndex(robots,200)
+    for x,y in ((1000,700),(-2000,-2000),(5000,100)):
+        check(index,robots,x,y,250,1)
+        check(index,robots,x,y,5000,2)
+    assert index.near(1000,700,250)==[]
+    assert [b for d,b,p in index.nearest(1000,700,1)]==[2]
+
+
+def test_on_cell_boundaries():
+    # robots exactly on the lines between cells and exactly radius away
+    robots={1:(200,200,0),2:(400,200,0),3:(200,0,0),4:(0,0,0),5:(-200,200,0)}
+    index=GridIndex(robots,200)
+    assert sorted(b for d,b,p in index.near(200,200,200))==[1,2,3]
+    assert sorted(b for d,b,p in index.near(200,200,200,exclude=1))==[2,3]
+    assert [b for d,b,p in index.near(400,200,0)]==[2]
+    for x,y in ((200,200),(0,0),(199.999,200),(400,0)):
+        for k in range(1,6):
+            check(index,robots,x,y,200,k)
+
+
+def test_more_wanted_than_robots():
+    robots={1:(100,100,0),2:(700,300,0),3:(1500,1200,0)}
+    index=GridIndex(robots,200)
+    assert [b for d,b,p in index.nearest(0,0,10)]==[1,2,3]
+    assert [b for d,b,p in index.nearest(0,0,10,exclude=2)]==[1,3]
+    assert index.nearest(0,0,0)==[]
+
+
+def test_obstacles():
+    obstacles=Obstacles([[(0,0),(100,0),(100,100),(0,100)],[(500,0),(600,0),(600,100),(500,100)]])
+    assert obstacles.near(50,50,10)==[(0.0,0)]
+    assert obstacles.near(150,50,60)==[(50.0,0)]
+    assert obstacles.near(300,50,200)==[(200.0,0),(200.0,1)]
+    assert obstacles.near(300,50,199)==[]
+
+
+def test_far_outside_the_arena():
+    random.seed(4)
+    robots={i:(random.uniform(0,2000),random.uniform(0,1400),0) for i in range(1,17)}
+    index=GridIndex(robots,200)
+    began=time.perf_counter()
+    for x,y in ((1e6,700),(-1e9,-1e9),(1000,5e7),(1e15,-1e15)):
+        for k in (1,3,20):
+            check(index,robots,x,y,1e5,k)
+    assert time.perf_counter()-began<0.5
+    for v in (float("inf"),float("-inf"),float("nan")):
+        assert index.nearest(v,0,3)==[]
+        assert index.near(0,v,300)==[]
+    assert index.near(0,0,float("inf"))==[]
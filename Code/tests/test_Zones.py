@@ -0,0 +1,75 @@
+import json
+from ArenaGrid import MAX_CELLS
+from PathPlanner import OccupancyGrid
+from RobotSnapshot import RobotStore
+from Zones import Zones
+
+SQUARE=[(80,80),(200,80),(200,200),(80,200)]      # cells 2 to 4 in 40mm cells
+
+
+class MQTT:
+    '''
+    Stands in for MqttManager.MQTT
+    '''
+
+    def __init__(self):
+        self.messages=[]
+
+    def publishPayload(self,topic,payload,retain=False,coalesce=True):
+        self.messages.append((topic,json.loads(payload),coalesce))
+
+
+def test_pitch_sized_zones_are_capped():
+    pitch=[(0,0),(100000,0),(100000,70000),(0,70000)]
+    zones=Zones(None,"events",{"pitch":pitch,"try1":[(0,0),(5000,0),(5000,70000),(0,70000)]})
+    assert zones.raster.size<=MAX_CELLS
+    assert zones.zonesAt(2500,35000)==["pitch","try1"]
+    assert zones.zonesAt(50000,35000)==["pitch"]
+    assert zones.zonesAt(-500,35000)==[]
+    assert zones.zonesAt(100500,35000)==[]
+
+
+def test_zone_cells():
+    zones=Zones(None,"events",{"square":SQUARE},cell=40)
+    assert zones.zonesAt(81,81)==["square"]
+    assert zones.zonesAt(199,199)==["square"]
+    assert zones.zonesAt(79,140)==[]
+    assert zones.zonesAt(140,201)==[]
+
+
+def test_zones_and_planner_share_cells():
+    zones=Zones(None,"events",{"square":SQUARE},cell=40)
+    grid=OccupancyGrid((800,800),[SQUARE],cell=40,radius=1)
+    inside={(c,r) for c in range(20) for r in range(20) if zones.bitsAt(*grid.centre((c,r)))}
+    assert inside=={(c,r) for c in range(2,5) for r in range(2,5)}
+    # the planner grows obstacles and the walls by at least one cell, a 3x3 ellipse is a cross
+    grown={(c+dc,r+dr) for c,r in inside for dc,dr in ((0,0),(1,0),(-1,0),(0,1),(0,-1))}
+    walls={cell for cell in grid.static if 0 in cell or 19 in cell}
+    assert grid.static-walls==grown-walls
+
+
+def test_enter_and_exit_events():
+    mqtt=MQTT()
+    zones=Zones(mqtt,"pixelbot/events",{"square":SQUARE,"left":[(0,0),(120,0),(120,400),(0,400)]},cell=40)
+    store=RobotStore()
+
+    def frame(seq,robots):
+        mqtt.messages.clear()
+        zones.update(store.publish(seq,1000.0+seq,robots))
+        assert all(topic=="pixelbot/events" and not coalesce for topic,payload,coalesce in mqtt.messages)
+        return sorted((p["event"],p["zone"],p["botId"]) for topic,p,coalesce in mqtt.messages)
+
+    assert frame(1,{1:(300,300,0),2:(300,300,0)})==[]
+    # robot 1 into where the zones overlap, one message for each zone
+    assert frame(2,{1:(100,100,0),2:(300,300,0)})==[("enter","left",1),("enter","square",1)]
+    payload=mqtt.messages[0][1]
+    assert (payload["x"],payload["y"],payload["seq"],payload["time"])==(100,100,2,1002.0)
+    # nothing changes, nothing is published
+    assert frame(3,{1:(101,101,0),2:(300,300,0)})==[]
+    # robot 1 isn't seen, it keeps its zones
+    assert frame(4,{2:(160,160,0)})==[("enter","square",2)]
+    assert zones.inside[1]==3
+    # seen again, out of the left zone only
+    assert frame(5,{1:(160,100,0),2:(160,160,0)})==[("exit","left",1)]
+    # both leave
+    assert frame(6,{1:(300,300,0),2:(20,300,0)})==[("enter","left",2),("exit","square",1),("exit","square",2)]